@@ -0,0 +1,2 @@
+ALTER TABLE "listing_image" ADD COLUMN "sha256" varchar(64);--> statement-breakpoint
+CREATE INDEX "listing_images_sha256_idx" ON "listing_image" USING btree ("sha256");
\ No newline at end of file
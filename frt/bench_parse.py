@@ -0,0 +1,176 @@
+"""
+Compare record parsing against the per-label regex scans it replaced.
+
+    python bench_parse.py                    # 100k synthetic FRNs
+    python bench_parse.py --frns 250000
+    python bench_parse.py --store .          # the FRNs in an extracted page store
+
+Every FRN is parsed both ways and the results must match; the synthetic FRNs
+include the layouts that are easy to get wrong (wrapped "Serial Numbering",
+a value on the line after its label, lowercase labels, blank lines).
+"""
+import argparse
+import random
+import re
+import time
+
+from record import KNOWN_LABELS, parse_record
+
+LABELS = ["Manufacturer", "Make", "Model", "Action", "Legal Classification", "Country of Manufacturer", "Type"]
+
+MANUFACTURERS = ["STURM, RUGER & CO., INC.", "GLOCK", "SMITH & WESSON", "BERETTA", "NORINCO", "MAUSER", "TIKKA"]
+ACTIONS = ["Semi-Automatic", "Bolt Action", "Lever Action", "Pump Action", "Air,Spring or Gas", "Single Shot"]
+CLASSES = ["Non-Restricted", "Restricted", "Prohibited"]
+COUNTRIES = ["UNITED STATES OF AMERICA", "AUSTRIA", "ITALY", "CHINA", "GERMANY", "FINLAND", "ATLANTIS"]
+CALIBRES = ["9MM LUGER", ".40 S&W", "22 LR", "12 GA", ".308 WIN", "7.62X39MM", "6.5  CREEDMOOR", ".177 N/A"]
+REMARKS = [
+    "The firearm is a variant of the standard model with a shortened barrel.",
+    "Models produced after 1998 have a cross-bolt safety.",
+    "All versions are chambered for the calibres listed below.",
+    "Components are interchangeable with the military version.",
+    "Legal classification depends on barrel length, see the table.",
+    "Manufactured under licence; markings vary by importer.",
+    "  Continued from the previous page.",
+]
+
+
+def reference_value(text: str, label: str) -> str | None:
+    pattern = rf"^{re.escape(label)}\s*:\s*(.*)$"
+    match = re.search(pattern, text, flags=re.IGNORECASE | re.MULTILINE)
+    if match is None:
+        return None
+    remainder = match.group(1).strip()
+    if remainder == "":
+        return ""
+    remainder_upper = remainder.upper()
+    for other_label in KNOWN_LABELS:
+        if other_label.lower() == label.lower():
+            continue
+        first_word = other_label.split()[0].upper()
+        if remainder_upper.startswith(first_word):
+            return ""
+    return remainder
+
+
+def reference_calibres(table_text: str, frn: str) -> list[str]:
+    pattern = rf"^\s*{re.escape(frn)}\s*-\s*\d+\s+(?P<calibre>.+?)\s+\d{{1,4}}(?:\s+\d{{1,4}})?\b"
+    calibres: list[str] = []
+    for m in re.finditer(pattern, table_text, flags=re.MULTILINE):
+        calibre = re.sub(r"\s{2,}", " ", m.group("calibre").strip())
+        if calibre not in calibres:
+            calibres.append(calibre)
+    return calibres
+
+
+def reference_parse(text: str, frn: str) -> tuple:
+    """How main.py parsed an FRN before parse_record: one scan of the text per label, one more for calibres."""
+    return (*(reference_value(text, label) for label in LABELS), reference_calibres(text, frn))
+
+
+def record_parse(text: str, frn: str) -> tuple:
+    record = parse_record(text, frn)
+    return (
+        record.manufacturer,
+        record.make,
+        record.model,
+        record.action,
+        record.legal_class,
+        record.country,
+        record.type,
+        record.calibres,
+    )
+
+
+def synthetic_frn(rng: random.Random, frn: str) -> str:
+    def label(name: str) -> str:
+        return name.lower() if rng.random() < 0.02 else name
+
+    lines = [f"Firearm Reference Number (FRN): {frn}", f"{label('Type')}: {rng.choice(['Firearm', 'Barrelled Action'])}"]
+    lines.append(f"{label('Manufacturer')}: {rng.choice(MANUFACTURERS)}")
+    if rng.random() < 0.3:
+        lines.append(f"{label('Make')}: {rng.choice(MANUFACTURERS) if rng.random() < 0.5 else ''}")
+    if rng.random() < 0.05:
+        # Value on the line after its label
+        lines += [f"{label('Model')}:", "", f"M-{frn}"]
+    else:
+        lines.append(f"{label('Model')}: {rng.choice(['M', 'MODEL ', 'MK ', ''])}{frn}")
+    lines.append(f"{label('Action')}: {rng.choice(ACTIONS)}")
+    if rng.random() < 0.05:
+        lines += [f"{label('Legal Classification')}:", "Serial", "Numbering: No"]
+    else:
+        lines.append(f"{label('Legal Classification')}: {rng.choice(CLASSES)}")
+    lines.append(f"{label('Country of Manufacturer')}: {rng.choice(COUNTRIES)}")
+    lines += ["Serial", "Numbering: Yes"] if rng.random() < 0.5 else ["Serial Numbering: Yes"]
+    lines.append("Remarks:")
+    lines += rng.choices(REMARKS, k=rng.randint(3, 20))
+    lines.append("Calibre Shots Barrel Length Legal Classification Legal Authority")
+    for seq in range(1, rng.randint(1, 6) + 1):
+        calibre = rng.choice(CALIBRES)
+        if rng.random() < 0.05:
+            lines.append("")
+        lines.append(f"{frn} - {seq} {calibre} {rng.randint(1, 30)} {rng.randint(100, 700)} {rng.choice(CLASSES)}")
+    if rng.random() < 0.1:
+        # A second page for the same FRN
+        lines += [f"Firearm Reference Number (FRN): {frn}", *rng.choices(REMARKS, k=10)]
+    return "\n".join(lines)
+
+
+def synthetic_batches(count: int, batch: int, seed: int):
+    rng = random.Random(seed)
+    for start in range(0, count, batch):
+        yield [(str(100_000 + i), None) for i in range(start, min(start + batch, count))], rng
+
+
+def store_batches(directory: str, batch: int):
+    from main import frn_groups
+    from page_store import PageStore
+
+    with PageStore(directory) as store:
+        group = []
+        for frn, _, text in frn_groups(store):
+            group.append((frn, text))
+            if len(group) == batch:
+                yield group, None
+                group = []
+        if group:
+            yield group, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frns", type=int, default=100_000, help="synthetic FRNs to parse")
+    parser.add_argument("--store", help="parse the FRNs in this page store directory instead")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    batches = store_batches(args.store, 10_000) if args.store else synthetic_batches(args.frns, 10_000, args.seed)
+    timings = {"per-label regex": 0.0, "parse_record": 0.0}
+    frns = 0
+    mismatches = 0
+    for group, rng in batches:
+        if rng is not None:
+            group = [(frn, synthetic_frn(rng, frn)) for frn, _ in group]
+        results = {}
+        for name, parse in (("per-label regex", reference_parse), ("parse_record", record_parse)):
+            start = time.perf_counter()
+            results[name] = [parse(text, frn) for frn, text in group]
+            timings[name] += time.perf_counter() - start
+        for (frn, _), expected, got in zip(group, results["per-label regex"], results["parse_record"]):
+            if expected != got:
+                mismatches += 1
+                if mismatches <= 5:
+                    print(f"\033[91mFRN {frn}: expected {expected}, got {got}\033[0m")
+        frns += len(group)
+
+    print(f"{frns} FRNs\n")
+    print(f"{'parser':<16} {'total s':>9} {'us/FRN':>9} {'FRNs/s':>10}")
+    for name, seconds in timings.items():
+        print(f"{name:<16} {seconds:>9.3f} {seconds / frns * 1e6:>9.1f} {frns / seconds:>10.0f}")
+    print(f"\nspeedup: {timings['per-label regex'] / timings['parse_record']:.1f}x")
+    if mismatches:
+        raise SystemExit(f"\033[91m{mismatches} FRNs parsed differently\033[0m")
+    print("\033[92msame output for every FRN\033[0m")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Changes between FRT editions, so a new edition only re-uploads what changed.
+
+`frn-hashes.tsv` holds a hash per FRN of the document gunex last accepted
+for it. Each run of main.py compares its guns, with their images.json photos,
+against it and writes:
+
+- guns-delta.jsonl: one {"change": "added" | "changed", "gun": {...}} line
+  per new or different FRN, then one {"change": "removed", "frn": ...} line
+  per FRN that is no longer in the FRT
+- frn-hashes.pending.tsv: the hashes of this run
+
+The hash covers everything pushed, page numbers and images included, so
+whatever differs from what gunex has is in the delta. After a push, insert.py
+moves the pending hash of every FRN gunex reported as imported (and drops
+every FRN it removed) into frn-hashes.tsv. Anything that failed keeps its old
+hash and is in the next delta again. Without frn-hashes.tsv every FRN is
+"added".
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Iterable
+
+HASHES_PATH = Path("frn-hashes.tsv")
+PENDING_HASHES_PATH = Path("frn-hashes.pending.tsv")
+DELTA_PATH = Path("guns-delta.jsonl")
+
+
+def with_images(gun: dict, images: dict[str, list[str]]) -> dict:
+    """The document insert.py sends for `gun`."""
+    if gun["frn"] in images:
+        return {**gun, "images": images[gun["frn"]]}
+    return gun
+
+
+def gun_hash(gun: dict) -> str:
+    # Calibres come out of a set, so their order says nothing
+    content = dict(gun)
+    content["calibres"] = sorted(content.get("calibres", []))
+    encoded = json.dumps(content, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+
+def load_hashes(path: Path = HASHES_PATH) -> dict[str, str]:
+    if not path.exists():
+        return {}
+    hashes = {}
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            frn, _, digest = line.rstrip("\n").partition("\t")
+            if frn:
+                hashes[frn] = digest
+    return hashes
+
+
+class DeltaWriter:
+    """Streams guns in, writing the delta and the new hashes as it goes."""
+
+    def __init__(
+        self,
+        images: dict[str, list[str]],
+        previous: Path = HASHES_PATH,
+        delta: Path = DELTA_PATH,
+        pending: Path = PENDING_HASHES_PATH,
+    ):
+        self.images = images
+        self.previous = load_hashes(previous)
+        self.counts = {"added": 0, "changed": 0, "unchanged": 0, "removed": 0}
+        self.delta_path, self.pending_path = delta, pending
+        self._delta = delta.open("w", encoding="utf-8")
+        self._pending = pending.open("w", encoding="utf-8")
+
+    def add(self, gun: dict):
+        gun = with_images(gun, self.images)
+        digest = gun_hash(gun)
+        self._pending.write(f"{gun['frn']}\t{digest}\n")
+        before = self.previous.pop(gun["frn"], None)
+        if before == digest:
+            self.counts["unchanged"] += 1
+            return
+        change = "added" if before is None else "changed"
+        self.counts[change] += 1
+        self._delta.write(json.dumps({"change": change, "gun": gun}, ensure_ascii=False) + "\n")
+
+    def close(self):
+        # Whatever wasn't seen this run has left the FRT
+        for frn in self.previous:
+            self._delta.write(json.dumps({"change": "removed", "frn": frn}) + "\n")
+        self.counts["removed"] = len(self.previous)
+        self.previous = {}
+        self._delta.close()
+        self._pending.close()
+
+    def __enter__(self) -> "DeltaWriter":
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+            return
+        # A run that failed part way would report every FRN it didn't reach as removed
+        self._delta.close()
+        self._pending.close()
+        self.delta_path.unlink(missing_ok=True)
+        self.pending_path.unlink(missing_ok=True)
+
+
+def read_delta(path: Path = DELTA_PATH) -> tuple[list[dict], list[str]]:
+    """(guns to add or update, FRNs to remove) from a delta file."""
+    upserts, removed = [], []
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            if entry["change"] == "removed":
+                removed.append(entry["frn"])
+            else:
+                upserts.append(entry["gun"])
+    return upserts, removed
+
+
+def save_hashes(hashes: dict[str, str], path: Path = HASHES_PATH):
+    tmp = path.with_name(path.name + ".part")
+    with tmp.open("w", encoding="utf-8") as f:
+        for frn, digest in hashes.items():
+            f.write(f"{frn}\t{digest}\n")
+    os.replace(tmp, path)
+
+
+def promote_hashes(
+    imported: Iterable[str],
+    removed: Iterable[str],
+    pending: Path = PENDING_HASHES_PATH,
+    path: Path = HASHES_PATH,
+) -> int:
+    """
+    Record what gunex now has: the pending hash of each FRN it imported, and
+    no hash for those it removed. Returns how many hashes changed.
+    """
+    if not pending.exists():
+        return 0
+    hashes = load_hashes(path)
+    pending_hashes = load_hashes(pending)
+    changed = 0
+    for frn in imported:
+        if frn in pending_hashes and hashes.get(frn) != pending_hashes[frn]:
+            hashes[frn] = pending_hashes[frn]
+            changed += 1
+    for frn in removed:
+        if hashes.pop(frn, None) is not None:
+            changed += 1
+    save_hashes(hashes, path)
+    return changed
@@ -1,6 +1,15 @@
+import argparse
 import json
+import os
 import requests
 
+from delta import DELTA_PATH, promote_hashes, read_delta, with_images
+
+FRT_URL = "http://localhost:3000/api/v1/frt"
+GUNEX_API_KEY = os.environ.get("GUNEX_API_KEY", "secret")
+HEADERS = {"x-api-key": GUNEX_API_KEY}
+
+
 def read_guns_jsonl(filepath):
     """
     Reads a guns.jsonl file and returns a list of dicts, one per line/object.
@@ -14,18 +23,53 @@ def read_guns_jsonl(filepath):
     return guns
 
 
-guns = read_guns_jsonl("guns.jsonl")
+def print_response(response):
+    print("Status code:", response.status_code)
+    try:
+        print("Response:", response.json())
+    except Exception:
+        print("Response text:", response.text)
+
+
+parser = argparse.ArgumentParser(description="Upload parsed FRT guns to gunex")
+parser.add_argument(
+    "--delta",
+    action="store_true",
+    help=f"push only the FRNs added, changed or removed since the last push ({DELTA_PATH})",
+)
+args = parser.parse_args()
 
-with open("images.json", "r", encoding="utf-8") as f:
-    images = json.load(f)
+if args.delta:
+    if not DELTA_PATH.exists():
+        raise SystemExit(f"\033[91mNo {DELTA_PATH}, run main.py first to write it\033[0m")
+    # The delta already carries each FRN's images
+    guns, removed = read_delta(DELTA_PATH)
+else:
+    guns, removed = read_guns_jsonl("guns.jsonl"), []
+    with open("images.json", "r", encoding="utf-8") as f:
+        images = json.load(f)
+    guns = [with_images(gun, images) for gun in guns]
 
-for gun in guns:
-    if gun["frn"] in images:
-        gun["images"] = images[gun["frn"]]
+# Only FRNs gunex confirms are recorded as pushed; the rest stay in the next delta
+imported, deleted = [], []
+if guns:
+    response = requests.post(FRT_URL, json=guns, headers=HEADERS)
+    print("Status code:", response.status_code)
+    if response.status_code == 200:
+        for result in response.json()["results"]:
+            if result["success"]:
+                imported.append(result["frn"])
+            else:
+                print(f"\033[91mFRN {result['frn']} not imported: {result.get('error')}\033[0m")
+    else:
+        print_response(response)
+if removed:
+    response = requests.delete(FRT_URL, json={"frns": removed}, headers=HEADERS)
+    print_response(response)
+    if response.status_code == 200:
+        deleted = removed
+print(f"{len(imported)}/{len(guns)} guns upserted, {len(deleted)}/{len(removed)} removed")
 
-response = requests.post("http://localhost:3000/api/v1/frt", json=guns)
-print("Status code:", response.status_code)
-try:
-    print("Response:", response.json())
-except Exception:
-    print("Response text:", response.text)
+# The next delta is taken against what gunex now has
+if promote_hashes(imported, deleted):
+    print("Updated frn-hashes.tsv")
@@ -1,8 +1,16 @@
 from pathlib import Path
+import argparse
 import json
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from tqdm import tqdm
+from page_store import PageStore, compress_page, import_chunks
+from record import parse_record
+from delta import DeltaWriter
 import re
-from collections import defaultdict
+import textwrap
+from typing import Iterator
 from peewee import *
 
 db = SqliteDatabase("guns.db")
@@ -164,248 +172,222 @@ def normalize_calibres(calibres: list[str], action: str) -> list[str]:
     return list(normalized)
 
 
-KNOWN_LABELS = [
-    "Manufacturer",
-    "Model",
-    "Action",
-    "Legal Classification",
-    "Country of Manufacturer",
-    "Serial Numbering",
-]
+def warn_if_missing(label: str, value) -> None:
+    is_missing = value is None or (isinstance(value, str) and value.strip() == "")
+    if is_missing:
+        print(f"\033[93mWARNING: Missing {label}\033[0m")
 
 
-if __name__ == "__main__":
+FRN_PATTERN = re.compile(r"Firearm Reference Number \(FRN\):\s*(\d+)")
 
-    MAX_PAGES = 107_191
 
-    pdf_path = Path("./frt-0811.pdf").expanduser().resolve()
+def frn_pages(store: PageStore) -> dict[str, list[int]]:
+    """
+    The page numbers of each FRN, in the order FRNs first appear. Pages with
+    no FRN belong to no firearm and are left out.
+    """
+    pages: dict[str, list[int]] = {}
+    orphans = 0
+    for idx, text in store.iter_pages():
+        match = FRN_PATTERN.search(text)
+        if match is None:
+            orphans += 1
+            continue
+        frn_number = match.group(1)
+        if frn_number == "128418":
+            print(text)
+        pages.setdefault(frn_number, []).append(idx)
+    if orphans:
+        print(f"\033[93mWARNING: {orphans} pages without an FRN\033[0m")
+    return pages
+
+
+def frn_groups(store: PageStore) -> Iterator[tuple[str, list[int], str]]:
+    """
+    (FRN, page numbers, combined text) for each firearm, in the order FRNs
+    first appear. Only page numbers are held for the whole table: each FRN's
+    text is read back from the store when its turn comes, so one firearm's
+    pages are in memory at a time, and an FRN whose pages aren't contiguous
+    still comes out once, with all of them.
+    """
+    for frn, pages in frn_pages(store).items():
+        yield frn, pages, "\n".join(store[idx] for idx in pages)
+
+
+def parse_gun(frn: str, pages: list[int], combined_text: str) -> dict:
+    record = parse_record(combined_text, frn)
+    country = record.country
+    normalized_country = country.upper() if country else ""
+    country_code = countries.get(normalized_country, "Unknown")
+
+    manufacturer = record.make or record.manufacturer
+
+    if country_code == "Unknown" and country != "":
+        print(f"\033[93mWARNING: Unknown country code for '{country}'\033[0m")
+
+    warn_if_missing("Type", record.type)
+    warn_if_missing("Manufacturer", manufacturer)
+    warn_if_missing("Model", record.model)
+    warn_if_missing("Action", record.action)
+    warn_if_missing("Legal Classification", record.legal_class)
+    warn_if_missing("Country of Manufacturer", country)
+
+    action = normalize_action(record.action)
+    return {
+        "frn": frn,
+        "type": record.type,
+        "manufacturer": manufacturer,
+        "model": record.model,
+        "action": action,
+        "legal_class": record.legal_class,
+        "country_code": country_code,
+        "calibres": normalize_calibres(record.calibres, action),
+        "pages": pages,
+    }
+
+
+# Pages per task handed to an extraction worker; each finished task is appended to the store
+BATCH_PAGES = 500
+# Page count of the old guns-N.json chunk files, for importing them
+CHUNK_SIZE = 10_000
+
+
+# Pages extracted so far by all workers, shared with the parent for its progress bar
+_pages_done = None
+# Each worker's own handle on the PDF, opened once for all of its tasks
+_pdf = None
+
+
+def _init_extract_worker(counter, pdf_path: str) -> None:
+    import pdfplumber
+
+    global _pages_done, _pdf
+    _pages_done = counter
+    _pdf = pdfplumber.open(pdf_path)
+
+
+def extract_pages(pages: list[int]) -> list[tuple[int, bytes]]:
+    """Extract `pages` from this worker's PDF, as (page number, compressed text) pairs for the store."""
+    extracted = []
+    for idx in pages:
+        page = _pdf.pages[idx]
+        text = page.extract_text()
+        # Drop the page's parsed objects, or a worker's memory grows with every task
+        page.close()
+        extracted.append((idx, compress_page(text)))
+        if _pages_done is not None:
+            with _pages_done.get_lock():
+                _pages_done.value += 1
+    return extracted
+
+
+def extract_into(store: PageStore, pdf_path: Path, missing: list[int], workers: int) -> int:
+    """
+    Extract the `missing` pages across `workers` processes, appending each
+    batch to `store` as it finishes. Returns the pages extracted.
+    """
+    counter = multiprocessing.Value("i", 0)
+    batches = [missing[start:start + BATCH_PAGES] for start in range(0, len(missing), BATCH_PAGES)]
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_extract_worker, initargs=(counter, str(pdf_path))
+    ) as pool, tqdm(total=len(missing), desc="Extracting", unit="page") as bar:
+        pending = {pool.submit(extract_pages, batch) for batch in batches}
+        while pending:
+            done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+            bar.update(counter.value - bar.n)
+            for future in done:
+                store.append(future.result())
+        bar.update(counter.value - bar.n)
+    return counter.value
 
-    CHUNK_SIZE = 10_000
-    
-    def load_existing_chunks() -> list[str]:
-        """Load all existing chunk files and return combined page texts."""
-        all_pages = []
-        chunk_num = 1
-        while True:
-            chunk_file = Path(f"guns-{chunk_num}.json")
-            if not chunk_file.exists():
-                break
-            try:
-                with chunk_file.open("r", encoding="utf-8") as f:
-                    chunk_data = json.load(f)
-                if isinstance(chunk_data, list):
-                    all_pages.extend(chunk_data)
-                    print(f"Loaded {len(chunk_data)} pages from {chunk_file}")
-                chunk_num += 1
-            except Exception:
-                print(f"Failed to load {chunk_file}")
-                break
-        return all_pages
-
-    def save_chunk(pages: list[str], chunk_num: int) -> None:
-        """Save a chunk of pages to a numbered file."""
-        chunk_file = Path(f"guns-{chunk_num}.json")
-        with chunk_file.open("w", encoding="utf-8") as f:
-            json.dump(pages, f, ensure_ascii=False)
-        print(f"Saved {len(pages)} pages to {chunk_file}")
-
-    def check_all_chunks_exist(max_pages: int) -> bool:
-        """Check if all required chunk files exist for the target page count."""
-        required_chunks = (max_pages + CHUNK_SIZE - 1) // CHUNK_SIZE  # Ceiling division
-        for chunk_num in range(1, required_chunks + 1):
-            chunk_file = Path(f"guns-{chunk_num}.json")
-            if not chunk_file.exists():
-                return False
-        return True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract and parse the Firearms Reference Table PDF")
+    parser.add_argument("--pdf", default="./frt-0811.pdf")
+    parser.add_argument("--max-pages", type=int, default=107_191)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="processes extracting pages at once",
+    )
+    parser.add_argument("--store", default=".", help="directory of the page store (pages.bin, pages.idx)")
+    args = parser.parse_args()
+
+    MAX_PAGES = args.max_pages
+
+    pdf_path = Path(args.pdf).expanduser().resolve()
+
+    store = PageStore(args.store)
+    if len(store) == 0 and Path("guns-1.json").exists():
+        print("Importing guns-N.json chunks into the page store…")
+        import_chunks(store, CHUNK_SIZE)
 
     # Check if we can skip extraction entirely
-    if check_all_chunks_exist(MAX_PAGES):
-        print(f"All chunk files exist for {MAX_PAGES} pages. Skipping extraction.")
-        page_texts = load_existing_chunks()
+    if not store.missing(MAX_PAGES):
+        print(f"All {MAX_PAGES} pages are in the page store. Skipping extraction.")
     else:
-        existing_pages = load_existing_chunks()
-        total_existing = len(existing_pages)
-        
-        if total_existing < MAX_PAGES:
-            if existing_pages:
-                print(f"Have {total_existing} pages cached, need {MAX_PAGES}. Extracting more…")
+        import pdfplumber
+        with pdfplumber.open(pdf_path) as pdf:
+            total_pages = len(pdf.pages)
+        target_count = min(MAX_PAGES, total_pages)
+
+        missing = store.missing(target_count)
+        if missing:
+            if len(store):
+                print(f"Have {target_count - len(missing)} pages stored, need {target_count}. Extracting more…")
             else:
-                print(f"No cached pages found. Extracting from PDF…")
-            
-            import pdfplumber
-            with pdfplumber.open(pdf_path) as pdf:
-                total_pages = len(pdf.pages)
-                target_count = min(MAX_PAGES, total_pages)
-                
-                # Process in chunks, skipping existing ones
-                start_idx = total_existing
-                pages_processed = total_existing
-                
-                # Calculate which chunks we need to process
-                start_chunk = (start_idx // CHUNK_SIZE) + 1
-                end_chunk = (target_count + CHUNK_SIZE - 1) // CHUNK_SIZE
-                
-                for chunk_num in range(start_chunk, end_chunk + 1):
-                    chunk_file = Path(f"guns-{chunk_num}.json")
-                    
-                    if chunk_file.exists():
-                        print(f"Skipping chunk {chunk_num} - {chunk_file} already exists")
-                        pages_processed += CHUNK_SIZE
-                        continue
-                    
-                    # Extract this chunk
-                    chunk_start = (chunk_num - 1) * CHUNK_SIZE
-                    chunk_end = min(chunk_start + CHUNK_SIZE, target_count)
-                    current_chunk = []
-                    
-                    print(f"Extracting chunk {chunk_num} (pages {chunk_start + 1}-{chunk_end})")
-                    for idx in tqdm(range(chunk_start, chunk_end), desc=f"Chunk {chunk_num}", unit="page"):
-                        text = pdf.pages[idx].extract_text()
-                        current_chunk.append(text if text is not None else "")
-                        pages_processed += 1
-                    
-                    save_chunk(current_chunk, chunk_num)
-                    
-            print(f"Extraction complete: {pages_processed} total pages")
-            # Reload all chunks for processing
-            page_texts = load_existing_chunks()
-        else:
-            print(f"Using existing {total_existing} pages from cache")
-            page_texts = existing_pages
-
+                print(f"No stored pages found. Extracting from PDF…")
 
-    frn_groups = defaultdict(list)
+            workers = max(1, min(args.workers, (len(missing) + BATCH_PAGES - 1) // BATCH_PAGES))
+            print(f"Extracting {len(missing)} pages with {workers} workers")
+            pages_processed = extract_into(store, pdf_path, missing, workers)
 
-    for idx, text in enumerate(page_texts):
-        match = re.search(r"Firearm Reference Number \(FRN\):\s*(\d+)", text)
-        if match:
-            frn_number = match.group(1)
-            frn_groups[frn_number].append((idx, text))
-            if frn_number == "128418":
-                print(text)
+            print(f"Extraction complete: {pages_processed} pages extracted")
         else:
-            frn_groups[None].append((idx, text))
+            print(f"Using {target_count} stored pages")
 
-    def extract_value(text: str, label: str) -> str | None:
-        # Get only the remainder of the label's line
-        pattern = rf"^{re.escape(label)}\s*:\s*(.*)$"
-        match = re.search(pattern, text, flags=re.IGNORECASE | re.MULTILINE)
-        if match is None:
-            return None
-        remainder = match.group(1).strip()
-        if remainder == "":
-            return ""
-        # If the remainder appears to be the beginning of another known label
-        # (e.g., line-wrapped "Serial" for "Serial Numbering"), treat as empty
-        remainder_upper = remainder.upper()
-        for other_label in KNOWN_LABELS:
-            if other_label.lower() == label.lower():
-                continue
-            first_word = other_label.split()[0].upper()
-            if remainder_upper.startswith(first_word):
-                return ""
-        return remainder
-
-    def extract_calibres(table_text: str, frn: str | None) -> list[str]:
-        if frn is None:
-            return []
-        # Match lines like: "128418 - 2 9MM LUGER 32 143 Prohibited ..."
-        # Capture calibre between the sequence number and the first numeric field thereafter
-        pattern = rf"^\s*{re.escape(frn)}\s*-\s*\d+\s+(?P<calibre>.+?)\s+\d{{1,4}}(?:\s+\d{{1,4}})?\b"
-        matches = re.finditer(pattern, table_text, flags=re.MULTILINE)
-        calibres: list[str] = []
-        for m in matches:
-            calibre = m.group("calibre").strip()
-            # Clean typical trailing punctuation/artifacts
-            calibre = re.sub(r"\s{2,}", " ", calibre)
-            calibres.append(calibre)
-        # De-duplicate preserving order
-        seen = set()
-        unique_calibres: list[str] = []
-        for c in calibres:
-            if c not in seen:
-                seen.add(c)
-                unique_calibres.append(c)
-        return unique_calibres
-
-    def warn_if_missing(label: str, value) -> None:
-        is_missing = value is None or (isinstance(value, str) and value.strip() == "")
-        if is_missing:
-            print(f"\033[93mWARNING: Missing {label}\033[0m")
 
     print("-" * 100)
 
-    guns = []
-
-    for frn, pages in frn_groups.items():
-        combined_text = "\n".join(page_text for _, page_text in pages)
-        manufacturer = extract_value(combined_text, "Manufacturer")
-        make = extract_value(combined_text, "Make")
-        model = extract_value(combined_text, "Model")
-        action = extract_value(combined_text, "Action")
-        legal_class = extract_value(combined_text, "Legal Classification")
-        country = extract_value(combined_text, "Country of Manufacturer")
-        normalized_country = country.upper() if country else ""
-        country_code = countries.get(normalized_country, "Unknown")
-        frn_type = extract_value(combined_text, "Type")
-
-        manufacturer = make or manufacturer
-
-        if country_code == "Unknown" and country != "":
-            print(f"\033[93mWARNING: Unknown country code for '{country}'\033[0m")
-
-        header = f"FRN: {frn}" if frn is not None else "FRN not found"
-
-        warn_if_missing("FRN", frn)
-        warn_if_missing("Type", frn_type)
-        warn_if_missing("Manufacturer", manufacturer)
-        warn_if_missing("Model", model)
-        warn_if_missing("Action", action)
-        warn_if_missing("Legal Classification", legal_class)
-        warn_if_missing("Country of Manufacturer", country)
-
-        calibres = extract_calibres(combined_text, frn)
-
-        action = normalize_action(action)
-        gun = {
-            "frn": frn,
-            "type": frn_type,
-            "manufacturer": manufacturer,
-            "model": model,
-            "action": action,
-            "legal_class": legal_class,
-            "country_code": country_code,
-            "calibres": normalize_calibres(calibres, action),
-            "pages": [page_idx for page_idx, _ in pages],
-        }
-
-        if frn == None:
-            print(f"\033[93mWARNING: FRN is None\033[0m")
-            continue
-
-        guns.append(gun)
-
-    with open("guns.json", "w", encoding="utf-8") as f:
-        json.dump(guns, f, ensure_ascii=False, indent=2)
+    # Photos found for FRNs, which insert.py sends along with them
+    images_path = Path("images.json")
+    images = json.loads(images_path.read_text(encoding="utf-8")) if images_path.exists() else {}
 
-    # Also write to guns.jsonl
-    with open("guns.jsonl", "w", encoding="utf-8") as f_jsonl:
-        for gun in guns:
+    # Each gun is written as soon as its FRN is parsed; only the facets are kept
+    manufacturers = set()
+    calibres_set = set()
+    written = 0
+    with (
+        open("guns.json", "w", encoding="utf-8") as f,
+        open("guns.jsonl", "w", encoding="utf-8") as f_jsonl,
+        DeltaWriter(images) as delta,
+    ):
+        # Same layout as json.dump(guns, f, indent=2), one gun at a time
+        f.write("[")
+        for frn, pages, combined_text in frn_groups(store):
+            gun = parse_gun(frn, pages, combined_text)
+            f.write(("," if written else "") + "\n")
+            f.write(textwrap.indent(json.dumps(gun, ensure_ascii=False, indent=2), "  "))
             f_jsonl.write(json.dumps(gun, ensure_ascii=False) + "\n")
+            delta.add(gun)
+            written += 1
+
+            if gun["manufacturer"]:
+                manufacturers.add(gun["manufacturer"])
+            calibres_set.update(gun["calibres"])
+        f.write("\n]" if written else "]")
 
-    # Get all unique manufacturers from the generated guns list
-    manufacturers = sorted(set(gun["manufacturer"] for gun in guns if gun.get("manufacturer")))
-    
     with open("manufacturers.json", "w", encoding="utf-8") as mf:
-        json.dump(manufacturers, mf, ensure_ascii=False, indent=2)
+        json.dump(sorted(manufacturers), mf, ensure_ascii=False, indent=2)
 
-    # Get all unique calibres from the generated guns list
-    calibres_set = set()
-    for gun in guns:
-        for calibre in gun.get("calibres", []):
-            calibres_set.add(calibre)
     calibres = sorted(calibres_set)
     with open("calibres.json", "w", encoding="utf-8") as cf:
         json.dump(calibres, cf, ensure_ascii=False, indent=2)
 
-    print(f"Printed {len(page_texts)} pages")
\ No newline at end of file
+    print(
+        f"Delta since the last push: {delta.counts['added']} added, {delta.counts['changed']} changed, "
+        f"{delta.counts['removed']} removed, {delta.counts['unchanged']} unchanged (python insert.py --delta)"
+    )
+    print(f"Printed {len(store)} pages")
+    store.close()
@@ -0,0 +1,151 @@
+"""
+Extracted PDF page texts, stored for random access.
+
+`pages.bin` holds every page's text zlib-compressed on its own, appended in
+whatever order pages finish. `pages.idx` is a flat array of (offset, length)
+records, one per page number, so finding a page is one multiplication. Both
+are memory-mapped for reading: a page costs one slice and one decompress, and
+iterating the store never holds more than the page being read.
+
+A page's bytes are written before its index record, and an all-zero record
+means "not extracted", so an interrupted extraction leaves a store that is
+valid up to the pages it recorded and resumes from the ones it didn't.
+"""
+import json
+import mmap
+import os
+import struct
+import zlib
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+RECORD = struct.Struct("<QI")  # offset, compressed length
+
+
+class PageStore:
+    def __init__(self, directory: str | Path = "."):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.blob_path = self.directory / "pages.bin"
+        self.index_path = self.directory / "pages.idx"
+        self._blob = open(self.blob_path, "ab+")
+        self._index = open(self.index_path, "ab+")
+        self._blob_map: Optional[mmap.mmap] = None
+        self._index_map: Optional[mmap.mmap] = None
+        self._mapped_blob = 0
+        self._mapped_index = 0
+
+    def __len__(self) -> int:
+        """Number of page slots, extracted or not: one past the highest page recorded."""
+        self._index.seek(0, os.SEEK_END)
+        return self._index.tell() // RECORD.size
+
+    def _map(self):
+        """(Re)map both files if they grew since they were last mapped."""
+        self._blob.flush()
+        self._index.flush()
+        blob_size = os.path.getsize(self.blob_path)
+        index_size = os.path.getsize(self.index_path)
+        if blob_size != self._mapped_blob:
+            if self._blob_map is not None:
+                self._blob_map.close()
+            self._blob_map = mmap.mmap(self._blob.fileno(), 0, access=mmap.ACCESS_READ) if blob_size else None
+            self._mapped_blob = blob_size
+        if index_size != self._mapped_index:
+            if self._index_map is not None:
+                self._index_map.close()
+            self._index_map = mmap.mmap(self._index.fileno(), 0, access=mmap.ACCESS_READ) if index_size else None
+            self._mapped_index = index_size
+
+    def _record(self, idx: int) -> tuple[int, int]:
+        if idx < 0 or (idx + 1) * RECORD.size > self._mapped_index:
+            self._map()
+            if idx < 0 or (idx + 1) * RECORD.size > self._mapped_index:
+                return 0, 0
+        return RECORD.unpack_from(self._index_map, idx * RECORD.size)
+
+    def has(self, idx: int) -> bool:
+        return self._record(idx)[1] > 0
+
+    def missing(self, count: int) -> list[int]:
+        """Pages below `count` that haven't been extracted."""
+        self._map()
+        return [idx for idx in range(count) if not self.has(idx)]
+
+    def __getitem__(self, idx: int) -> str:
+        offset, length = self._record(idx)
+        if length == 0:
+            raise KeyError(f"page {idx} hasn't been extracted")
+        if offset + length > self._mapped_blob:
+            self._map()
+        return zlib.decompress(self._blob_map[offset:offset + length]).decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        return (text for _, text in self.iter_pages())
+
+    def iter_pages(self, start: int = 0, stop: Optional[int] = None) -> Iterator[tuple[int, str]]:
+        """(page number, text) for the extracted pages in page order, read lazily."""
+        self._map()
+        stop = len(self) if stop is None else min(stop, len(self))
+        for idx in range(start, stop):
+            if self.has(idx):
+                yield idx, self[idx]
+
+    def append(self, pages: Iterable[tuple[int, bytes]]):
+        """Record (page number, compressed text) pairs, e.g. from `compress_page`."""
+        self._blob.seek(0, os.SEEK_END)
+        offset = self._blob.tell()
+        records = []
+        for idx, data in pages:
+            self._blob.write(data)
+            records.append((idx, offset, len(data)))
+            offset += len(data)
+        self._blob.flush()
+        os.fsync(self._blob.fileno())
+
+        # Index records go in place; append mode can't seek, so this handle is opened per batch
+        end = max((idx for idx, _, _ in records), default=-1)
+        with open(self.index_path, "r+b") as index:
+            index.seek(0, os.SEEK_END)
+            size = index.tell()
+            if (end + 1) * RECORD.size > size:
+                index.write(bytes((end + 1) * RECORD.size - size))
+            for idx, page_offset, length in records:
+                index.seek(idx * RECORD.size)
+                index.write(RECORD.pack(page_offset, length))
+
+    def close(self):
+        for mapped in (self._blob_map, self._index_map):
+            if mapped is not None:
+                mapped.close()
+        self._blob_map = self._index_map = None
+        self._blob.close()
+        self._index.close()
+
+    def __enter__(self) -> "PageStore":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def compress_page(text: Optional[str]) -> bytes:
+    return zlib.compress((text or "").encode("utf-8"), 6)
+
+
+def import_chunks(store: PageStore, chunk_size: int) -> int:
+    """Move pages from the old guns-N.json chunk files into `store`; returns how many."""
+    imported = 0
+    chunk_num = 1
+    while True:
+        chunk_file = Path(f"guns-{chunk_num}.json")
+        if not chunk_file.exists():
+            break
+        with chunk_file.open("r", encoding="utf-8") as f:
+            chunk_data = json.load(f)
+        start = (chunk_num - 1) * chunk_size
+        store.append((start + offset, compress_page(text)) for offset, text in enumerate(chunk_data))
+        imported += len(chunk_data)
+        print(f"Imported {len(chunk_data)} pages from {chunk_file}")
+        chunk_num += 1
+    return imported
@@ -0,0 +1,98 @@
+"""
+Field extraction for one firearm's FRT text.
+
+`parse_record` reads the text once, line by line. Only lines that can start a
+label ("Model:", ...) or a calibre row ("128418 - 2 9MM LUGER 32 143 ...")
+are matched, each with one precompiled pattern anchored at the start of the
+line, so the cost is one pass however many labels there are. It gives the
+same results as searching the text for each label in turn:
+
+- a label's value is the rest of the first line starting with it, in any
+  case; a label with nothing after its colon takes the next non-blank line
+- a value that starts with the first word of another label is a line-wrapped
+  label ("Serial" for "Serial Numbering") and reads as ""
+- a label that never appears is None
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Optional
+
+KNOWN_LABELS = [
+    "Manufacturer",
+    "Model",
+    "Action",
+    "Legal Classification",
+    "Country of Manufacturer",
+    "Serial Numbering",
+]
+
+# Labels read into a record, by the FrnRecord field they fill
+FIELDS = {
+    "Type": "type",
+    "Manufacturer": "manufacturer",
+    "Make": "make",
+    "Model": "model",
+    "Action": "action",
+    "Legal Classification": "legal_class",
+    "Country of Manufacturer": "country",
+}
+
+LABEL_PATTERN = re.compile(
+    r"(?P<label>" + "|".join(re.escape(label) for label in FIELDS) + r")\s*:\s*(?P<value>.*)",
+    flags=re.IGNORECASE,
+)
+# "128418 - 2 9MM LUGER 32 143 Prohibited ...": the calibre runs from after the
+# sequence number to the first numeric field thereafter
+CALIBRE_ROW_PATTERN = re.compile(r"\s*(?P<frn>\d+)\s*-\s*\d+\s+(?P<calibre>.+?)\s+\d{1,4}(?:\s+\d{1,4})?\b")
+SPACES = re.compile(r"\s{2,}")
+
+_FIELD_BY_LABEL = {label.lower(): name for label, name in FIELDS.items()}
+# First words of the other known labels, which mark a value as a wrapped label
+_WRAPPED = {
+    label.lower(): tuple(
+        other.split()[0].upper() for other in KNOWN_LABELS if other.lower() != label.lower()
+    )
+    for label in FIELDS
+}
+_LABEL_STARTS = frozenset(c for label in FIELDS for c in (label[0].lower(), label[0].upper()))
+
+
+@dataclass(slots=True)
+class FrnRecord:
+    frn: str
+    type: Optional[str] = None
+    manufacturer: Optional[str] = None
+    make: Optional[str] = None
+    model: Optional[str] = None
+    action: Optional[str] = None
+    legal_class: Optional[str] = None
+    country: Optional[str] = None
+    calibres: list[str] = field(default_factory=list)
+
+
+def parse_record(text: str, frn: str) -> FrnRecord:
+    record = FrnRecord(frn)
+    unread = len(FIELDS)
+    calibres: dict[str, None] = {}
+    # Where the last calibre row's match ended; a row can't start before it
+    row_end = 0
+    line_start = 0
+    for line in text.split("\n"):
+        if line[:1] in _LABEL_STARTS:
+            if unread:
+                match = LABEL_PATTERN.match(text, line_start)
+                if match:
+                    label = match.group("label").lower()
+                    name = _FIELD_BY_LABEL[label]
+                    if getattr(record, name) is None:
+                        value = match.group("value").strip()
+                        setattr(record, name, "" if value.upper().startswith(_WRAPPED[label]) else value)
+                        unread -= 1
+        elif line_start >= row_end and line.lstrip().startswith(frn):
+            match = CALIBRE_ROW_PATTERN.match(text, line_start)
+            if match and match.group("frn") == frn:
+                calibres[SPACES.sub(" ", match.group("calibre").strip())] = None
+                row_end = match.end()
+        line_start += len(line) + 1
+    record.calibres = list(calibres)
+    return record
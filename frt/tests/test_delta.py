@@ -0,0 +1,93 @@
+import pytest
+
+from delta import DeltaWriter, gun_hash, load_hashes, promote_hashes, read_delta
+
+
+def gun(frn: str, **fields) -> dict:
+    return {"frn": frn, "model": f"M{frn}", "calibres": ["9MM LUGER", ".40 S&W"], "pages": [int(frn)], **fields}
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return {
+        "previous": tmp_path / "frn-hashes.tsv",
+        "delta": tmp_path / "guns-delta.jsonl",
+        "pending": tmp_path / "frn-hashes.pending.tsv",
+    }
+
+
+def write(paths, guns: list[dict], images=None) -> DeltaWriter:
+    with DeltaWriter(images or {}, **paths) as delta:
+        for g in guns:
+            delta.add(g)
+    return delta
+
+
+def promote(paths, imported, removed=()) -> int:
+    return promote_hashes(imported, removed, pending=paths["pending"], path=paths["previous"])
+
+
+def test_without_a_baseline_every_frn_is_added(paths):
+    delta = write(paths, [gun("1"), gun("2")], images={"2": ["https://img/2.jpg"]})
+    assert delta.counts == {"added": 2, "changed": 0, "unchanged": 0, "removed": 0}
+    upserts, removed = read_delta(paths["delta"])
+    assert upserts == [gun("1"), gun("2", images=["https://img/2.jpg"])]
+    assert removed == []
+    assert list(load_hashes(paths["pending"])) == ["1", "2"]
+
+
+def test_changes_against_the_hashes_gunex_accepted(paths):
+    write(paths, [gun("1"), gun("2"), gun("3"), gun("4"), gun("5")])
+    assert promote(paths, ["1", "2", "3", "4", "5"]) == 5
+
+    delta = write(
+        paths,
+        [
+            gun("1", calibres=[".40 S&W", "9MM LUGER"]),  # same calibres in another order
+            gun("2", model="Other"),
+            gun("3", pages=[30]),
+            gun("4"),
+            gun("6"),
+        ],
+        images={"4": ["https://img/4.jpg"]},
+    )
+    assert delta.counts == {"added": 1, "changed": 3, "unchanged": 1, "removed": 1}
+    upserts, removed = read_delta(paths["delta"])
+    assert [g["frn"] for g in upserts] == ["2", "3", "4", "6"]
+    assert removed == ["5"]
+
+
+def test_only_what_gunex_confirmed_is_recorded(paths):
+    write(paths, [gun("1"), gun("2"), gun("3")])
+    promote(paths, ["1", "2", "3"])
+    write(paths, [gun("1", model="New"), gun("2", model="New"), gun("4")])
+
+    # "2" failed to import and the delete of "3" didn't go through
+    assert promote(paths, ["1", "4"], removed=[]) == 2
+    hashes = load_hashes(paths["previous"])
+    assert hashes["1"] == gun_hash(gun("1", model="New"))
+    assert hashes["2"] == gun_hash(gun("2"))
+    assert "3" in hashes
+
+    delta = write(paths, [gun("1", model="New"), gun("2", model="New"), gun("4")])
+    assert delta.counts == {"added": 0, "changed": 1, "unchanged": 2, "removed": 1}
+    assert promote(paths, ["2"], removed=["3"]) == 2
+    assert sorted(load_hashes(paths["previous"])) == ["1", "2", "4"]
+
+
+def test_promote_without_a_pending_file_changes_nothing(paths):
+    assert promote(paths, ["1"]) == 0
+    assert not paths["previous"].exists()
+
+
+def test_a_failed_run_leaves_no_delta(paths):
+    write(paths, [gun("1")])
+    promote(paths, ["1"])
+    with pytest.raises(RuntimeError):
+        with DeltaWriter({}, **paths) as delta:
+            delta.add(gun("1"))
+            raise RuntimeError("parse failed")
+    # Otherwise every FRN not reached would read as removed
+    assert not paths["delta"].exists()
+    assert not paths["pending"].exists()
+    assert list(load_hashes(paths["previous"])) == ["1"]
@@ -0,0 +1,32 @@
+from main import frn_groups, frn_pages
+from page_store import PageStore, compress_page
+
+
+def page(frn: str, text: str) -> str:
+    return f"Firearm Reference Number (FRN): {frn}\n{text}"
+
+
+def store_of(tmp_path, texts: list[str]) -> PageStore:
+    store = PageStore(tmp_path)
+    store.append((idx, compress_page(text)) for idx, text in enumerate(texts))
+    return store
+
+
+def test_each_frn_is_one_group_in_order_of_first_appearance(tmp_path):
+    with store_of(tmp_path, [page("2", "a"), page("2", "b"), page("1", "c"), "Cover page", page("3", "d")]) as store:
+        groups = list(frn_groups(store))
+    assert [(frn, pages) for frn, pages, _ in groups] == [("2", [0, 1]), ("1", [2]), ("3", [4])]
+    assert groups[0][2] == page("2", "a") + "\n" + page("2", "b")
+
+
+def test_an_frn_whose_pages_are_not_contiguous_comes_out_once(tmp_path):
+    with store_of(tmp_path, [page("1", "a"), page("2", "b"), page("1", "c")]) as store:
+        groups = list(frn_groups(store))
+    assert [(frn, pages) for frn, pages, _ in groups] == [("1", [0, 2]), ("2", [1])]
+    assert groups[0][2] == page("1", "a") + "\n" + page("1", "c")
+
+
+def test_pages_without_an_frn_are_counted_and_left_out(tmp_path, capsys):
+    with store_of(tmp_path, ["Cover", page("1", "a"), "Index"]) as store:
+        assert frn_pages(store) == {"1": [1]}
+    assert "2 pages without an FRN" in capsys.readouterr().out
@@ -0,0 +1,57 @@
+import json
+
+import pytest
+
+from page_store import PageStore, compress_page, import_chunks
+
+
+def test_pages_written_out_of_order_read_back_in_page_order(tmp_path):
+    with PageStore(tmp_path) as store:
+        store.append([(3, compress_page("three")), (0, compress_page("zéro"))])
+        store.append([(1, compress_page(None))])
+        assert len(store) == 4
+        assert store[0] == "zéro"
+        assert store[1] == ""
+        assert store[3] == "three"
+        assert store.missing(6) == [2, 4, 5]
+        assert list(store.iter_pages()) == [(0, "zéro"), (1, ""), (3, "three")]
+        with pytest.raises(KeyError):
+            store[2]
+
+
+def test_reads_see_pages_appended_since_the_last_read(tmp_path):
+    with PageStore(tmp_path) as store:
+        store.append([(0, compress_page("a"))])
+        assert list(store) == ["a"]
+        store.append([(1, compress_page("b" * 10_000))])
+        assert store[1] == "b" * 10_000
+        assert list(store) == ["a", "b" * 10_000]
+
+
+def test_a_reopened_store_resumes_from_the_missing_pages(tmp_path):
+    with PageStore(tmp_path) as store:
+        store.append((idx, compress_page(f"page {idx}")) for idx in (0, 1, 4))
+    with PageStore(tmp_path) as store:
+        assert store.missing(5) == [2, 3]
+        store.append((idx, compress_page(f"page {idx}")) for idx in (2, 3))
+    with PageStore(tmp_path) as store:
+        assert store.missing(5) == []
+        assert list(store) == [f"page {idx}" for idx in range(5)]
+
+
+def test_an_empty_store(tmp_path):
+    with PageStore(tmp_path) as store:
+        assert len(store) == 0
+        assert list(store.iter_pages()) == []
+        assert store.missing(2) == [0, 1]
+
+
+def test_import_chunks_places_pages_by_chunk_number(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "guns-1.json").write_text(json.dumps(["p0", "p1", "p2"]), encoding="utf-8")
+    (tmp_path / "guns-2.json").write_text(json.dumps(["p3", None]), encoding="utf-8")
+    # Chunks after a missing one aren't read
+    (tmp_path / "guns-4.json").write_text(json.dumps(["p9"]), encoding="utf-8")
+    with PageStore(tmp_path / "store") as store:
+        assert import_chunks(store, 3) == 5
+        assert list(store.iter_pages()) == [(0, "p0"), (1, "p1"), (2, "p2"), (3, "p3"), (4, "")]
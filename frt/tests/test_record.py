@@ -0,0 +1,62 @@
+import random
+
+from bench_parse import record_parse, reference_parse, synthetic_frn
+from record import parse_record
+
+TEXT = """Firearm Reference Number (FRN): 128418
+Type: Firearm
+manufacturer: GLOCK
+Model:
+
+G17
+Action: Semi-Automatic
+Legal Classification:
+Serial
+Numbering: Yes
+Country of Manufacturer: AUSTRIA
+Remarks:
+Model: mentioned again in the remarks
+Calibre Shots Barrel Length Legal Classification Legal Authority
+128418 - 1 9MM  LUGER 17 114 Restricted CC 84
+1284180 - 1 .40 S&W 15 114 Restricted CC 84
+128418 - 2 9MM LUGER 33 114 Prohibited CC 84
+128418 - 3 .40 S&W 15 114 Restricted CC 84"""
+
+
+def test_labels_and_calibres():
+    record = parse_record(TEXT, "128418")
+    assert record.type == "Firearm"
+    assert record.manufacturer == "GLOCK"
+    assert record.make is None
+    # Nothing after the colon: the next non-blank line
+    assert record.model == "G17"
+    assert record.action == "Semi-Automatic"
+    # A wrapped "Serial Numbering" label isn't a value
+    assert record.legal_class == ""
+    assert record.country == "AUSTRIA"
+    # Spaces collapsed, duplicates dropped, another FRN's rows left out
+    assert record.calibres == ["9MM LUGER", ".40 S&W"]
+
+
+def test_matches_the_per_label_parser_on_synthetic_frns():
+    rng = random.Random(0)
+    for i in range(5_000):
+        frn = str(100_000 + i)
+        text = synthetic_frn(rng, frn)
+        assert record_parse(text, frn) == reference_parse(text, frn), frn
+
+
+def test_matches_the_per_label_parser_on_edge_cases():
+    cases = [
+        "",
+        "Model:",
+        "Model:\n\n",
+        "Model:\nAction: Bolt",
+        "Make: Serial\nModel: X",
+        "Type:   Firearm   \nTYPE: Other",
+        "  Model: indented\nModel: flush",
+        "128418 - 1 12 GA 2 660 Non-Restricted\n128418 - 1 12 GA 2 660",
+        "128418 - 1 .22 LR",
+    ]
+    for text in cases:
+        assert record_parse(text, "128418") == reference_parse(text, "128418"), text
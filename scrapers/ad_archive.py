@@ -0,0 +1,177 @@
+"""
+Local archive of normalized ads, for backfills.
+
+`AdArchive` stands in for the ingest batcher: instead of POSTing, every ad is
+appended to a rotating archive in SCRAPER_DATA_DIR/archive, either gzipped
+JSONL or, with pyarrow installed, zstd Parquet. Files are written as `.part`
+and renamed once rotated or closed, so `load_archive.py` only ever sees
+complete files, and can stream them into gunex at its own pace.
+"""
+import gzip
+import json
+import os
+import time
+from typing import Any, Iterator, Optional
+
+from ingest import ResultCallback
+from metrics import METRICS, StageTimer
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Flat columns next to the full payload, so Parquet archives can be queried directly
+    PARQUET_SCHEMA = pa.schema(
+        [
+            ("platform", pa.string()),
+            ("externalId", pa.string()),
+            ("createdAt", pa.string()),
+            ("title", pa.string()),
+            ("price", pa.int64()),
+            ("subCategoryId", pa.string()),
+            ("payload", pa.string()),
+        ]
+    )
+    FORMATS = ["jsonl", "parquet"]
+except ImportError:
+    pa = pq = None
+    FORMATS = ["jsonl"]
+
+EXTENSIONS = {"jsonl": ".jsonl.gz", "parquet": ".parquet"}
+
+
+class AdArchive:
+    def __init__(
+        self,
+        directory: str,
+        format: str = "jsonl",
+        on_result: Optional[ResultCallback] = None,
+        max_items: int = 50_000,
+        max_bytes: int = 256 * 1024 * 1024,
+        max_age: float = 3600,
+        row_group: int = 5_000,
+        timer: Optional[StageTimer] = None,
+    ):
+        if format not in FORMATS:
+            raise ValueError(f"Unsupported archive format {format!r} (available: {', '.join(FORMATS)})")
+        self.directory = directory
+        self.format = format
+        self.on_result = on_result
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.row_group = row_group
+        self.timer = timer or StageTimer()
+        self.files = 0
+        self._path: Optional[str] = None
+        self._file = None
+        self._items = 0
+        self._bytes = 0
+        self._opened = 0.0
+        self._rows: list[dict] = []
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self):
+        pass
+
+    async def add(self, ad: dict, context: Any = None, timer: Optional[StageTimer] = None):
+        with (timer or self.timer).stage("encode"):
+            encoded = json.dumps(ad, ensure_ascii=False)
+        with self.timer.stage("archive"):
+            if self._path is None:
+                self._open()
+            if self.format == "jsonl":
+                self._file.write(encoded.encode("utf-8") + b"\n")
+            else:
+                self._rows.append(self._row(ad, encoded))
+                if len(self._rows) >= self.row_group:
+                    self._write_rows()
+            self._items += 1
+            self._bytes += len(encoded)
+            if (
+                self._items >= self.max_items
+                or self._bytes >= self.max_bytes
+                or time.monotonic() - self._opened >= self.max_age
+            ):
+                self._rotate()
+        METRICS.inc("scraper_ingest_results_total", action="archived")
+        if self.on_result:
+            self.on_result(context, "archived", None)
+
+    async def drain(self):
+        """Get everything archived so far onto disk; the file stays open until it rotates."""
+        if self.format == "jsonl":
+            if self._file is not None:
+                self._file.flush()
+        else:
+            self._write_rows()
+
+    async def close(self):
+        self._rotate()
+
+    def _open(self):
+        name = f"ads-{time.strftime('%Y%m%d-%H%M%S')}-{self.files:05d}{EXTENSIONS[self.format]}"
+        self._path = os.path.join(self.directory, name)
+        self._opened = time.monotonic()
+        if self.format == "jsonl":
+            self._file = gzip.open(self._path + ".part", "wb", compresslevel=6)
+        else:
+            self._file = None  # the writer needs the first row group's schema
+
+    def _row(self, ad: dict, encoded: str) -> dict:
+        external = ad.get("external", {})
+        return {
+            "platform": external.get("platform"),
+            "externalId": external.get("externalId"),
+            "createdAt": ad.get("createdAt"),
+            "title": ad.get("title"),
+            "price": ad.get("price"),
+            "subCategoryId": ad.get("subCategoryId"),
+            "payload": encoded,
+        }
+
+    def _write_rows(self):
+        if not self._rows:
+            return
+        table = pa.Table.from_pylist(self._rows, schema=PARQUET_SCHEMA)
+        if self._file is None:
+            self._file = pq.ParquetWriter(self._path + ".part", PARQUET_SCHEMA, compression="zstd")
+        self._file.write_table(table)
+        self._rows = []
+
+    def _rotate(self):
+        if self._path is None:
+            return
+        if self.format == "parquet":
+            self._write_rows()
+        if self._file is not None:
+            self._file.close()
+            os.replace(self._path + ".part", self._path)
+            self.files += 1
+            print(f"\033[92mArchived {self._items} ads to {self._path}\033[0m")
+        self._path, self._file, self._items, self._bytes = None, None, 0, 0
+
+
+def archive_files(directory: str) -> list[str]:
+    """Complete archive files in the order they were written."""
+    names = sorted(
+        name for name in os.listdir(directory)
+        if name.startswith("ads-") and name.endswith(tuple(EXTENSIONS.values()))
+    )
+    return [os.path.join(directory, name) for name in names]
+
+
+def read_archive(path: str) -> Iterator[bytes]:
+    """Stream the encoded ads in one archive file without loading it whole."""
+    if path.endswith(EXTENSIONS["jsonl"]):
+        with gzip.open(path, "rb") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield line
+        return
+    if pq is None:
+        raise RuntimeError(f"pyarrow is needed to read {path}")
+    for batch in pq.ParquetFile(path).iter_batches(columns=["payload"]):
+        for payload in batch.column(0).to_pylist():
+            yield payload.encode("utf-8")
@@ -0,0 +1,193 @@
+"""
+Crawl a platform's whole listing archive, resumably.
+
+    python backfill.py                       # every page the pager reports
+    python backfill.py --pages 400 --workers 16 --concurrency 32
+    python backfill.py --archive jsonl       # then load_archive.py
+
+The page range is split into shards of `--shard-size` pages, and `--workers`
+shard readers work through them at once, all feeding the usual detail workers
+and ingest sink. Finished ads are checkpointed in the seen-ads table as they
+complete, and a page is checkpointed once every ad on it is done, so an
+interrupted backfill resumes at the pages it hadn't finished and skips the
+ads it already has. `--restart` forgets the page checkpoints.
+
+New ads push older ones down the listing while a backfill runs, so an ad can
+slip past a page boundary into a page already read; running the backfill a
+second time picks those up cheaply, since everything else is known.
+"""
+import argparse
+import asyncio
+import os
+import time
+from typing import Optional
+
+from ad_archive import AdArchive
+from config import GUNEX_URL
+from crawler import AdJob, Crawler, ingested, rate_limiter, start_parse_pool
+from images import image_checker
+from metrics import METRICS
+from platforms import load_scrapers
+from pool import HostPool
+from scraper import Scraper
+from state import BackfillCheckpoint, PublishedStore, SeenStore, connect, data_path
+
+
+class BackfillCrawler(Crawler):
+    def __init__(self, *args, checkpoint: BackfillCheckpoint, workers: int = 8, shard_size: int = 25, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkpoint = checkpoint
+        self.workers = workers
+        self.shard_size = shard_size
+        self.pages_total = 0
+        self.pages_done = 0
+        # page -> [ads not finished yet, ads on the page, any failed]
+        self._pages: dict[int, list] = {}
+        self._page_of: dict[int, int] = {}
+
+    async def read_listings(self, pages: int):
+        done = self.checkpoint.done_pages()
+        todo = [page for page in range(1, pages + 1) if page not in done]
+        self.pages_total = len(todo)
+        print(f"\033[92m{self.platform} backfill: {len(todo)} of {pages} pages left, {len(done)} already done\033[0m")
+
+        shards: asyncio.Queue = asyncio.Queue()
+        for start in range(0, len(todo), self.shard_size):
+            shards.put_nowait(todo[start:start + self.shard_size])
+        await asyncio.gather(*(self._read_shards(shards) for _ in range(self.workers)))
+
+    async def _read_shards(self, shards: asyncio.Queue):
+        while not shards.empty():
+            for page in shards.get_nowait():
+                try:
+                    await self._read_page(page)
+                except Exception as e:
+                    print(f"\033[91mFailed to read page {page}: {e}\033[0m")
+
+    async def _read_page(self, page: int):
+        response = await self.fetch(self.scraper.listing_url(page))
+        if response.status != 200:
+            print(f"\033[91mFailed to fetch page {page}: status {response.status}\033[0m")
+            return
+        with self.timer.stage("parse"):
+            rows = self.scraper.parse_listing(response.text)
+        self.stats.pages += 1
+
+        jobs = self.listing_jobs(rows)
+        known = {job.external_id for job in jobs if self.store.is_known(job.external_id, job.row.digest)}
+        if known:
+            self.store.touch(known)
+            self.stats.known += len(known)
+            METRICS.inc("scraper_ads_total", len(known), platform=self.platform, outcome="known")
+
+        pending = [job for job in jobs if job.external_id not in known]
+        self._pages[page] = [len(pending), len(rows), False]
+        if not pending:
+            self._page_done(page)
+            return
+        for job in pending:
+            self._page_of[id(job)] = page
+            await self.detail_q.put(job)
+
+    def finished(self, job: AdJob, ok: bool):
+        page = self._page_of.pop(id(job), None)
+        if page is None:
+            return
+        state = self._pages[page]
+        state[0] -= 1
+        state[2] = state[2] or not ok
+        if state[0] == 0:
+            self._page_done(page)
+
+    def _page_done(self, page: int):
+        _, ads, failed = self._pages.pop(page)
+        if failed:
+            # Left unchecked so a resume re-reads it; its finished ads will be known by then
+            print(f"\033[93mPage {page} had failures, it will be retried on resume\033[0m")
+            return
+        self.checkpoint.mark_page(page, ads)
+        self.pages_done += 1
+        elapsed = time.monotonic() - self.stats.started
+        print(
+            f"\033[92mPage {page} done -- {self.pages_done}/{self.pages_total} pages, "
+            f"{self.stats.published / elapsed if elapsed else 0:.1f} ads/s\033[0m"
+        )
+
+
+async def discover_pages(pool: HostPool, scraper: Scraper) -> Optional[int]:
+    response = await pool.request("GET", scraper.listing_url(1))
+    if response.status != 200:
+        return None
+    return scraper.last_page(response.text)
+
+
+async def backfill(args) -> BackfillCrawler:
+    scraper = load_scrapers([args.platform])[0]
+    pool = HostPool(concurrency=args.concurrency, limiter=rate_limiter([scraper], args.rate, args.burst))
+    conn = connect()
+    checkpoint = BackfillCheckpoint(conn, name=scraper.platform)
+    if args.restart:
+        checkpoint.reset()
+    images = image_checker(pool, conn, limit=args.concurrency * 2, store_mb=args.image_store_mb)
+    sink = AdArchive(data_path("archive"), format=args.archive, on_result=ingested) if args.archive else None
+    parse_pool = start_parse_pool(args.parse_workers)
+    try:
+        pages = args.pages or await discover_pages(pool, scraper)
+        if not pages:
+            raise SystemExit(f"Couldn't find how many pages {scraper.platform} has, pass --pages")
+        crawler = BackfillCrawler(
+            scraper,
+            pool,
+            sink=sink,
+            store=SeenStore(conn),
+            digests=PublishedStore(conn),
+            images=images,
+            detail_workers=args.concurrency,
+            gunex_url=args.gunex_url,
+            summary_path=data_path(f"metrics-{scraper.platform}-backfill.json"),
+            parse_pool=parse_pool,
+            parse_workers=args.parse_workers,
+            checkpoint=checkpoint,
+            workers=args.workers,
+            shard_size=args.shard_size,
+        )
+        await crawler.run(pages)
+        return crawler
+    finally:
+        if sink:
+            await sink.close()
+        await pool.close()
+        conn.close()
+        if parse_pool:
+            parse_pool.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--platform", default="gunpost")
+    parser.add_argument("--pages", type=int, help="pages to crawl (default: read from the pager)")
+    parser.add_argument("--workers", type=int, default=8, help="shards read at once")
+    parser.add_argument("--shard-size", type=int, default=25, help="pages per shard")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=int(os.environ.get("SCRAPER_CONCURRENCY", 16)),
+        help="max in-flight requests per host, and detail workers",
+    )
+    parser.add_argument("--rate", type=float, default=float(os.environ.get("SCRAPER_RATE", 0)), help="requests/s per host")
+    parser.add_argument("--burst", type=float, default=float(os.environ.get("SCRAPER_BURST", 0)) or None)
+    parser.add_argument("--parse-workers", type=int, default=int(os.environ.get("SCRAPER_PARSE_WORKERS", 0)))
+    parser.add_argument("--archive", choices=["jsonl", "parquet"], help="write ads to the local archive instead")
+    parser.add_argument(
+        "--image-store-mb",
+        type=float,
+        default=float(os.environ.get("SCRAPER_IMAGE_STORE_MB", 0)),
+        help="download photos into a local store this big and send their hashes, 0 to only check them",
+    )
+    parser.add_argument("--gunex-url", default=GUNEX_URL)
+    parser.add_argument("--restart", action="store_true", help="forget finished pages and start over")
+    asyncio.run(backfill(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Compare HTML parser backends on saved gunpost pages.
+
+    python bench_parse.py --save pages/     # save listing page 1 and its ads
+    python bench_parse.py pages/            # time every backend on them
+
+Files containing `views-row` are timed as listing pages, the rest as ad pages.
+Every combination is also checked to produce the same output as the reference
+(html.parser over the full document).
+"""
+import argparse
+import os
+import statistics
+import time
+
+import requests
+
+from gunpost import GUNPOST_URL, listing_row_digest, parse_ad_page, parse_listing_page, parse_listing_row
+from parsing import BACKENDS
+
+
+def save_pages(directory: str, ads: int):
+    os.makedirs(directory, exist_ok=True)
+    response = requests.get(f"{GUNPOST_URL}/ads?page=0", timeout=30)
+    response.raise_for_status()
+    with open(os.path.join(directory, "listing-0.html"), "w", encoding="utf-8") as f:
+        f.write(response.text)
+
+    saved = 0
+    for ad in parse_listing_page(response.text):
+        row = parse_listing_row(ad)
+        if row is None:
+            continue
+        ad_url = row[0]
+        page = requests.get(ad_url, timeout=30)
+        with open(os.path.join(directory, f"ad-{saved}.html"), "w", encoding="utf-8") as f:
+            f.write(page.text)
+        saved += 1
+        if saved >= ads:
+            break
+    print(f"Saved 1 listing page and {saved} ad pages to {directory}")
+
+
+def load_pages(directory: str) -> tuple[list[str], list[str]]:
+    listings, ads = [], []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".html"):
+            continue
+        with open(os.path.join(directory, name), encoding="utf-8") as f:
+            html = f.read()
+        (listings if "views-row" in html else ads).append(html)
+    return listings, ads
+
+
+def listing_output(html: str, backend: str, restrict: bool):
+    return [(parse_listing_row(ad), listing_row_digest(ad)) for ad in parse_listing_page(html, backend, restrict)]
+
+
+def ad_output(html: str, backend: str, restrict: bool):
+    try:
+        return parse_ad_page(html, backend, restrict)
+    except Exception as e:
+        return repr(e)
+
+
+def bench(pages: list[str], parse, backend: str, restrict: bool, rounds: int) -> list[float]:
+    timings = []
+    for _ in range(rounds):
+        for html in pages:
+            start = time.perf_counter()
+            parse(html, backend, restrict)
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory")
+    parser.add_argument("--save", action="store_true", help="fetch fresh pages into DIRECTORY first")
+    parser.add_argument("--ads", type=int, default=20, help="ad pages to save")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.save:
+        save_pages(args.directory, args.ads)
+
+    listings, ads = load_pages(args.directory)
+    print(f"{len(listings)} listing pages, {len(ads)} ad pages, {args.rounds} rounds\n")
+    print(f"{'kind':<8} {'backend':<12} {'tree':<11} {'mean ms':>9} {'p95 ms':>9} {'pages/s':>9}  same output")
+
+    for kind, pages, parse in (("listing", listings, listing_output), ("ad", ads, ad_output)):
+        if not pages:
+            continue
+        reference = [parse(html, "html.parser", False) for html in pages]
+        for backend in BACKENDS:
+            for restrict in (False, True):
+                timings = bench(pages, parse, backend, restrict, args.rounds)
+                same = [parse(html, backend, restrict) for html in pages] == reference
+                mean = statistics.fmean(timings)
+                p95 = statistics.quantiles(timings, n=20)[-1] if len(timings) > 1 else mean
+                tree = "restricted" if restrict else "full"
+                print(f"{kind:<8} {backend:<12} {tree:<11} {mean:>9.2f} {p95:>9.2f} {1000 / mean:>9.1f}  {same}")
+
+
+if __name__ == "__main__":
+    main()
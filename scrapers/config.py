@@ -0,0 +1,8 @@
+"""
+Where the scrapers send what they find, shared by every platform and tool.
+"""
+import os
+
+GUNEX_URL = os.environ.get("GUNEX_URL", "http://localhost:3000")
+# gunex's INTERNAL_AUTH_TOKEN, which its ingest endpoints require
+GUNEX_API_KEY = os.environ.get("GUNEX_API_KEY", "secret")
@@ -0,0 +1,502 @@
+"""
+Asyncio crawl engine, shared by every platform scraper.
+
+Listing pages feed a bounded queue of detail-page workers, which check images
+concurrently and hand finished ads to the batching ingest sink, so one slow ad
+page only stalls its own worker. Every host gets a single pooled aiohttp
+session whose connector caps the number of in-flight requests to that host.
+
+With a parse pool the detail workers only fetch: raw bodies go onto a second
+bounded queue, and parser tasks hand them to worker processes, so parsing
+no longer competes with the event loop for the GIL.
+
+`serve` runs several platforms in one process, each on its own adaptive
+schedule but sharing the pool, rate limiter, local state and ingest sink, and
+periodically sweeps them for ads that were taken down.
+"""
+import asyncio
+import multiprocessing
+import time
+from collections import Counter
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional, Union
+
+from ad_archive import AdArchive
+from config import GUNEX_URL
+from gunpost import GunpostScraper
+from http_cache import HttpCache
+from images import ImageFetcher, ImageProber, image_checker
+from ingest import IngestBatcher, payload_digest
+from metrics import METRICS, StageTimer, percentile, write_summary
+from pool import Fetched, HostPool, RateLimiter
+from scheduler import AdaptiveSchedule, RunReport
+from scraper import ListingRow, Scraper
+from state import PublishedStore, SeenStore, connect, data_path
+from sweep import sweep_forever
+
+
+@dataclass
+class AdJob:
+    row: ListingRow
+    external_id: str
+    started: float = 0.0
+    payload_digest: Optional[str] = None
+
+    @property
+    def url(self) -> str:
+        return self.row.url
+
+
+@dataclass
+class CrawlStats:
+    started: float = field(default_factory=time.monotonic)
+    pages: int = 0
+    ads_seen: int = 0
+    known: int = 0
+    not_modified: int = 0
+    unchanged: int = 0
+    skipped: Counter = field(default_factory=Counter)
+    published: int = 0
+    failed: int = 0
+    throttled: int = 0
+    first_known: Optional[int] = None
+    latencies: list[float] = field(default_factory=list)
+    listing_latencies: list[float] = field(default_factory=list)
+
+    def summary(self) -> str:
+        elapsed = time.monotonic() - self.started
+        rate = self.published / elapsed if elapsed > 0 else 0.0
+        return (
+            f"{self.pages} pages, {self.ads_seen} ads seen ({self.known} already known, "
+            f"{self.not_modified} not modified, {self.unchanged} unchanged, {sum(self.skipped.values())} skipped), "
+            f"{self.published} published, {self.failed} failed in {elapsed:.1f}s ({rate:.1f} ads/s, "
+            f"p50 {percentile(self.latencies, 50):.2f}s / p95 {percentile(self.latencies, 95):.2f}s per ad)"
+        )
+
+
+class Crawler:
+    """One run of one platform. Without a shared `sink` it sends to its own batcher."""
+
+    def __init__(
+        self,
+        scraper: Scraper,
+        pool: HostPool,
+        sink: Optional[IngestBatcher] = None,
+        store: Optional[SeenStore] = None,
+        digests: Optional[PublishedStore] = None,
+        cache: Optional[HttpCache] = None,
+        images: Optional[Union[ImageProber, ImageFetcher]] = None,
+        detail_workers: int = 8,
+        gunex_url: str = GUNEX_URL,
+        summary_path: Optional[str] = None,
+        parse_pool: Optional[Executor] = None,
+        parse_workers: int = 0,
+    ):
+        self.scraper = scraper
+        self.platform = scraper.platform
+        self.pool = pool
+        self.store = store
+        self.digests = digests
+        self.cache = cache
+        self.images = images or ImageProber(pool)
+        self.detail_workers = detail_workers
+        self.detail_q: asyncio.Queue = asyncio.Queue(maxsize=detail_workers * 4)
+        self.parse_pool = parse_pool
+        # Two tasks per process, so a process never idles while its result is collected
+        self.parser_tasks = parse_workers * 2 if parse_pool else 0
+        self.parse_q: asyncio.Queue = asyncio.Queue(maxsize=max(self.parser_tasks, 1) * 2)
+        self.timer = StageTimer()
+        self.owns_sink = sink is None
+        self.sink = sink or IngestBatcher(pool, gunex_url, on_result=ingested, timer=self.timer)
+        self.stats = CrawlStats()
+        self.summary_path = summary_path
+
+    async def run(self, pages: int):
+        workers = [asyncio.create_task(self._detail_worker()) for _ in range(self.detail_workers)]
+        workers += [asyncio.create_task(self._parse_worker()) for _ in range(self.parser_tasks)]
+        if self.owns_sink:
+            self.sink.start()
+        try:
+            await self.read_listings(pages)
+            await self.detail_q.join()
+            await self.parse_q.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            if self.owns_sink:
+                await self.sink.close()
+            else:
+                await self.sink.drain()
+        print(f"\033[92m{self.platform} run finished: {self.stats.summary()}\033[0m")
+        print(f"\033[92mImages: {self.images.summary()}\033[0m")
+        self.scraper.report()
+        self.report()
+
+    def run_report(self) -> RunReport:
+        listing = self.stats.listing_latencies
+        return RunReport(
+            duration=time.monotonic() - self.stats.started,
+            # Rows skipped from the listing are never marked seen, so they'd count as new on every run
+            new_ads=self.stats.ads_seen - sum(self.stats.skipped.values()) - self.stats.known,
+            pages=self.stats.pages,
+            first_known=self.stats.first_known,
+            throttled=self.stats.throttled,
+            listing_latency=sum(listing) / len(listing) if listing else None,
+        )
+
+    def report(self):
+        elapsed = time.monotonic() - self.stats.started
+        METRICS.inc("scraper_runs_total", platform=self.platform)
+        METRICS.set("scraper_last_run_timestamp_seconds", time.time(), platform=self.platform)
+        METRICS.set("scraper_last_run_duration_seconds", elapsed, platform=self.platform)
+        write_summary(
+            self.summary_path,
+            self.timer,
+            {
+                "platform": self.platform,
+                "duration": round(elapsed, 3),
+                "pages": self.stats.pages,
+                "ads_seen": self.stats.ads_seen,
+                "known": self.stats.known,
+                "not_modified": self.stats.not_modified,
+                "unchanged": self.stats.unchanged,
+                "skipped": dict(self.stats.skipped),
+                "published": self.stats.published,
+                "failed": self.stats.failed,
+                "latency_p50": round(percentile(self.stats.latencies, 50), 3),
+                "latency_p95": round(percentile(self.stats.latencies, 95), 3),
+            },
+        )
+
+    async def fetch(self, url: str) -> Fetched:
+        """
+        GET through the conditional-request cache. A 304 comes back as the
+        cached body with `not_modified` set, to be parsed like any other:
+        whether the ad was published is for the caller to decide, not the cache.
+        """
+        headers = self.cache.validators(url) if self.cache else {}
+        with self.timer.stage("fetch", cpu=False):
+            response = await self.pool.request("GET", url, headers=headers)
+        if response.status == 429 or response.status >= 500:
+            self.stats.throttled += 1
+        if response.status == 304 and headers:
+            body = self.cache.load(url)
+            if body is not None:
+                self.stats.not_modified += 1
+                return Fetched(url, 200, response.headers, body, not_modified=True)
+            # The body went missing under its validators; `load` dropped them, so this one is unconditional
+            with self.timer.stage("fetch", cpu=False):
+                response = await self.pool.request("GET", url)
+        if response.status == 200 and self.cache:
+            self.cache.store(url, response.headers, response.body)
+        return response
+
+    async def read_listings(self, pages: int):
+        position = 0
+        for page in range(1, pages + 1):
+            start = time.monotonic()
+            response = await self.fetch(self.scraper.listing_url(page))
+            self.stats.listing_latencies.append(time.monotonic() - start)
+            if response.status != 200:
+                print(f"\033[91mFailed to fetch page {page}: status {response.status}\033[0m")
+                continue
+            with self.timer.stage("parse"):
+                rows = self.scraper.parse_listing(response.text)
+            self.stats.pages += 1
+            print(f"\033[91m{self.platform} page: {page}\033[0m")
+
+            jobs = self.listing_jobs(rows)
+            known = {
+                job.external_id
+                for job in jobs
+                if self.store and self.store.is_known(job.external_id, job.row.digest)
+            }
+            for index, row in enumerate(rows):
+                if self.stats.first_known is None and self.scraper.external_id(row.url) in known:
+                    self.stats.first_known = position + index
+            position += len(rows)
+            if known:
+                self.store.touch(known)
+                self.stats.known += len(known)
+                METRICS.inc("scraper_ads_total", len(known), platform=self.platform, outcome="known")
+            for job in jobs:
+                if job.external_id not in known:
+                    await self.detail_q.put(job)
+
+            # Newest ads come first, so a page with nothing new means the rest are old too
+            if not rows or (jobs and len(known) == len(jobs)):
+                print(f"\033[92mPage {page} is fully known, stopping\033[0m")
+                break
+
+    def listing_jobs(self, rows: list[ListingRow]) -> list[AdJob]:
+        """A job for each listed ad, less those the listing row alone shows won't be published."""
+        self.stats.ads_seen += len(rows)
+        jobs = []
+        for row in rows:
+            reason = self.scraper.skip(row)
+            if reason:
+                self.stats.skipped[reason] += 1
+                METRICS.inc("scraper_listing_skipped_total", platform=self.platform, reason=reason)
+                continue
+            jobs.append(AdJob(row, self.scraper.external_id(row.url)))
+        return jobs
+
+    def mark_done(self, job: AdJob):
+        self.stats.latencies.append(time.monotonic() - job.started)
+        if self.store:
+            self.store.mark(job.external_id, job.url, job.row.digest)
+        self.finished(job, True)
+
+    def finished(self, job: AdJob, ok: bool):
+        """Called once per queued ad when nothing more will happen to it this run."""
+
+    async def process_ad(self, job: AdJob):
+        job.started = time.monotonic()
+        # Even a 304 is parsed and published: only the published digest says whether gunex has this version
+        response = await self.fetch(job.url)
+        if response.status != 200:
+            # An error page has no ad on it; left unmarked, so the next run tries again
+            self.failed(job, f"status {response.status}")
+            return
+        if self.parse_pool:
+            await self.parse_q.put((job, response.body))
+            return
+        with self.timer.stage("parse"):
+            page = self.scraper.parse_detail(response.text)
+        await self.publish(job, page)
+
+    async def publish(self, job: AdJob, page: dict):
+        with self.timer.stage("images", cpu=False):
+            image_urls = await self.images.fetchable(self.scraper.image_urls(page))
+
+        with self.timer.stage("normalize"):
+            ad = self.scraper.build(job.row, page, image_urls)
+        if ad is None:
+            # Wanted/trade ads are never published, but there's no point fetching them again
+            METRICS.inc("scraper_ads_total", platform=self.platform, outcome="skipped")
+            self.mark_done(job)
+            return
+        hashes = self.images.hashes(ad["external"].get("imageUrls") or [])
+        if hashes:
+            # Lets gunex reuse a photo it already has instead of downloading it
+            ad["external"]["imageHashes"] = hashes
+        if self.digests:
+            job.payload_digest = payload_digest(ad)
+            if self.digests.digest(job.external_id) == job.payload_digest:
+                # Re-fetched (bumped, or the page changed around it) but nothing we publish changed
+                self.stats.unchanged += 1
+                METRICS.inc("scraper_ads_total", platform=self.platform, outcome="unchanged")
+                self.mark_done(job)
+                return
+        await self.sink.add(ad, (self, job, ad["title"]), timer=self.timer)
+
+    async def _detail_worker(self):
+        while True:
+            job = await self.detail_q.get()
+            try:
+                await self.process_ad(job)
+            except Exception as e:
+                self.failed(job, e)
+            finally:
+                self.detail_q.task_done()
+
+    async def _parse_worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job, body = await self.parse_q.get()
+            try:
+                with self.timer.stage("parse", cpu=False):
+                    page, cpu = await loop.run_in_executor(self.parse_pool, self.scraper.parse_detail_body, body)
+                self.timer.add_cpu("parse", cpu)
+                await self.publish(job, page)
+            except Exception as e:
+                self.failed(job, e)
+            finally:
+                self.parse_q.task_done()
+
+    def failed(self, job: AdJob, error: Union[Exception, str]):
+        self.stats.failed += 1
+        METRICS.inc("scraper_ads_total", platform=self.platform, outcome="failed")
+        print(f"Exception in publish_ad: {error} -- {job.url}")
+        self.finished(job, False)
+
+    def ingested(self, job: AdJob, title: str, action: str, error: Optional[str]):
+        if action == "archived":
+            outcome = "archived"
+        else:
+            outcome = "published" if action in ("created", "updated") else "failed"
+        METRICS.inc("scraper_ads_total", platform=self.platform, outcome=outcome)
+        if outcome != "failed":
+            self.stats.published += 1
+            self.mark_done(job)
+            # Archived ads haven't reached gunex yet, so there's no published digest to record
+            if self.digests and job.payload_digest and outcome == "published":
+                self.digests.mark(job.external_id, job.payload_digest, self.platform)
+            print(f"Processed {title[:30]}... -- {action}  -- {job.url}")
+        else:
+            self.stats.failed += 1
+            print(f"\033[93mFailed to publish {title[:30]}... -- {error}  -- {job.url}\033[0m")
+            self.finished(job, False)
+
+
+def ingested(context: tuple[Crawler, AdJob, str], action: str, error: Optional[str]):
+    """IngestBatcher callback: route each result back to the run that queued the ad."""
+    crawler, job, title = context
+    crawler.ingested(job, title, action, error)
+
+
+def start_parse_pool(workers: int) -> Optional[ProcessPoolExecutor]:
+    """Worker processes for parsing ad pages, or None to parse on the event loop."""
+    if workers <= 0:
+        return None
+    # Spawned rather than forked: the parent has an event loop and the metrics thread running
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def rate_limiter(scrapers: list[Scraper], rate: float = 0.0, burst: Optional[float] = None) -> RateLimiter:
+    """`rate` requests per second per host, unless a scraper sets its own for its hosts."""
+    limiter = RateLimiter(rate, burst)
+    for scraper in scrapers:
+        if scraper.rate is not None:
+            for host in scraper.hosts():
+                limiter.set_rate(host, scraper.rate)
+    return limiter
+
+
+async def crawl(
+    pages: int = 50,
+    concurrency: int = 8,
+    use_state: bool = True,
+    use_cache: bool = True,
+    pool: Optional[HostPool] = None,
+    gunex_url: str = GUNEX_URL,
+    parse_pool: Optional[Executor] = None,
+    parse_workers: int = 0,
+    scraper: Optional[Scraper] = None,
+    archive: Optional[str] = None,
+    image_store_mb: float = 0,
+) -> Crawler:
+    """
+    One crawl run of one platform, gunpost by default. `parse_pool` is an
+    executor of `parse_workers` processes that the caller keeps across runs,
+    since starting processes isn't free. With `archive` ("jsonl" or "parquet")
+    ads are written to the local archive instead of being sent to gunex. With
+    `image_store_mb` photos are downloaded into a local store of that size and
+    sent with their hashes, instead of only being checked.
+    """
+    scraper = scraper or GunpostScraper()
+    pool = pool or HostPool(concurrency=concurrency, limiter=rate_limiter([scraper]))
+    # Without state, image probes are still cached for the length of the run
+    conn = connect() if use_state else connect(":memory:")
+    store = SeenStore(conn) if use_state else None
+    digests = PublishedStore(conn) if use_state else None
+    cache = HttpCache() if use_cache else None
+    images = image_checker(pool, conn, limit=concurrency * 2, store_mb=image_store_mb if use_state else 0)
+    sink = AdArchive(data_path("archive"), format=archive, on_result=ingested) if archive else None
+    crawler = Crawler(
+        scraper,
+        pool,
+        sink=sink,
+        store=store,
+        cache=cache,
+        images=images,
+        digests=digests,
+        detail_workers=concurrency,
+        gunex_url=gunex_url,
+        summary_path=data_path(f"metrics-{scraper.platform}.json") if use_state else None,
+        parse_pool=parse_pool,
+        parse_workers=parse_workers,
+    )
+    try:
+        await crawler.run(pages)
+        return crawler
+    finally:
+        if sink:
+            await sink.close()
+        await pool.close()
+        conn.close()
+        if cache:
+            cache.close()
+
+
+async def serve(
+    scrapers: list[Scraper],
+    concurrency: int = 8,
+    use_state: bool = True,
+    use_cache: bool = True,
+    gunex_url: str = GUNEX_URL,
+    parse_workers: int = 0,
+    rate: float = 0.0,
+    burst: Optional[float] = None,
+    archive: Optional[str] = None,
+    sweep_hours: float = 0.0,
+    image_store_mb: float = 0,
+):
+    """
+    Crawl every platform forever in this process, each on its own schedule.
+    Every `sweep_hours` each platform is also swept for ads no longer listed
+    (see sweep.py); that needs local state and a live gunex, not an archive.
+    """
+    pool = HostPool(concurrency=concurrency, limiter=rate_limiter(scrapers, rate, burst))
+    conn = connect() if use_state else connect(":memory:")
+    store = SeenStore(conn) if use_state else None
+    digests = PublishedStore(conn) if use_state else None
+    cache = HttpCache() if use_cache else None
+    images = image_checker(pool, conn, limit=concurrency * 2, store_mb=image_store_mb if use_state else 0)
+    if archive:
+        sink = AdArchive(data_path("archive"), format=archive, on_result=ingested)
+    else:
+        sink = IngestBatcher(pool, gunex_url, on_result=ingested)
+    parse_pool = start_parse_pool(parse_workers)
+
+    async def schedule_platform(scraper: Scraper):
+        schedule = AdaptiveSchedule()
+        total_runs = 0
+        while True:
+            total_runs += 1
+            print("-"*100)
+            print(
+                f"Starting new {scraper.platform} run -- {total_runs} / Reading {schedule.pages} pages --",
+                datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            )
+            print("-"*100)
+            crawler = Crawler(
+                scraper,
+                pool,
+                sink=sink,
+                store=store,
+                cache=cache,
+                images=images,
+                digests=digests,
+                detail_workers=concurrency,
+                summary_path=data_path(f"metrics-{scraper.platform}.json") if use_state else None,
+                parse_pool=parse_pool,
+                parse_workers=parse_workers,
+            )
+            try:
+                await crawler.run(schedule.pages)
+            except Exception as e:
+                # One platform failing shouldn't stop the others
+                print(f"\033[91m{scraper.platform} run failed: {e}\033[0m")
+            schedule.observe(crawler.run_report())
+            print(f"\033[92m{scraper.platform}: {schedule.describe()}\033[0m")
+            await asyncio.sleep(schedule.interval)
+
+    tasks = [schedule_platform(scraper) for scraper in scrapers]
+    if sweep_hours > 0 and use_state and not archive:
+        tasks += [sweep_forever(scraper, pool, conn, sweep_hours, gunex_url=gunex_url) for scraper in scrapers]
+
+    sink.start()
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        await sink.close()
+        await pool.close()
+        conn.close()
+        if cache:
+            cache.close()
+        if parse_pool:
+            parse_pool.shutdown()
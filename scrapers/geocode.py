@@ -0,0 +1,237 @@
+"""
+Offline geocoding of ad locations to coordinates.
+
+    python geocode.py ../CA_full.txt           # rebuild geo-index.tsv.gz
+
+CA_full.txt is the geonames Canadian postal code dump, the same file the
+gunex app image copies in. Neither it nor the index is committed: the scraper
+image builds the index in its first stage from
+https://download.geonames.org/export/zip/CA_full.csv.zip. To run the scraper
+outside Docker, unzip that file and run the command above.
+
+The index is small enough to ship with the scraper: one line per forward
+sortation area (the first three characters of a postal code) with its
+centroid and province, and one per city with its centroid and most common
+FSA. It is loaded on first use. FSAs live in flat arrays indexed by the
+code itself, so a lookup is arithmetic, not a search. Locations without a
+postal code fall back to the city name, matched exactly or, failing that,
+fuzzily against the cities whose names start the same way.
+"""
+import argparse
+import difflib
+import gzip
+import os
+from array import array
+from collections import Counter, defaultdict
+from typing import NamedTuple, Optional
+
+from normalize import canonical_key
+
+INDEX_PATH = os.environ.get(
+    "SCRAPER_GEO_INDEX", os.path.join(os.path.dirname(os.path.abspath(__file__)), "geo-index.tsv.gz")
+)
+
+PROVINCES = {
+    "AB": "Alberta",
+    "BC": "British Columbia",
+    "MB": "Manitoba",
+    "NB": "New Brunswick",
+    "NL": "Newfoundland and Labrador",
+    "NS": "Nova Scotia",
+    "NT": "Northwest Territories",
+    "NU": "Nunavut",
+    "ON": "Ontario",
+    "PE": "Prince Edward Island",
+    "QC": "Quebec",
+    "SK": "Saskatchewan",
+    "YT": "Yukon",
+}
+PROVINCE_CODES = list(PROVINCES)
+_NAME_TO_CODE = {canonical_key(name): code for code, name in PROVINCES.items()}
+
+# A9A: letter, digit, letter
+FSA_SLOTS = 26 * 10 * 26
+
+
+class Place(NamedTuple):
+    latitude: float
+    longitude: float
+    province: str  # two-letter code
+    city: str
+    fsa: str
+
+
+def fsa_slot(fsa: str) -> Optional[int]:
+    if len(fsa) < 3:
+        return None
+    letter, digit, last = ord(fsa[0]) - 65, ord(fsa[1]) - 48, ord(fsa[2]) - 65
+    if not (0 <= letter < 26 and 0 <= digit < 10 and 0 <= last < 26):
+        return None
+    return (letter * 10 + digit) * 26 + last
+
+
+def province_code(text: str) -> Optional[str]:
+    text = text.strip().upper()
+    if text in PROVINCES:
+        return text
+    return _NAME_TO_CODE.get(canonical_key(text))
+
+
+class GeoIndex:
+    def __init__(self, path: str = INDEX_PATH):
+        self.latitudes = array("f", bytes(4 * FSA_SLOTS))
+        self.longitudes = array("f", bytes(4 * FSA_SLOTS))
+        # 0 for an unknown FSA, otherwise 1 + the PROVINCE_CODES index
+        self.provinces = bytearray(FSA_SLOTS)
+        self.fsa_cities: dict[int, str] = {}
+        # canonical city name -> places by province
+        self.cities: dict[str, dict[str, Place]] = defaultdict(dict)
+        self._by_prefix: dict[str, list[str]] = defaultdict(list)
+        self._fuzzy: dict[tuple[str, Optional[str]], Optional[Place]] = {}
+
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                kind, key, province, lat, lon, other = line.rstrip("\n").split("\t")
+                if kind == "F":
+                    slot = fsa_slot(key)
+                    self.latitudes[slot] = float(lat)
+                    self.longitudes[slot] = float(lon)
+                    self.provinces[slot] = PROVINCE_CODES.index(province) + 1
+                    self.fsa_cities[slot] = other
+                else:
+                    name = canonical_key(key)
+                    self.cities[name][province] = Place(float(lat), float(lon), province, key, other)
+        for name in self.cities:
+            self._by_prefix[name[:2]].append(name)
+
+    def fsa(self, postal_code: str) -> Optional[Place]:
+        """The place for a full or partial postal code."""
+        fsa = postal_code.replace(" ", "").upper()[:3]
+        slot = fsa_slot(fsa)
+        if slot is None or not self.provinces[slot]:
+            return None
+        return Place(
+            round(self.latitudes[slot], 4),
+            round(self.longitudes[slot], 4),
+            PROVINCE_CODES[self.provinces[slot] - 1],
+            self.fsa_cities[slot],
+            fsa,
+        )
+
+    def city(self, name: str, province: Optional[str] = None) -> Optional[Place]:
+        """A city by name, preferring the given province; misspellings get a close match."""
+        key = canonical_key(name)
+        if not key:
+            return None
+        places = self.cities.get(key)
+        if places is None:
+            memo = (key, province)
+            if memo not in self._fuzzy:
+                matches = difflib.get_close_matches(key, self._by_prefix.get(key[:2], []), n=3, cutoff=0.85)
+                # With a province, the closest name in that province beats a closer one elsewhere
+                match = next((m for m in matches if province in self.cities[m]), matches[0] if matches else None)
+                self._fuzzy[memo] = self._pick(self.cities[match], province) if match else None
+            return self._fuzzy[memo]
+        return self._pick(places, province)
+
+    @staticmethod
+    def _pick(places: dict[str, Place], province: Optional[str]) -> Optional[Place]:
+        if province in places:
+            return places[province]
+        # A name shared across provinces is ambiguous without one
+        return next(iter(places.values())) if len(places) == 1 else None
+
+    def locate(self, postal_code: Optional[str], location: Optional[str]) -> Optional[Place]:
+        """
+        Resolve an ad: its postal code if it has one we know, otherwise the city
+        in a "City, PROV" style location string.
+        """
+        if postal_code:
+            place = self.fsa(postal_code)
+            if place:
+                return place
+        if not location:
+            return None
+        parts = [part.strip() for part in location.split(",")]
+        province = None
+        if len(parts) > 1:
+            # "Ottawa, ON K1A 0B1": the province is the first word after the comma
+            words = parts[1].split()
+            province = province_code(words[0]) if words else None
+            if province is None:
+                province = province_code(parts[1])
+        return self.city(parts[0], province)
+
+
+_index: Optional[GeoIndex] = None
+_missing = False
+
+
+def geo_index() -> Optional[GeoIndex]:
+    """The shared index, loaded on first use; None (with one warning) if it hasn't been built."""
+    global _index, _missing
+    if _index is None and not _missing:
+        try:
+            _index = GeoIndex()
+        except FileNotFoundError:
+            _missing = True
+            print(f"\033[93mNo geocode index at {INDEX_PATH}, ads will go without coordinates (see geocode.py)\033[0m")
+    return _index
+
+
+def locate(postal_code: Optional[str], location: Optional[str]) -> Optional[Place]:
+    index = geo_index()
+    return index.locate(postal_code, location) if index else None
+
+
+def build_index(source: str, path: str = INDEX_PATH):
+    """Write the index from a geonames postal code dump: country, code, place, province, code, ..., lat, lon."""
+    fsas: dict[str, list] = {}
+    fsa_provinces: dict[str, str] = {}
+    fsa_places: dict[str, Counter] = defaultdict(Counter)
+    cities: dict[tuple[str, str], list] = {}
+    city_fsas: dict[tuple[str, str], Counter] = defaultdict(Counter)
+
+    with open(source, encoding="utf-8") as f:
+        for line in f:
+            parts = line.rstrip("\n").split("\t")
+            if len(parts) < 11 or not parts[9] or not parts[10]:
+                continue
+            fsa = parts[1].replace(" ", "").upper()[:3]
+            province = parts[4].strip().upper()
+            if fsa_slot(fsa) is None or province not in PROVINCES:
+                continue
+            # Places are often "City Centre", "City Northeast"; the city is the part before
+            city = parts[2].split(" (")[0].strip()
+            lat, lon = float(parts[9]), float(parts[10])
+            for table, key in ((fsas, fsa), (cities, (city, province))):
+                total = table.setdefault(key, [0.0, 0.0, 0])
+                total[0] += lat
+                total[1] += lon
+                total[2] += 1
+            fsa_provinces[fsa] = province
+            fsa_places[fsa][city] += 1
+            city_fsas[(city, province)][fsa] += 1
+
+    tmp = path + ".part"
+    with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=9) as out:
+        for fsa, (lat, lon, count) in sorted(fsas.items()):
+            city = fsa_places[fsa].most_common(1)[0][0]
+            out.write(f"F\t{fsa}\t{fsa_provinces[fsa]}\t{lat / count:.4f}\t{lon / count:.4f}\t{city}\n")
+        for (city, province), (lat, lon, count) in sorted(cities.items()):
+            fsa = city_fsas[(city, province)].most_common(1)[0][0]
+            out.write(f"C\t{city}\t{province}\t{lat / count:.4f}\t{lon / count:.4f}\t{fsa}\n")
+    os.replace(tmp, path)
+    print(f"\033[92mWrote {len(fsas)} FSAs and {len(cities)} cities to {path}\033[0m")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="geonames CA_full.txt")
+    parser.add_argument("--out", default=INDEX_PATH)
+    args = parser.parse_args()
+    build_index(args.source, args.out)
+
+
+if __name__ == "__main__":
+    main()
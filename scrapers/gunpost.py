@@ -1,5 +1,4 @@
 import requests
-from bs4 import BeautifulSoup
 from typing import TypedDict, Optional
 import re
 from datetime import datetime
@@ -8,12 +7,44 @@ from decimal import Decimal, InvalidOperation
 import pytz
 import time
 import os
+import argparse
+import asyncio
+from urllib.parse import urlsplit
 
+from config import GUNEX_API_KEY, GUNEX_URL
+from geocode import PROVINCES, locate
+from normalize import CanonicalIndex
+from parsing import Regions, make_soup
+from scraper import ListingRow, Scraper
 
-def get_gunpost_ads(url="https://www.gunpost.ca/ads", page=1):
+
+GUNPOST_URL = "https://www.gunpost.ca"
+
+
+def get_gunpost_ads(url=f"{GUNPOST_URL}/ads", page=1):
     response = requests.get(f"{url}?page={page-1}")
     response.raise_for_status()
-    soup = BeautifulSoup(response.text, "html.parser")
+    return parse_listing_page(response.text)
+
+
+LISTING_REGIONS = Regions("div.views-row")
+PAGER_REGIONS = Regions("li.pager__item--last")
+
+# Everything parse_ad_page reads; the rest of the page is never built into a tree
+DETAIL_REGIONS = Regions(
+    "div.price",
+    "div.post-location",
+    "h1.node__title",
+    "div.member-name",
+    "div.body",
+    "div.firearm-details",
+    "div.rating",
+    "div#rid-sidebar-first",
+)
+
+
+def parse_listing_page(html: str, backend: Optional[str] = None, restrict: bool = True) -> list:
+    soup = make_soup(html, LISTING_REGIONS if restrict else None, backend)
     ads = soup.find_all("div", class_="views-row")
     return ads
 
@@ -28,6 +59,14 @@ class GunpostAd(TypedDict):
     external: dict
 
 
+# Full code first, then a bare FSA, then an FSA run into the next word
+POSTAL_CODE_PATTERNS = [
+    re.compile(r"\b[ABCEGHJ-NPRSTVXY]\d[ABCEGHJ-NPRSTV-Z][ -]?\d[ABCEGHJ-NPRSTV-Z]\d\b"),
+    re.compile(r"\b[ABCEGHJ-NPRSTVXY]\d[ABCEGHJ-NPRSTV-Z]\b"),
+    re.compile(r"\b[ABCEGHJ-NPRSTVXY]\d[ABCEGHJ-NPRSTV-Z]"),
+]
+
+
 def extract_postal_code(location: Optional[str]) -> Optional[str]:
     """
     Extract a Canadian postal code (full or partial) from a location string.
@@ -36,13 +75,8 @@ def extract_postal_code(location: Optional[str]) -> Optional[str]:
     if not location:
         return None
 
-    patterns = [
-        r"\b[ABCEGHJ-NPRSTVXY]\d[ABCEGHJ-NPRSTV-Z][ -]?\d[ABCEGHJ-NPRSTV-Z]\d\b",
-        r"\b[ABCEGHJ-NPRSTVXY]\d[ABCEGHJ-NPRSTV-Z]\b",
-        r"\b[ABCEGHJ-NPRSTVXY]\d[ABCEGHJ-NPRSTV-Z]",
-    ]
-    for pattern in patterns:
-        match = re.search(pattern, location)
+    for pattern in POSTAL_CODE_PATTERNS:
+        match = pattern.search(location)
         if match:
             return match.group(0).replace(" ", "")
     return None
@@ -398,6 +432,15 @@ caliber = {
     "9.3x72R": "9.3X72R",
 }
 
+CATEGORY_INDEX = CanonicalIndex("category", categories_map)
+CALIBER_INDEX = CanonicalIndex("caliber", caliber)
+
+
+def report_normalization_misses():
+    CATEGORY_INDEX.report()
+    CALIBER_INDEX.report()
+
+
 def map_properties(properties: dict) -> tuple[str, dict]:
     category = ""
     properties_normalized = {}
@@ -406,16 +449,12 @@ def map_properties(properties: dict) -> tuple[str, dict]:
         key = key_map.get(key, key)
 
         if key == "category":
-            category = categories_map.get(value, "")
-            if not category:
-                print(f"\033[93mUnknown category: {value}\033[0m")
+            category = CATEGORY_INDEX.get(value) or ""
             continue
 
         if key == "caliber":
-            if value not in caliber:
-                print(f"\033[93mUnknown caliber: {value}\033[0m")
-            value = caliber.get(value, value)
-        
+            value = CALIBER_INDEX.get(value) or value
+
         if key == "hand" or key == "handed" or key == "handedness":
             key = "handed"
 
@@ -423,64 +462,74 @@ def map_properties(properties: dict) -> tuple[str, dict]:
 
     return category, properties_normalized
 
-def publish_ad(ad):
+# Prices gunpost shows instead of a number; these ads are never published
+UNPUBLISHED_PRICES = {
+    "Wanted": "wanted",
+    "Call for Price": "call_for_price",
+    "Swap / Trade": "trade",
+}
+
+
+def unpublished_price(price: Optional[str]) -> Optional[str]:
+    """Why a listing row's price means the ad won't be published, or None; a row without a price isn't judged."""
+    if price is None:
+        return None
+    if price in UNPUBLISHED_PRICES:
+        return UNPUBLISHED_PRICES[price]
+    if parse_price_to_int(price) is None:
+        return "bad_price"
+    return None
+
+
+def parse_listing_row(ad) -> Optional[tuple[str, Optional[str], Optional[str]]]:
+    """
+    Read the ad URL, post date and price from a listing-page `views-row`.
+    Returns (ad_url, iso_date, price), with the date or price None if they
+    couldn't be read, or None if the row isn't an ad at all.
+    """
     first_link = ad.find("a", href=True)
-    
+
     if not (first_link and first_link['href'].startswith('/')):
-        return
+        return None
+    ad_url = f"{GUNPOST_URL}{first_link['href']}"
+
+    price_div = ad.find("div", class_="price")
+    price = price_div.text.strip() if price_div else None
 
     post_date = ad.find("span", class_="node__pubdate")
     if not post_date:
         print(f"Failed to find post date: {post_date} -- {first_link}")
-        return
+        return ad_url, None, price
 
     date = parse_post_date(post_date.text.strip())
-    if isinstance(date, datetime):
-        est = pytz.timezone("America/Toronto")
-        if date.tzinfo is None:
-            date = est.localize(date)
-        else:
-            date = date.astimezone(est)
-        date = date.isoformat()
-    # Print out how long ago it was posted in 1h 2s format
-    if date:
-        now = datetime.now(pytz.timezone("America/Toronto"))
-        if isinstance(date, str):
-            # Parse back to datetime if needed
-            date_dt = datetime.fromisoformat(date)
-        else:
-            date_dt = date
-        delta = now - date_dt
-        total_seconds = int(delta.total_seconds())
-
-        days, remainder = divmod(total_seconds, 86400)
-        months = 0
-        # Approximate months as 30 days
-        if days >= 30:
-            months = days // 30
-            days = days % 30
-
-        hours, remainder = divmod(remainder, 3600)
-        minutes, seconds = divmod(remainder, 60)
-        parts = []
-        if months > 0:
-            parts.append(f"{months}mo")
-        if days > 0:
-            parts.append(f"{days}d")
-        if hours > 0:
-            parts.append(f"{hours}h")
-        if minutes > 0:
-            parts.append(f"{minutes}m")
-        if seconds > 0 or not parts:
-            parts.append(f"{seconds}s")
-
     if not date:
         print(f"\033[93mFailed to parse date: {first_link} -- {post_date}\033[0m")
-        return
+        return ad_url, None, price
 
-    ad_url = f"https://www.gunpost.ca{first_link['href']}"
-    response = requests.get(ad_url)
-    ad_soup = BeautifulSoup(response.text, "html.parser")
+    est = pytz.timezone("America/Toronto")
+    if date.tzinfo is None:
+        date = est.localize(date)
+    else:
+        date = date.astimezone(est)
+
+    return ad_url, date.isoformat(), price
+
+
+def listing_row_digest(ad) -> str:
+    """Digest of a listing-page row, used to notice when a known ad's snippet changes."""
+    return hashlib.md5(ad.get_text(" ", strip=True).encode("utf-8")).hexdigest()
+
+
+def external_id(ad_url: str) -> str:
+    return hashlib.md5(ad_url.encode("utf-8")).hexdigest()
+
+
+def parse_ad_page(html: str, backend: Optional[str] = None, restrict: bool = True) -> dict:
+    """
+    Pull every field publish_ad needs out of an ad's detail page.
+    Image URLs are returned unprobed, already rewritten to `dad_large`.
+    """
+    ad_soup = make_soup(html, DETAIL_REGIONS if restrict else None, backend)
 
     price_div = ad_soup.find("div", class_="price")
     price = price_div.text.strip()
@@ -535,7 +584,6 @@ def publish_ad(ad):
             except ValueError:
                 pass
 
-
     sidebar = ad_soup.find("div", id="rid-sidebar-first")
     first_sidebar_div = sidebar.find("div") if sidebar else None
     image_tags = first_sidebar_div.find_all("img")
@@ -548,58 +596,147 @@ def publish_ad(ad):
                 src = src.replace("dad_square", "dad_large")
             # Optionally remove search params from the URL
             # clean_src = src.strip().split('?', 1)[0]
-            try:
-                # Try to fetch the image with a HEAD request to check if it exists
-                resp = requests.head(src, timeout=5)
-                if resp.status_code == 200:
-                    image_urls.append(src)
-                else:
-                    print(f"\033[93mImage not fetchable (status {resp.status_code}): {src}\033[0m")
-            except Exception as e:
-                print(f"\033[93mFailed to fetch image: {src} -- {e}\033[0m")
+            image_urls.append(src)
 
-            
+    return {
+        "price": price,
+        "postalCode": postalcode,
+        "location": location,
+        "title": title,
+        "username": username,
+        "description": str(description),
+        "properties": properties,
+        "sellerRating": user_rating,
+        "sellerReviews": user_reviews,
+        "imageUrls": image_urls,
+    }
 
-    category, properties_normalized = map_properties(properties)
 
+def build_gunpost_ad(ad_url: str, date: str, page: dict, image_urls: list[str]) -> Optional[GunpostAd]:
+    """
+    Normalize a parsed detail page into the ingest payload.
+    Returns None for ads we don't publish (wanted, trades, unparseable price).
+    """
+    category, properties_normalized = map_properties(page["properties"])
+
+    price = page["price"]
     price_value = parse_price_to_int(price)
     if price_value is None:
-        if price == "Wanted":
-            return
-        if price == "Call for Price":
-            return
-        if price == "Swap / Trade":
-            return
+        if price in UNPUBLISHED_PRICES:
+            return None
 
         print(f"\033[93mFailed to parse price: {price} -- {ad_url}\033[0m")
-        return
+        return None
 
-    gunpost_ad = [{
-        "title": title,
+    postal_code = page["postalCode"]
+    place = locate(postal_code, page.get("location"))
+
+    ad = {
+        "title": page["title"],
         "price": price_value,
         "createdAt": str(date),
-        "description": str(description),
+        "description": page["description"],
         "properties": properties_normalized,
         "subCategoryId": category,
         "external": {
-            "postalCode": postalcode,
+            "postalCode": postal_code,
             "url": ad_url,
             "platform": "gunpost",
-            "externalId": hashlib.md5(ad_url.encode("utf-8")).hexdigest(),
+            "externalId": external_id(ad_url),
             "imageUrls": image_urls,
-            "sellerUsername": username,
-            "sellerRating": user_rating,
-            "sellerReviews": user_reviews,
+            "sellerUsername": page["username"],
+            "sellerRating": page["sellerRating"],
+            "sellerReviews": page["sellerReviews"],
+        }
+    }
+    if place:
+        # Without a postal code, the city's most common FSA still lets gunex place the ad
+        ad["external"]["postalCode"] = postal_code or place.fsa
+        ad["external"]["location"] = {
+            "latitude": place.latitude,
+            "longitude": place.longitude,
+            "city": place.city,
+            "province": PROVINCES[place.province],
+            "provinceCode": place.province,
         }
-    }]
+    return ad
+
+
+class GunpostScraper(Scraper):
+    platform = "gunpost"
+
+    def hosts(self) -> list[str]:
+        return [urlsplit(GUNPOST_URL).netloc, "media.gunpost.ca"]
+
+    def listing_url(self, page: int) -> str:
+        return f"{GUNPOST_URL}/ads?page={page-1}"
+
+    def parse_listing(self, html: str) -> list[ListingRow]:
+        rows = []
+        for ad in parse_listing_page(html):
+            row = parse_listing_row(ad)
+            if row is not None:
+                ad_url, date, price = row
+                rows.append(ListingRow(ad_url, date or "", listing_row_digest(ad), price))
+        return rows
+
+    def skip(self, row: ListingRow) -> Optional[str]:
+        return unpublished_price(row.price) or super().skip(row)
+
+    def last_page(self, html: str) -> Optional[int]:
+        # Drupal's pager links the last page as "?page=N", zero-based
+        link = make_soup(html, PAGER_REGIONS).find("a", href=True)
+        match = re.search(r"[?&]page=(\d+)", link["href"]) if link else None
+        return int(match.group(1)) + 1 if match else None
+
+    def external_id(self, url: str) -> str:
+        return external_id(url)
+
+    def parse_detail(self, html: str) -> dict:
+        return parse_ad_page(html)
+
+    def build(self, row: ListingRow, page: dict, image_urls: list[str]) -> Optional[GunpostAd]:
+        return build_gunpost_ad(row.url, row.date, page, image_urls)
+
+    def report(self):
+        report_normalization_misses()
+
+
+def publish_ad(ad):
+    row = parse_listing_row(ad)
+    if row is None:
+        return
+    ad_url, date, price = row
+    if date is None or unpublished_price(price):
+        return
+
+    response = requests.get(ad_url)
+    page = parse_ad_page(response.text)
+
+    image_urls = []
+    for src in page["imageUrls"]:
+        try:
+            # Try to fetch the image with a HEAD request to check if it exists
+            resp = requests.head(src, timeout=5)
+            if resp.status_code == 200:
+                image_urls.append(src)
+            else:
+                print(f"\033[93mImage not fetchable (status {resp.status_code}): {src}\033[0m")
+        except Exception as e:
+            print(f"\033[93mFailed to fetch image: {src} -- {e}\033[0m")
+
+    gunpost_ad = build_gunpost_ad(ad_url, date, page, image_urls)
+    if gunpost_ad is None:
+        return
 
     try:
         response = requests.post(
-            os.environ.get("GUNEX_URL", "http://localhost:3000") + "/api/v1/external-listings",
-            json=gunpost_ad,
+            GUNEX_URL + "/api/v1/external-listings",
+            json=[gunpost_ad],
+            headers={"x-api-key": GUNEX_API_KEY},
             timeout=10
         )
-        print(f"Processed {title[:30]}... -- {response.status_code}  -- {ad_url}")
+        print(f"Processed {gunpost_ad['title'][:30]}... -- {response.status_code}  -- {ad_url}")
         try:
             response_json = response.json()
             # print("Parsed JSON response:")
@@ -612,7 +749,7 @@ def publish_ad(ad):
 
 import concurrent.futures
 
-def main(pages=50):
+def main_sync(pages=50):
     for page in range(1, pages + 1):
         ads = get_gunpost_ads(page=page)
         print(f"\033[91mPage: {page}\033[0m")
@@ -624,15 +761,134 @@ def main(pages=50):
                     future.result()
                 except Exception as e:
                     print(f"Exception in publish_ad: {e}")
+    report_normalization_misses()
+
+
+def main(
+    platforms=("gunpost",),
+    concurrency=8,
+    use_state=True,
+    use_cache=True,
+    parse_workers=0,
+    rate=0.0,
+    burst=None,
+    archive=None,
+    sweep_hours=0.0,
+    image_store_mb=0,
+):
+    """Crawl `platforms` forever in this process; see crawler.serve."""
+    from crawler import serve
+    from platforms import load_scrapers
+
+    asyncio.run(
+        serve(
+            load_scrapers(list(platforms)),
+            concurrency=concurrency,
+            use_state=use_state,
+            use_cache=use_cache,
+            parse_workers=parse_workers,
+            rate=rate,
+            burst=burst,
+            archive=archive,
+            sweep_hours=sweep_hours,
+            image_store_mb=image_store_mb,
+        )
+    )
 
-if __name__ == "__main__":
 
-    total_runs = 0
-    while True:
-        total_runs += 1
-        pages = 50 if total_runs == 1 else 5
-        print("-"*100)
-        print(f"Starting new run -- {total_runs} / Reading {pages} pages --", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-        print("-"*100)
-        main(pages=pages)
-        time.sleep(60)
\ No newline at end of file
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape gunpost.ca (and other marketplace) ads into gunex")
+    parser.add_argument("--sync", action="store_true", help="use the old one-ad-at-a-time gunpost crawler")
+    parser.add_argument(
+        "--platforms",
+        default=os.environ.get("SCRAPER_PLATFORMS", "gunpost"),
+        help="comma-separated platforms to crawl in this process (async mode)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=int(os.environ.get("SCRAPER_CONCURRENCY", 8)),
+        help="max in-flight requests per host (async mode)",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=float(os.environ.get("SCRAPER_RATE", 0)),
+        help="max requests per second per host, 0 for no limit (async mode)",
+    )
+    parser.add_argument(
+        "--burst",
+        type=float,
+        default=float(os.environ.get("SCRAPER_BURST", 0)) or None,
+        help="requests a host may get at once before --rate applies (default: one second's worth)",
+    )
+    parser.add_argument(
+        "--no-state",
+        action="store_true",
+        help="ignore local state (seen ads, image probes) and re-fetch everything (async mode)",
+    )
+    parser.add_argument(
+        "--no-http-cache",
+        action="store_true",
+        help="don't send conditional requests for listing and ad pages (async mode)",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=int(os.environ.get("SCRAPER_METRICS_PORT", 0)),
+        help="serve Prometheus metrics on this port (async mode)",
+    )
+    parser.add_argument(
+        "--parse-workers",
+        type=int,
+        default=int(os.environ.get("SCRAPER_PARSE_WORKERS", 0)),
+        help="parse ad pages in this many worker processes, 0 to parse inline (async mode)",
+    )
+    parser.add_argument(
+        "--archive",
+        choices=["jsonl", "parquet"],
+        default=os.environ.get("SCRAPER_ARCHIVE") or None,
+        help="write ads to a local archive for load_archive.py instead of sending them to gunex (async mode)",
+    )
+    parser.add_argument(
+        "--sweep-hours",
+        type=float,
+        default=float(os.environ.get("SCRAPER_SWEEP_HOURS", 0)),
+        help="mark ads gone from the listings as removed in gunex this often, 0 (the default) to never (async mode)",
+    )
+    parser.add_argument(
+        "--image-store-mb",
+        type=float,
+        default=float(os.environ.get("SCRAPER_IMAGE_STORE_MB", 0)),
+        help="download photos into a local store this big and send their hashes, 0 (default) to only HEAD them (async mode)",
+    )
+    args = parser.parse_args()
+
+    if args.metrics_port:
+        from metrics import serve_metrics
+
+        serve_metrics(args.metrics_port)
+
+    if args.sync:
+        total_runs = 0
+        while True:
+            total_runs += 1
+            pages = 50 if total_runs == 1 else 5
+            print("-"*100)
+            print(f"Starting new run -- {total_runs} / Reading {pages} pages --", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            print("-"*100)
+            main_sync(pages=pages)
+            time.sleep(60)
+
+    main(
+        platforms=[name.strip() for name in args.platforms.split(",") if name.strip()],
+        concurrency=args.concurrency,
+        use_state=not args.no_state,
+        use_cache=not args.no_http_cache,
+        parse_workers=args.parse_workers,
+        rate=args.rate,
+        burst=args.burst,
+        archive=args.archive,
+        sweep_hours=args.sweep_hours,
+        image_store_mb=args.image_store_mb,
+    )
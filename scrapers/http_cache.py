@@ -0,0 +1,131 @@
+"""
+Disk-backed HTTP cache for conditional GETs.
+
+Bodies are stored as zlib-compressed files named after the URL's sha1, with
+their ETag/Last-Modified validators and access times in a SQLite index. Once
+the bodies exceed `max_bytes`, the least recently used ones are dropped.
+"""
+import hashlib
+import os
+import sqlite3
+import time
+import zlib
+from typing import Optional
+
+from state import data_path
+
+DEFAULT_MAX_BYTES = int(os.environ.get("SCRAPER_HTTP_CACHE_MB", 256)) * 1024 * 1024
+
+
+class HttpCache:
+    def __init__(self, directory: Optional[str] = None, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory or data_path("http-cache")
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(self.directory, "index.db"))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        self.conn.commit()
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def _path(self, url: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(url.encode("utf-8")).hexdigest())
+
+    def validators(self, url: str) -> dict[str, str]:
+        """Conditional request headers for a cached URL, or {} if we have nothing usable."""
+        row = self.conn.execute(
+            "SELECT etag, last_modified FROM entries WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None:
+            return {}
+        etag, last_modified = row
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        return headers
+
+    def load(self, url: str) -> Optional[bytes]:
+        try:
+            with open(self._path(url), "rb") as f:
+                body = zlib.decompress(f.read())
+        except (OSError, zlib.error):
+            self.forget(url)
+            return None
+        self.conn.execute("UPDATE entries SET last_used = ? WHERE url = ?", (time.time(), url))
+        self.conn.commit()
+        return body
+
+    def store(self, url: str, headers: dict, body: bytes):
+        """Cache a 200 response; responses without validators aren't worth keeping."""
+        etag = headers.get("etag")
+        last_modified = headers.get("last-modified")
+        if not etag and not last_modified:
+            self.forget(url)
+            return
+
+        data = zlib.compress(body, 6)
+        with open(self._path(url), "wb") as f:
+            f.write(data)
+
+        previous = self.conn.execute("SELECT size FROM entries WHERE url = ?", (url,)).fetchone()
+        self.total_bytes += len(data) - (previous[0] if previous else 0)
+        self.conn.execute(
+            """
+            INSERT INTO entries (url, etag, last_modified, size, last_used) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(url) DO UPDATE SET
+                etag = excluded.etag,
+                last_modified = excluded.last_modified,
+                size = excluded.size,
+                last_used = excluded.last_used
+            """,
+            (url, etag, last_modified, len(data), time.time()),
+        )
+        self.conn.commit()
+
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def forget(self, url: str):
+        row = self.conn.execute("SELECT size FROM entries WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return
+        self.conn.execute("DELETE FROM entries WHERE url = ?", (url,))
+        self.conn.commit()
+        self.total_bytes -= row[0]
+        try:
+            os.remove(self._path(url))
+        except OSError:
+            pass
+
+    def evict(self):
+        """Drop least recently used bodies until we're back under 90% of the budget."""
+        target = self.max_bytes * 0.9
+        rows = self.conn.execute("SELECT url, size FROM entries ORDER BY last_used").fetchall()
+        evicted = []
+        for url, size in rows:
+            if self.total_bytes <= target:
+                break
+            evicted.append(url)
+            self.total_bytes -= size
+            try:
+                os.remove(self._path(url))
+            except OSError:
+                pass
+        self.conn.executemany("DELETE FROM entries WHERE url = ?", ((url,) for url in evicted))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
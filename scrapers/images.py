@@ -0,0 +1,254 @@
+"""
+Image checks for ad photos before they're sent to gunex.
+
+`ImageProber` only HEADs each photo. `ImageFetcher` downloads it instead, once
+per URL, into a size-bounded content-addressed store, and reports each photo's
+SHA-256 so gunex can recognise a photo it already has (a reposted ad, a seller
+with several listings) without downloading it again.
+"""
+import asyncio
+import hashlib
+import os
+import sqlite3
+import time
+from typing import Optional
+
+from metrics import METRICS
+from pool import HostPool
+from state import ProbeCache, connect, data_path
+
+METRICS.describe("scraper_image_store_bytes", "gauge", "Bytes held in the local image store")
+METRICS.describe("scraper_image_download_bytes_total", "counter", "Image bytes downloaded")
+
+IMAGE_TYPES = ("image/jpeg", "image/png", "image/webp", "image/jpg")
+
+
+class ImageProber:
+    """HEAD-probes image URLs concurrently, at most `limit` at a time, behind a TTL cache."""
+
+    def __init__(self, pool: HostPool, cache: Optional[ProbeCache] = None, limit: int = 16):
+        self.pool = pool
+        self.cache = cache
+        self.limit = asyncio.Semaphore(limit)
+        self.probed = 0
+        self.cached = 0
+
+    async def probe(self, src: str) -> bool:
+        async with self.limit:
+            try:
+                resp = await self.pool.request("HEAD", src, timeout=5)
+            except Exception as e:
+                print(f"\033[93mFailed to fetch image: {src} -- {e}\033[0m")
+                return False
+        if resp.status != 200:
+            print(f"\033[93mImage not fetchable (status {resp.status}): {src}\033[0m")
+            return False
+        return True
+
+    async def fetchable(self, urls: list[str]) -> list[str]:
+        """The subset of `urls` that exist, in their original order."""
+        known = self.cache.get_many(urls) if self.cache else {}
+        missing = [src for src in dict.fromkeys(urls) if src not in known]
+        self.cached += len(urls) - len(missing)
+        self.probed += len(missing)
+        METRICS.inc("scraper_image_probes_total", len(urls) - len(missing), source="cache")
+        METRICS.inc("scraper_image_probes_total", len(missing), source="head")
+
+        results = await asyncio.gather(*(self.probe(src) for src in missing))
+        probed = dict(zip(missing, results))
+        if self.cache and probed:
+            self.cache.put_many(probed)
+
+        ok = {**known, **probed}
+        return [src for src in urls if ok[src]]
+
+    def hashes(self, urls: list[str]) -> Optional[list[str]]:
+        """Probing never sees the bytes, so there are no hashes to report."""
+        return None
+
+    def summary(self) -> str:
+        return f"{self.probed} probed, {self.cached} from cache"
+
+
+class ImageStore:
+    """
+    Image bytes on disk under their SHA-256 (`ab/abcdef...`), with an index of
+    which URL held which bytes. Identical photos at different URLs are stored
+    once. Past `max_bytes` the least recently used blobs are evicted, and URLs
+    that pointed at them are downloaded again when next needed.
+    """
+
+    def __init__(self, directory: str, conn: Optional[sqlite3.Connection] = None, max_bytes: int = 1024 ** 3):
+        self.directory = directory
+        self.conn = conn or connect()
+        self.max_bytes = max_bytes
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS image_urls (
+                url TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS image_blobs (
+                sha256 TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS image_blobs_last_used ON image_blobs (last_used)")
+        self.conn.commit()
+        self.size = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM image_blobs").fetchone()[0]
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, sha256: str) -> str:
+        return os.path.join(self.directory, sha256[:2], sha256)
+
+    def lookup(self, urls: list[str]) -> dict[str, str]:
+        """Hashes of whichever of `urls` are still in the store, marking them used."""
+        if not urls:
+            return {}
+        placeholders = ",".join("?" * len(urls))
+        found = dict(
+            self.conn.execute(
+                f"""
+                SELECT image_urls.url, image_urls.sha256 FROM image_urls
+                JOIN image_blobs ON image_blobs.sha256 = image_urls.sha256
+                WHERE image_urls.url IN ({placeholders})
+                """,
+                urls,
+            )
+        )
+        if found:
+            now = time.time()
+            self.conn.executemany(
+                "UPDATE image_blobs SET last_used = ? WHERE sha256 = ?", ((now, h) for h in set(found.values()))
+            )
+            self.conn.commit()
+        return found
+
+    def put(self, url: str, body: bytes) -> str:
+        sha256 = hashlib.sha256(body).hexdigest()
+        now = time.time()
+        path = self.path(sha256)
+        known = self.conn.execute("SELECT 1 FROM image_blobs WHERE sha256 = ?", (sha256,)).fetchone()
+        if not known:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".part", "wb") as f:
+                f.write(body)
+            os.replace(path + ".part", path)
+            self.size += len(body)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO image_blobs (sha256, size, last_used) VALUES (?, ?, ?)", (sha256, len(body), now)
+        )
+        self.conn.execute(
+            "INSERT OR REPLACE INTO image_urls (url, sha256, fetched_at) VALUES (?, ?, ?)", (url, sha256, now)
+        )
+        self.conn.commit()
+        if self.size > self.max_bytes:
+            self.evict()
+        METRICS.set("scraper_image_store_bytes", self.size)
+        return sha256
+
+    def evict(self):
+        """Drop least recently used blobs until the store is back to 90% of `max_bytes`."""
+        target = self.max_bytes * 0.9
+        evicted = []
+        for sha256, size in self.conn.execute("SELECT sha256, size FROM image_blobs ORDER BY last_used"):
+            if self.size <= target:
+                break
+            evicted.append(sha256)
+            self.size -= size
+        for sha256 in evicted:
+            try:
+                os.remove(self.path(sha256))
+            except FileNotFoundError:
+                pass
+        self.conn.executemany("DELETE FROM image_blobs WHERE sha256 = ?", ((sha256,) for sha256 in evicted))
+        self.conn.execute("DELETE FROM image_urls WHERE sha256 NOT IN (SELECT sha256 FROM image_blobs)")
+        self.conn.commit()
+
+
+class ImageFetcher:
+    """
+    Downloads image URLs concurrently, at most `limit` at a time, into an
+    ImageStore; a URL already in the store isn't downloaded again. Failures go
+    to the ProbeCache, so a missing image isn't retried on every run either.
+    """
+
+    def __init__(self, pool: HostPool, store: ImageStore, failures: Optional[ProbeCache] = None, limit: int = 16):
+        self.pool = pool
+        self.store = store
+        self.failures = failures
+        self.limit = asyncio.Semaphore(limit)
+        self.probed = 0
+        self.cached = 0
+        self.downloaded_bytes = 0
+        # URLs being downloaded right now, so two ads sharing a photo don't both fetch it
+        self._pending: dict[str, asyncio.Future] = {}
+
+    async def download(self, src: str) -> Optional[str]:
+        async with self.limit:
+            try:
+                resp = await self.pool.request("GET", src, timeout=30)
+            except Exception as e:
+                print(f"\033[93mFailed to fetch image: {src} -- {e}\033[0m")
+                return None
+        content_type = resp.headers.get("content-type", "image/jpeg")
+        if resp.status != 200 or not any(kind in content_type for kind in IMAGE_TYPES):
+            print(f"\033[93mImage not fetchable (status {resp.status}, {content_type}): {src}\033[0m")
+            return None
+        self.downloaded_bytes += len(resp.body)
+        METRICS.inc("scraper_image_download_bytes_total", len(resp.body))
+        return self.store.put(src, resp.body)
+
+    async def _fetch(self, src: str) -> Optional[str]:
+        if src not in self._pending:
+            self._pending[src] = asyncio.ensure_future(self.download(src))
+            self._pending[src].add_done_callback(lambda _: self._pending.pop(src, None))
+        return await asyncio.shield(self._pending[src])
+
+    async def fetchable(self, urls: list[str]) -> list[str]:
+        """The subset of `urls` that could be downloaded, in their original order."""
+        unique = list(dict.fromkeys(urls))
+        stored = self.store.lookup(unique)
+        checked = self.failures.get_many([src for src in unique if src not in stored]) if self.failures else {}
+        failed = {src for src, ok in checked.items() if not ok}
+        missing = [src for src in unique if src not in stored and src not in failed]
+        self.cached += len(unique) - len(missing)
+        self.probed += len(missing)
+        METRICS.inc("scraper_image_probes_total", len(unique) - len(missing), source="cache")
+        METRICS.inc("scraper_image_probes_total", len(missing), source="get")
+
+        results = await asyncio.gather(*(self._fetch(src) for src in missing))
+        failures = {src: False for src, sha256 in zip(missing, results) if sha256 is None}
+        if self.failures and failures:
+            self.failures.put_many(failures)
+        ok = {**stored, **{src: sha256 for src, sha256 in zip(missing, results) if sha256}}
+        return [src for src in urls if src in ok]
+
+    def hashes(self, urls: list[str]) -> Optional[list[str]]:
+        """SHA-256 of each of `urls`, which `fetchable` has just stored."""
+        stored = self.store.lookup(list(dict.fromkeys(urls)))
+        if any(src not in stored for src in urls):
+            # Evicted in between; better no hashes than misaligned ones
+            return None
+        return [stored[src] for src in urls]
+
+    def summary(self) -> str:
+        return (
+            f"{self.probed} downloaded ({self.downloaded_bytes / 1024 / 1024:.1f} MB), {self.cached} from cache, "
+            f"store at {self.store.size / 1024 / 1024:.1f} MB"
+        )
+
+
+def image_checker(pool: HostPool, conn: sqlite3.Connection, limit: int = 16, store_mb: float = 0):
+    """An ImageFetcher backed by a `store_mb` image store, or with 0 an ImageProber."""
+    if store_mb <= 0:
+        return ImageProber(pool, ProbeCache(conn), limit=limit)
+    store = ImageStore(data_path("images"), conn, max_bytes=int(store_mb * 1024 * 1024))
+    return ImageFetcher(pool, store, ProbeCache(conn), limit=limit)
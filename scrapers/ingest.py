@@ -0,0 +1,176 @@
+"""
+Batching client for gunex's /api/v1/external-listings.
+
+Ads are buffered and sent as one gzipped JSON array once the batch reaches
+`max_items` ads, `max_bytes` of JSON, or `max_age` seconds. The route answers
+with one UpsertResult per item, in order, which is handed to `on_result`.
+"""
+import asyncio
+import gzip
+import hashlib
+import json
+import time
+from collections import Counter
+from typing import Any, Callable, Optional
+
+from config import GUNEX_API_KEY
+from metrics import METRICS, StageTimer
+from pool import HostPool, backoff_delay, retry_after
+
+INGEST_PATH = "/api/v1/external-listings"
+
+# Called once per ad with (context, action, error); action is "created",
+# "updated" or "error", or "failed" when the batch never got through.
+ResultCallback = Callable[[Any, str, Optional[str]], None]
+
+
+def payload_digest(ad: dict) -> str:
+    """
+    Digest of the parts of an ingest payload a re-publish could change.
+    Key order and whitespace don't matter; createdAt and seller stats don't count.
+    """
+    content = {
+        "title": ad.get("title"),
+        "price": ad.get("price"),
+        "description": ad.get("description"),
+        "properties": ad.get("properties"),
+        "imageUrls": ad.get("external", {}).get("imageUrls"),
+    }
+    encoded = json.dumps(content, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class IngestBatcher:
+    def __init__(
+        self,
+        pool: HostPool,
+        base_url: str,
+        on_result: Optional[ResultCallback] = None,
+        max_items: int = 25,
+        max_bytes: int = 512 * 1024,
+        max_age: float = 5.0,
+        max_in_flight: int = 2,
+        retries: int = 3,
+        timeout: float = 120,
+        timer: Optional[StageTimer] = None,
+    ):
+        self.pool = pool
+        self.url = base_url + INGEST_PATH
+        self.on_result = on_result
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.retries = retries
+        self.timeout = timeout
+        self.timer = timer or StageTimer()
+        self.actions: Counter = Counter()
+        self._buffer: list[tuple[bytes, Any]] = []
+        self._buffer_bytes = 0
+        self._oldest: Optional[float] = None
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._in_flight: set[asyncio.Task] = set()
+        self._ticker: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._ticker = asyncio.create_task(self._flush_stale())
+
+    async def add(self, ad: dict, context: Any = None, timer: Optional[StageTimer] = None):
+        with (timer or self.timer).stage("encode"):
+            encoded = json.dumps(ad, ensure_ascii=False).encode("utf-8")
+        await self.add_encoded(encoded, context)
+
+    async def add_encoded(self, encoded: bytes, context: Any = None):
+        """Queue an ad that's already JSON, e.g. straight from an archive."""
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+        self._buffer.append((encoded, context))
+        self._buffer_bytes += len(encoded)
+        if len(self._buffer) >= self.max_items or self._buffer_bytes >= self.max_bytes:
+            await self.flush()
+
+    async def flush(self):
+        """Hand the current buffer to a sender; waits only if too many batches are in flight."""
+        if not self._buffer:
+            return
+        batch = self._buffer
+        self._buffer, self._buffer_bytes, self._oldest = [], 0, None
+        await self._slots.acquire()
+        task = asyncio.create_task(self._send(batch))
+        self._in_flight.add(task)
+        task.add_done_callback(self._in_flight.discard)
+
+    async def drain(self):
+        """Send everything buffered so far and wait for it, leaving the sink open."""
+        await self.flush()
+        await asyncio.gather(*self._in_flight, return_exceptions=True)
+
+    async def close(self):
+        if self._ticker:
+            self._ticker.cancel()
+            await asyncio.gather(self._ticker, return_exceptions=True)
+        await self.drain()
+
+    async def _flush_stale(self):
+        while True:
+            await asyncio.sleep(self.max_age / 2)
+            if self._oldest is not None and time.monotonic() - self._oldest >= self.max_age:
+                await self.flush()
+
+    async def _send(self, batch: list[tuple[bytes, Any]]):
+        try:
+            await self._post(batch)
+        finally:
+            self._slots.release()
+
+    async def _post(self, batch: list[tuple[bytes, Any]]):
+        body = gzip.compress(b"[" + b",".join(encoded for encoded, _ in batch) + b"]")
+        headers = {"Content-Type": "application/json", "Content-Encoding": "gzip", "x-api-key": GUNEX_API_KEY}
+
+        for attempt in range(self.retries + 1):
+            error, delay = None, backoff_delay(attempt)
+            try:
+                with self.timer.stage("ingest", cpu=False):
+                    response = await self.pool.request(
+                        "POST", self.url, data=body, headers=headers, timeout=self.timeout
+                    )
+            except Exception as e:
+                error = str(e)
+            else:
+                if response.status == 200:
+                    self._report(batch, response.body)
+                    return
+                if response.status == 400 and len(batch) > 1:
+                    # One bad ad fails the whole array; split until it's isolated
+                    middle = len(batch) // 2
+                    await self._post(batch[:middle])
+                    await self._post(batch[middle:])
+                    return
+                error = f"status {response.status}"
+                if response.status < 500 and response.status != 429:
+                    break
+                delay = max(delay, min(retry_after(response) or 0, 60))
+            if attempt < self.retries:
+                METRICS.inc("scraper_retries_total", target="ingest")
+                print(f"\033[93mIngest of {len(batch)} ads failed ({error}), retrying in {delay:.0f}s\033[0m")
+                await asyncio.sleep(delay)
+
+        print(f"\033[91mIngest of {len(batch)} ads failed: {error}\033[0m")
+        for _, context in batch:
+            self._result(context, "failed", error)
+
+    def _report(self, batch: list[tuple[bytes, Any]], body: bytes):
+        try:
+            results = json.loads(body).get("results", [])
+        except (ValueError, AttributeError) as e:
+            print(f"Failed to parse response as JSON: {e}")
+            results = []
+
+        for i, (_, context) in enumerate(batch):
+            result = results[i] if i < len(results) else {}
+            self._result(context, result.get("action", "error"), result.get("error"))
+
+    def _result(self, context: Any, action: str, error: Optional[str]):
+        self.actions[action] += 1
+        METRICS.inc("scraper_ingest_results_total", action=action)
+        if self.on_result:
+            self.on_result(context, action, error)
@@ -0,0 +1,114 @@
+"""
+Stream archived ads (see ad_archive.py) into gunex's /api/v1/external-listings.
+
+    python load_archive.py
+    python load_archive.py /backups/archive --batch 500 --in-flight 4 --gunex-url https://gunex.ca
+
+Files are loaded oldest first, in large gzipped batches, without reading a
+whole file into memory. A file is recorded in `loaded.txt` once every ad in it
+has been answered, so an interrupted load picks up at the first unfinished
+file. Ads gunex rejects are written to `failed-<time>.jsonl.gz`, which can be
+passed back to this script once the cause is fixed.
+"""
+import argparse
+import asyncio
+import gzip
+import os
+import time
+from collections import Counter
+from typing import Optional
+
+from ad_archive import archive_files, read_archive
+from config import GUNEX_URL
+from ingest import IngestBatcher
+from pool import HostPool
+from state import data_path
+
+MANIFEST = "loaded.txt"
+
+
+class Loader:
+    def __init__(self, directory: str, failed_path: str):
+        self.directory = directory
+        self.failed_path = failed_path
+        self.actions: Counter = Counter()
+        self._failed: Optional[gzip.GzipFile] = None
+        manifest = os.path.join(directory, MANIFEST)
+        self.loaded: set[str] = set()
+        if os.path.exists(manifest):
+            with open(manifest, encoding="utf-8") as f:
+                self.loaded = {line.strip() for line in f if line.strip()}
+
+    def result(self, encoded: bytes, action: str, error: Optional[str]):
+        self.actions[action] += 1
+        if action in ("created", "updated"):
+            return
+        if self._failed is None:
+            self._failed = gzip.open(self.failed_path, "wb")
+        self._failed.write(encoded + b"\n")
+
+    def mark_loaded(self, path: str):
+        name = os.path.basename(path)
+        self.loaded.add(name)
+        with open(os.path.join(self.directory, MANIFEST), "a", encoding="utf-8") as f:
+            f.write(name + "\n")
+
+    def close(self):
+        if self._failed is not None:
+            self._failed.close()
+            print(f"\033[93mFailed ads written to {self.failed_path}\033[0m")
+
+
+async def load(args):
+    paths = []
+    for target in args.paths or [data_path("archive")]:
+        paths += archive_files(target) if os.path.isdir(target) else [target]
+    directory = args.paths[0] if args.paths and os.path.isdir(args.paths[0]) else data_path("archive")
+    loader = Loader(directory, os.path.join(directory, f"failed-{time.strftime('%Y%m%d-%H%M%S')}.jsonl.gz"))
+    pending = [path for path in paths if args.reload or os.path.basename(path) not in loader.loaded]
+    print(f"{len(pending)} archive files to load ({len(paths) - len(pending)} already loaded)")
+
+    pool = HostPool(concurrency=args.in_flight)
+    batcher = IngestBatcher(
+        pool,
+        args.gunex_url,
+        on_result=loader.result,
+        max_items=args.batch,
+        max_bytes=int(args.batch_mb * 1024 * 1024),
+        max_in_flight=args.in_flight,
+        timeout=args.timeout,
+    )
+    batcher.start()
+    started = time.monotonic()
+    try:
+        for path in pending:
+            count = 0
+            for encoded in read_archive(path):
+                await batcher.add_encoded(encoded, encoded)
+                count += 1
+            await batcher.drain()
+            loader.mark_loaded(path)
+            elapsed = time.monotonic() - started
+            done = sum(loader.actions.values())
+            print(f"\033[92m{os.path.basename(path)}: {count} ads -- {done} total, {done / elapsed:.0f} ads/s\033[0m")
+    finally:
+        await batcher.close()
+        await pool.close()
+        loader.close()
+    print(", ".join(f"{count} {action}" for action, count in loader.actions.most_common()) or "nothing to load")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="archive directories or files (default: SCRAPER_DATA_DIR/archive)")
+    parser.add_argument("--gunex-url", default=GUNEX_URL)
+    parser.add_argument("--batch", type=int, default=250, help="ads per request")
+    parser.add_argument("--batch-mb", type=float, default=8, help="max uncompressed MB per request")
+    parser.add_argument("--in-flight", type=int, default=4, help="concurrent requests")
+    parser.add_argument("--timeout", type=float, default=600, help="seconds per request")
+    parser.add_argument("--reload", action="store_true", help="load files even if loaded.txt lists them")
+    asyncio.run(load(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Crawl instrumentation.
+
+METRICS is a process-wide registry of counters and gauges that every stage
+writes to. It can be scraped in Prometheus text format from `serve_metrics`,
+and `write_summary` dumps it, with the last run's stage table, as JSON.
+"""
+import json
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Metrics:
+    def __init__(self):
+        self.started = time.time()
+        self.values: dict[str, dict[tuple, float]] = defaultdict(lambda: defaultdict(float))
+        self.kinds: dict[str, str] = {}
+        self.help: dict[str, str] = {}
+        self.lock = threading.Lock()
+
+    def describe(self, name: str, kind: str, text: str):
+        self.kinds[name] = kind
+        self.help[name] = text
+
+    def inc(self, name: str, value: float = 1, **labels):
+        with self.lock:
+            self.values[name][tuple(sorted(labels.items()))] += value
+
+    def set(self, name: str, value: float, **labels):
+        with self.lock:
+            self.values[name][tuple(sorted(labels.items()))] = value
+
+    def render(self) -> str:
+        """Prometheus text exposition format."""
+        lines = []
+        with self.lock:
+            for name in sorted(self.values):
+                lines.append(f"# HELP {name} {self.help.get(name, name)}")
+                lines.append(f"# TYPE {name} {self.kinds.get(name, 'counter')}")
+                for labels, value in sorted(self.values[name].items()):
+                    label_text = ",".join(f'{key}="{val}"' for key, val in labels)
+                    lines.append(f"{name}{{{label_text}}} {value:g}" if label_text else f"{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                name: {
+                    ",".join(f"{key}={val}" for key, val in labels) or "total": value
+                    for labels, value in series.items()
+                }
+                for name, series in self.values.items()
+            }
+
+
+METRICS = Metrics()
+METRICS.describe("scraper_runs_total", "counter", "Crawl runs finished")
+METRICS.describe("scraper_last_run_timestamp_seconds", "gauge", "When the last crawl run finished")
+METRICS.describe("scraper_last_run_duration_seconds", "gauge", "Wall time of the last crawl run")
+METRICS.describe("scraper_ads_total", "counter", "Ads by what happened to them")
+METRICS.describe("scraper_listing_skipped_total", "counter", "Ads dropped from the listing page, by reason")
+METRICS.describe("scraper_http_requests_total", "counter", "HTTP requests by host, method and status")
+METRICS.describe("scraper_http_bytes_total", "counter", "Response bytes downloaded by host")
+METRICS.describe("scraper_retries_total", "counter", "Retried requests by target")
+METRICS.describe("scraper_circuit_state", "gauge", "Circuit breaker state by host: 0 closed, 1 open, 2 half-open")
+METRICS.describe("scraper_circuit_opens_total", "counter", "Times a host's circuit opened")
+METRICS.describe("scraper_ingest_results_total", "counter", "Ingest UpsertResult actions")
+METRICS.describe("scraper_image_probes_total", "counter", "Image checks by source")
+METRICS.describe("scraper_stage_seconds_total", "counter", "Wall time spent per pipeline stage")
+METRICS.describe("scraper_stage_cpu_seconds_total", "counter", "CPU time spent per non-awaiting stage")
+METRICS.describe("scraper_stage_calls_total", "counter", "Times each pipeline stage ran")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] == "/metrics":
+            body = METRICS.render().encode("utf-8")
+            content_type = "text/plain; version=0.0.4"
+        elif self.path.split("?", 1)[0] == "/metrics.json":
+            body = json.dumps(METRICS.snapshot()).encode("utf-8")
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serve /metrics and /metrics.json from a daemon thread."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics").start()
+    print(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
+
+
+def write_summary(path: Optional[str], timer: "StageTimer", run: dict):
+    """Print one JSON line for this run and, if `path` is set, keep it there too."""
+    summary = {
+        "time": time.time(),
+        "run": run,
+        "stages": {
+            name: {
+                "calls": timer.calls[name],
+                "wall": round(timer.wall[name], 4),
+                "cpu": round(timer.cpu[name], 4) if name in timer.cpu else None,
+            }
+            for name in timer.calls
+        },
+        "totals": METRICS.snapshot(),
+    }
+    line = json.dumps(summary)
+    print(line)
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+class StageTimer:
+    """
+    Wall and CPU time spent per pipeline stage.
+
+    CPU time is only meaningful for stages that don't await (parsing,
+    normalizing); for awaited stages it would include whatever other tasks ran
+    in the meantime, so `cpu=False` records wall time alone.
+    """
+
+    def __init__(self):
+        self.wall: dict[str, float] = defaultdict(float)
+        self.cpu: dict[str, float] = defaultdict(float)
+        self.calls: dict[str, int] = defaultdict(int)
+
+    @contextmanager
+    def stage(self, name: str, cpu: bool = True):
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time() if cpu else 0.0
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            self.wall[name] += wall
+            METRICS.inc("scraper_stage_seconds_total", wall, stage=name)
+            if cpu:
+                used = time.thread_time() - cpu_start
+                self.cpu[name] += used
+                METRICS.inc("scraper_stage_cpu_seconds_total", used, stage=name)
+            self.calls[name] += 1
+            METRICS.inc("scraper_stage_calls_total", stage=name)
+
+    def add_cpu(self, name: str, seconds: float):
+        """CPU time a stage spent outside this process, e.g. in a parse worker."""
+        self.cpu[name] += seconds
+        METRICS.inc("scraper_stage_cpu_seconds_total", seconds, stage=name)
+
+    def table(self) -> str:
+        lines = [f"{'stage':<10} {'calls':>7} {'wall s':>9} {'cpu s':>9} {'cpu ms/call':>12}"]
+        for name in sorted(self.calls, key=lambda n: -self.wall[n]):
+            calls = self.calls[name]
+            cpu = self.cpu.get(name)
+            cpu_s = f"{cpu:>9.3f}" if cpu is not None else f"{'-':>9}"
+            per_call = f"{cpu / calls * 1000:>12.2f}" if cpu is not None else f"{'-':>12}"
+            lines.append(f"{name:<10} {calls:>7} {self.wall[name]:>9.3f} {cpu_s} {per_call}")
+        return "\n".join(lines)
@@ -0,0 +1,54 @@
+"""
+Lookups of scraped free-text values (calibers, categories) into our vocabularies.
+"""
+import re
+from collections import Counter
+from typing import Optional
+
+_NOT_KEY = re.compile(r"[\W_]+")
+
+
+def canonical_key(text: str) -> str:
+    """Case-folded with punctuation and whitespace removed: "9mm Luger" and "9 mm Luger." agree."""
+    return _NOT_KEY.sub("", text.casefold())
+
+
+class CanonicalIndex:
+    """
+    A mapping looked up by canonical key, built once.
+
+    Exact keys still win, so a canonical collision can never change a value that
+    used to resolve. Resolutions are memoized per raw string, and misses are
+    counted for `report` instead of being logged per ad.
+    """
+
+    def __init__(self, name: str, mapping: dict[str, str]):
+        self.name = name
+        self.exact = mapping
+        self.index: dict[str, str] = {}
+        for key, value in mapping.items():
+            self.index.setdefault(canonical_key(key), value)
+        self.misses: Counter = Counter()
+        self._memo: dict[str, Optional[str]] = {}
+
+    def get(self, value: str) -> Optional[str]:
+        try:
+            resolved = self._memo[value]
+        except KeyError:
+            resolved = self.exact.get(value)
+            if resolved is None:
+                resolved = self.index.get(canonical_key(value))
+            self._memo[value] = resolved
+        if resolved is None:
+            self.misses[value] += 1
+        return resolved
+
+    def report(self):
+        """Print and reset this run's misses, most frequent first."""
+        if not self.misses:
+            return
+        total = sum(self.misses.values())
+        print(f"\033[93mUnknown {self.name}: {len(self.misses)} values, {total} ads\033[0m")
+        for value, count in self.misses.most_common():
+            print(f"\033[93m  {count:>5}  {value}\033[0m")
+        self.misses.clear()
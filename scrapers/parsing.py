@@ -0,0 +1,69 @@
+"""
+HTML parsing for the scrapers.
+
+Pages are parsed with lxml when it's installed (SCRAPER_PARSER overrides the
+choice), and only the regions we actually read are turned into a tree, the way
+a SoupStrainer would: everything outside them is skipped while parsing.
+"""
+import os
+from typing import Optional
+
+from bs4 import BeautifulSoup
+from bs4.filter import ElementFilter
+
+try:
+    import lxml  # noqa: F401
+
+    BACKENDS = ["lxml", "html.parser"]
+except ImportError:
+    BACKENDS = ["html.parser"]
+
+DEFAULT_BACKEND = os.environ.get("SCRAPER_PARSER", BACKENDS[0])
+
+
+class Regions(ElementFilter):
+    """
+    Restrict tree building to elements matching any of a few simple selectors:
+    `tag`, `tag.class` or `tag#id`. Matching elements keep their whole subtree.
+    """
+
+    def __init__(self, *selectors: str):
+        super().__init__()
+        self.selectors = selectors
+        self.rules: list[tuple[str, Optional[str], Optional[str]]] = []
+        for selector in selectors:
+            if "#" in selector:
+                tag, element_id = selector.split("#", 1)
+                self.rules.append((tag, None, element_id))
+            elif "." in selector:
+                tag, cls = selector.split(".", 1)
+                self.rules.append((tag, cls, None))
+            else:
+                self.rules.append((selector, None, None))
+
+    def allow_tag_creation(self, nsprefix, name, attrs) -> bool:
+        attrs = attrs or {}
+        for tag, cls, element_id in self.rules:
+            if name != tag:
+                continue
+            if element_id is not None and attrs.get("id") != element_id:
+                continue
+            if cls is not None:
+                classes = attrs.get("class") or ""
+                if isinstance(classes, str):
+                    classes = classes.split()
+                if cls not in classes:
+                    continue
+            return True
+        return False
+
+    def allow_string_creation(self, string: str) -> bool:
+        # Only called for text outside every region
+        return False
+
+    def __repr__(self) -> str:
+        return f"Regions{self.selectors!r}"
+
+
+def make_soup(html, regions: Optional[Regions] = None, backend: Optional[str] = None) -> BeautifulSoup:
+    return BeautifulSoup(html, backend or DEFAULT_BACKEND, parse_only=regions)
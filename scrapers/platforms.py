@@ -0,0 +1,16 @@
+"""
+Every marketplace the scraper can crawl, keyed by its `external.platform`.
+"""
+from gunpost import GunpostScraper
+from scraper import Scraper
+
+PLATFORMS: dict[str, type[Scraper]] = {
+    GunpostScraper.platform: GunpostScraper,
+}
+
+
+def load_scrapers(names: list[str]) -> list[Scraper]:
+    unknown = [name for name in names if name not in PLATFORMS]
+    if unknown:
+        raise ValueError(f"Unknown platforms: {', '.join(unknown)} (known: {', '.join(PLATFORMS)})")
+    return [PLATFORMS[name]() for name in names]
@@ -0,0 +1,249 @@
+"""
+Pooled HTTP transport shared by every scraper stage.
+"""
+import asyncio
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from metrics import METRICS
+
+
+@dataclass
+class Fetched:
+    url: str
+    status: int
+    headers: dict  # lower-cased names
+    body: bytes
+    # Answered 304, with `body` read back from the HTTP cache
+    not_modified: bool = False
+
+    @property
+    def text(self) -> str:
+        return self.body.decode("utf-8", errors="replace")
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """Exponential backoff with equal jitter: half the step fixed, half random, so retries don't sync up."""
+    step = min(cap, base * 2 ** attempt)
+    return step / 2 + random.uniform(0, step / 2)
+
+
+def retry_after(response: "Fetched") -> Optional[float]:
+    value = response.headers.get("retry-after")
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None  # an HTTP date; rare enough to fall back to our own backoff
+
+
+class RateLimiter:
+    """
+    Token bucket per host: `rate` requests per second on average, with bursts of
+    up to `burst` requests. A rate of 0 leaves the host unlimited. Tokens are
+    reserved in arrival order, so waiting requests go out first come, first served.
+    """
+
+    def __init__(self, rate: float = 0.0, burst: Optional[float] = None):
+        self.default = rate
+        self.default_burst = burst
+        self.rates: dict[str, tuple[float, float]] = {}
+        self._buckets: dict[str, tuple[float, float]] = {}  # host -> (tokens, updated)
+
+    def set_rate(self, host: str, rate: float, burst: Optional[float] = None):
+        self.rates[host] = (rate, burst or max(1.0, rate))
+
+    def _limits(self, host: str) -> tuple[float, float]:
+        if host in self.rates:
+            return self.rates[host]
+        return self.default, self.default_burst or max(1.0, self.default)
+
+    async def acquire(self, host: str):
+        rate, burst = self._limits(host)
+        if rate <= 0:
+            return
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(host, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate) - 1
+        self._buckets[host] = (tokens, now)
+        if tokens < 0:
+            await asyncio.sleep(-tokens / rate)
+
+
+@dataclass
+class _Circuit:
+    state: str = "closed"  # closed, open or half-open
+    failures: int = 0
+    opened_at: float = 0.0
+    cooldown: float = 0.0
+    probe_started: float = 0.0
+    changed: asyncio.Event = field(default_factory=asyncio.Event)
+
+
+class CircuitBreaker:
+    """
+    Per-host circuit breaker.
+
+    After `threshold` consecutive failures (errors, timeouts, 429s and 5xx) the
+    host's circuit opens and requests to it wait instead of being sent, which
+    pauses whatever depends on that host. After `cooldown` seconds a single probe
+    request goes through: success closes the circuit and releases the waiters,
+    failure reopens it for twice as long, up to `max_cooldown`.
+    """
+
+    STATES = {"closed": 0, "open": 1, "half-open": 2}
+
+    def __init__(self, threshold: int = 5, cooldown: float = 5.0, max_cooldown: float = 300.0, probe_timeout: float = 60.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.probe_timeout = probe_timeout
+        self._circuits: dict[str, _Circuit] = {}
+
+    def _circuit(self, host: str) -> _Circuit:
+        circuit = self._circuits.get(host)
+        if circuit is None:
+            circuit = self._circuits[host] = _Circuit(cooldown=self.cooldown)
+        return circuit
+
+    def _move(self, host: str, circuit: _Circuit, state: str):
+        circuit.state = state
+        METRICS.set("scraper_circuit_state", self.STATES[state], host=host)
+        # Wake everyone waiting on the old state
+        circuit.changed.set()
+        circuit.changed = asyncio.Event()
+
+    async def before(self, host: str):
+        """Wait until a request to `host` may be sent."""
+        while True:
+            circuit = self._circuit(host)
+            now = time.monotonic()
+            if circuit.state == "closed":
+                return
+            if circuit.state == "open":
+                wait = circuit.opened_at + circuit.cooldown - now
+            else:
+                wait = circuit.probe_started + self.probe_timeout - now
+            if wait <= 0:
+                # This request is the probe (or replaces one that never reported back)
+                circuit.probe_started = now
+                self._move(host, circuit, "half-open")
+                return
+            try:
+                await asyncio.wait_for(circuit.changed.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def record(self, host: str, ok: bool):
+        circuit = self._circuit(host)
+        if ok:
+            if circuit.state != "closed":
+                print(f"\033[92m{host} is back, closing its circuit\033[0m")
+                circuit.cooldown = self.cooldown
+                self._move(host, circuit, "closed")
+            circuit.failures = 0
+            return
+
+        circuit.failures += 1
+        if circuit.state == "half-open":
+            circuit.cooldown = min(circuit.cooldown * 2, self.max_cooldown)
+            print(f"\033[91m{host} is still failing, pausing it for {circuit.cooldown:.0f}s\033[0m")
+        elif circuit.state == "closed" and circuit.failures >= self.threshold:
+            print(f"\033[91m{host} failed {circuit.failures} times in a row, pausing it for {circuit.cooldown:.0f}s\033[0m")
+        else:
+            return
+        circuit.opened_at = time.monotonic()
+        METRICS.inc("scraper_circuit_opens_total", host=host)
+        self._move(host, circuit, "open")
+
+
+class HostPool:
+    """
+    One keep-alive aiohttp session per host, each with its own concurrency cap.
+    Every request goes through the shared rate limiter and circuit breaker, and
+    idempotent ones (GET, HEAD) are retried with jittered exponential backoff
+    on errors, timeouts, 429s and 5xx.
+    """
+
+    IDEMPOTENT = ("GET", "HEAD")
+
+    def __init__(
+        self,
+        concurrency: int = 8,
+        per_host: Optional[dict[str, int]] = None,
+        timeout: float = 30,
+        limiter: Optional[RateLimiter] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        retries: int = 2,
+    ):
+        self.concurrency = concurrency
+        self.per_host = per_host or {}
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.limiter = limiter or RateLimiter()
+        self.breaker = breaker or CircuitBreaker()
+        self.retries = retries
+        self._sessions: dict[str, aiohttp.ClientSession] = {}
+
+    def session(self, url: str) -> aiohttp.ClientSession:
+        host = urlsplit(url).netloc
+        session = self._sessions.get(host)
+        if session is None:
+            limit = self.per_host.get(host, self.concurrency)
+            connector = aiohttp.TCPConnector(limit=limit, limit_per_host=limit, ttl_dns_cache=300)
+            session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+            self._sessions[host] = session
+        return session
+
+    async def request(
+        self, method: str, url: str, timeout: Optional[float] = None, retries: Optional[int] = None, **kwargs
+    ) -> Fetched:
+        """
+        Returns the final response whatever its status; raises only if the last
+        attempt failed without one. `retries` defaults to `self.retries` for
+        idempotent methods and 0 otherwise.
+        """
+        if timeout is not None:
+            kwargs["timeout"] = aiohttp.ClientTimeout(total=timeout)
+        if retries is None:
+            retries = self.retries if method in self.IDEMPOTENT else 0
+        host = urlsplit(url).netloc
+
+        for attempt in range(retries + 1):
+            await self.breaker.before(host)
+            await self.limiter.acquire(host)
+            try:
+                response = await self._send(host, method, url, **kwargs)
+            except Exception:
+                self.breaker.record(host, False)
+                if attempt == retries:
+                    raise
+                delay = backoff_delay(attempt)
+            else:
+                failed = response.status == 429 or response.status >= 500
+                self.breaker.record(host, not failed)
+                if not failed or attempt == retries:
+                    return response
+                delay = max(backoff_delay(attempt), min(retry_after(response) or 0, 60))
+            METRICS.inc("scraper_retries_total", target=host)
+            await asyncio.sleep(delay)
+
+    async def _send(self, host: str, method: str, url: str, **kwargs) -> Fetched:
+        try:
+            async with self.session(url).request(method, url, **kwargs) as response:
+                body = await response.read()
+                headers = {name.lower(): value for name, value in response.headers.items()}
+        except Exception:
+            METRICS.inc("scraper_http_requests_total", host=host, method=method, status="error")
+            raise
+        METRICS.inc("scraper_http_requests_total", host=host, method=method, status=response.status)
+        METRICS.inc("scraper_http_bytes_total", len(body), host=host)
+        return Fetched(str(response.url), response.status, headers, body)
+
+    async def close(self):
+        for session in self._sessions.values():
+            await session.close()
+        self._sessions.clear()
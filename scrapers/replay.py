@@ -0,0 +1,187 @@
+"""
+Record gunpost traffic into a fixture archive, then replay the crawler against it.
+
+    python replay.py record fixtures/ --pages 3
+    python replay.py replay fixtures/ --concurrency 8 --latency 1
+    python replay.py replay fixtures/ --parse-workers 4
+
+Recording captures listing pages, ad pages and image HEAD responses, along with
+how long each took. Replaying serves them from the archive, optionally delayed
+by `--latency` times the recorded time. In both modes ingest POSTs go to a
+local stub of GUNEX_URL, so no Next.js server is needed. Each run reports
+ads/s, p50/p95 per-ad latency and time spent in each pipeline stage.
+"""
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import io
+import json
+import os
+import time
+import zlib
+from typing import Optional
+
+from aiohttp import web
+
+from crawler import crawl, start_parse_pool
+from metrics import percentile
+from pool import Fetched, HostPool
+
+RECORDED_METHODS = ("GET", "HEAD")
+
+
+class Archive:
+    """A directory holding `index.jsonl` plus one zlib-compressed body per response."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.bodies = os.path.join(directory, "bodies")
+        self.index_path = os.path.join(directory, "index.jsonl")
+        self.entries: dict[tuple[str, str], dict] = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, encoding="utf-8") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self.entries[(entry["method"], entry["url"])] = entry
+
+    def _body_path(self, method: str, url: str) -> str:
+        return os.path.join(self.bodies, hashlib.sha1(f"{method} {url}".encode("utf-8")).hexdigest())
+
+    def add(self, method: str, url: str, response: Fetched, elapsed: float):
+        os.makedirs(self.bodies, exist_ok=True)
+        with open(self._body_path(method, url), "wb") as f:
+            f.write(zlib.compress(response.body))
+        entry = {
+            "method": method,
+            "url": url,
+            "status": response.status,
+            "headers": response.headers,
+            "elapsed": elapsed,
+        }
+        self.entries[(method, url)] = entry
+        with open(self.index_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    def get(self, method: str, url: str) -> Optional[tuple[Fetched, float]]:
+        entry = self.entries.get((method, url))
+        if entry is None:
+            return None
+        with open(self._body_path(method, url), "rb") as f:
+            body = zlib.decompress(f.read())
+        return Fetched(url, entry["status"], entry["headers"], body), entry["elapsed"]
+
+
+class RecordingPool(HostPool):
+    def __init__(self, archive: Archive, **kwargs):
+        super().__init__(**kwargs)
+        self.archive = archive
+
+    async def request(self, method: str, url: str, timeout: Optional[float] = None, **kwargs) -> Fetched:
+        start = time.perf_counter()
+        response = await super().request(method, url, timeout=timeout, **kwargs)
+        if method in RECORDED_METHODS:
+            self.archive.add(method, url, response, time.perf_counter() - start)
+        return response
+
+
+class ReplayPool(HostPool):
+    """Answers GET/HEAD from the archive; everything else (the ingest stub) goes over the network."""
+
+    def __init__(self, archive: Archive, latency: float = 0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.archive = archive
+        self.latency = latency
+        self.misses = 0
+
+    async def request(self, method: str, url: str, timeout: Optional[float] = None, **kwargs) -> Fetched:
+        if method not in RECORDED_METHODS:
+            return await super().request(method, url, timeout=timeout, **kwargs)
+        hit = self.archive.get(method, url)
+        if hit is None:
+            self.misses += 1
+            return Fetched(url, 404, {}, b"")
+        response, elapsed = hit
+        if self.latency:
+            await asyncio.sleep(elapsed * self.latency)
+        return response
+
+
+async def start_ingest_stub(latency: float = 0.0) -> tuple[web.AppRunner, str]:
+    """A stand-in for /api/v1/external-listings that accepts every ad."""
+
+    async def ingest(request: web.Request) -> web.Response:
+        items = await request.json()
+        if latency:
+            await asyncio.sleep(latency * len(items))
+        results = [{"action": "created"} for _ in items]
+        return web.json_response({"success": True, "results": results, "processed": len(results)})
+
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_post("/api/v1/external-listings", ingest)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    host, port = runner.addresses[0][:2]
+    return runner, f"http://{host}:{port}"
+
+
+async def run(args):
+    archive = Archive(args.archive)
+    if args.mode == "record":
+        pool = RecordingPool(archive, concurrency=args.concurrency)
+    else:
+        pool = ReplayPool(archive, latency=args.latency, concurrency=args.concurrency)
+
+    runner, stub_url = await start_ingest_stub(args.ingest_latency)
+    parse_pool = start_parse_pool(args.parse_workers)
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    cpu_start = time.process_time()
+    try:
+        with output:
+            crawler = await crawl(
+                pages=args.pages,
+                concurrency=args.concurrency,
+                use_state=False,
+                use_cache=False,
+                pool=pool,
+                gunex_url=stub_url,
+                parse_pool=parse_pool,
+                parse_workers=args.parse_workers,
+            )
+    finally:
+        await runner.cleanup()
+        if parse_pool:
+            parse_pool.shutdown()
+    cpu = time.process_time() - cpu_start
+
+    stats = crawler.stats
+    elapsed = time.monotonic() - stats.started
+    print(f"{args.mode}: {stats.pages} pages, {stats.ads_seen} ads, {stats.published} published, {stats.failed} failed")
+    if args.mode == "record":
+        print(f"{len(archive.entries)} responses in {args.archive}")
+    else:
+        print(f"{pool.misses} requests missing from the archive")
+    print(f"ads/s:        {stats.published / elapsed if elapsed else 0:.1f}")
+    print(f"per-ad p50:   {percentile(stats.latencies, 50) * 1000:.1f} ms")
+    print(f"per-ad p95:   {percentile(stats.latencies, 95) * 1000:.1f} ms")
+    print(f"wall / cpu:   {elapsed:.2f}s / {cpu:.2f}s")
+    print()
+    print(crawler.timer.table())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("mode", choices=["record", "replay"])
+    parser.add_argument("archive", help="fixture archive directory")
+    parser.add_argument("--pages", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.0, help="replay delay as a multiple of recorded time")
+    parser.add_argument("--ingest-latency", type=float, default=0.0, help="stub seconds per ingested ad")
+    parser.add_argument("--parse-workers", type=int, default=0, help="parse ad pages in worker processes")
+    parser.add_argument("--verbose", action="store_true", help="show the crawler's own output")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Adaptive crawl scheduling.
+
+Each run reports how many new ads it found, where the first already-known ad
+sat in the listing, how many requests were throttled and how slow listing pages
+were. From that the schedule picks the next run's depth and the pause before it:
+busy periods are polled every few seconds, quiet ones back off to a few minutes
+(and with the HTTP cache a quiet poll is a single 304), and 429s, 5xx or a
+latency spike push the interval out until gunpost recovers.
+"""
+import math
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class RunReport:
+    duration: float
+    new_ads: int
+    pages: int
+    first_known: Optional[int]  # index of the first known ad in listing order, None if none seen
+    throttled: int  # 429 and 5xx responses
+    listing_latency: Optional[float]  # mean seconds per listing page
+
+
+class AdaptiveSchedule:
+    def __init__(
+        self,
+        first_pages: int = 50,
+        min_pages: int = 1,
+        max_pages: int = 50,
+        ads_per_page: int = 20,
+        min_interval: float = 10,
+        max_interval: float = 300,
+        target_new_ads: float = 5,
+        smoothing: float = 0.3,
+    ):
+        self.min_pages = min_pages
+        self.max_pages = max_pages
+        self.ads_per_page = ads_per_page
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.target_new_ads = target_new_ads
+        self.smoothing = smoothing
+
+        self.pages = first_pages
+        self.base_interval = 60.0  # before backoff
+        self.interval = 60.0
+        self.rate: Optional[float] = None  # new ads per second, smoothed
+        self.latency: Optional[float] = None  # listing page latency, smoothed
+        self.penalty = 1.0
+
+    def _smooth(self, previous: Optional[float], value: float) -> float:
+        return value if previous is None else previous + self.smoothing * (value - previous)
+
+    def observe(self, report: RunReport):
+        """Update depth and interval from the run that just finished."""
+        elapsed = report.duration + self.interval
+        self.rate = self._smooth(self.rate, report.new_ads / elapsed)
+
+        # Depth: enough pages to reach the first known ad with a page to spare,
+        # or twice as deep if this run never got to one
+        if report.first_known is not None:
+            needed = math.ceil((report.first_known + 1) / self.ads_per_page) + 1
+        else:
+            needed = max(report.pages, 1) * 2
+        self.pages = max(self.min_pages, min(self.max_pages, needed))
+
+        # Interval: long enough to expect `target_new_ads`, but a run that found
+        # something new means a burst may be starting, so come back quickly
+        if report.new_ads:
+            self.base_interval = self.min_interval
+        elif self.rate > 0:
+            self.base_interval = max(self.base_interval * 1.5, self.target_new_ads / self.rate)
+        else:
+            self.base_interval = self.base_interval * 1.5
+        self.base_interval = max(self.min_interval, min(self.max_interval, self.base_interval))
+
+        # Back off while the site is struggling
+        slow = (
+            report.listing_latency is not None
+            and self.latency is not None
+            and report.listing_latency > 2 * self.latency
+        )
+        if report.throttled or slow:
+            self.penalty = min(self.penalty * 2, 16)
+        else:
+            self.penalty = max(self.penalty / 2, 1.0)
+        if report.listing_latency is not None:
+            self.latency = self._smooth(self.latency, report.listing_latency)
+
+        self.interval = self.base_interval * self.penalty
+
+    def describe(self) -> str:
+        rate = f"{self.rate * 3600:.0f} new ads/h" if self.rate is not None else "no rate yet"
+        return f"next run in {self.interval:.0f}s, {self.pages} pages ({rate}, backoff x{self.penalty:g})"
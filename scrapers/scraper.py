@@ -0,0 +1,75 @@
+"""
+What the crawler needs to know about one marketplace.
+
+A Scraper only turns pages into data: which URL lists page N, what ads a
+listing page holds, what an ad page says and how that becomes a gunex ingest
+payload. Fetching, caching, rate limiting, scheduling and ingest are shared by
+every platform and live in the crawler, so supporting another site means
+writing one subclass and registering it in `platforms.py`.
+"""
+import hashlib
+import time
+from typing import NamedTuple, Optional
+
+
+class ListingRow(NamedTuple):
+    url: str
+    date: str  # ISO 8601 post date, "" if it couldn't be read
+    digest: str  # changes when the listing snippet does
+    price: Optional[str] = None  # as listed, e.g. "$1,200.00" or "Wanted"
+
+
+class Scraper:
+    platform: str = ""
+    # Requests per second to this platform's hosts, None for the pool default
+    rate: Optional[float] = None
+
+    def hosts(self) -> list[str]:
+        """Hosts this scraper talks to, for per-platform rate limits."""
+        return []
+
+    def listing_url(self, page: int) -> str:
+        raise NotImplementedError
+
+    def parse_listing(self, html: str) -> list[ListingRow]:
+        """The ads on a listing page, newest first."""
+        raise NotImplementedError
+
+    def skip(self, row: ListingRow) -> Optional[str]:
+        """
+        Why an ad can't be published, judging by its listing row alone, or None.
+        Skipped ads are dropped before their ad page is fetched.
+        """
+        if not row.date:
+            return "bad_date"
+        return None
+
+    def last_page(self, html: str) -> Optional[int]:
+        """The number of listing pages, read from a listing page's pager, if it shows one."""
+        return None
+
+    def external_id(self, url: str) -> str:
+        return hashlib.md5(url.encode("utf-8")).hexdigest()
+
+    def parse_detail(self, html: str) -> dict:
+        """Everything `build` needs from an ad page. Must be picklable, it may come from a parse worker."""
+        raise NotImplementedError
+
+    def parse_detail_body(self, body: bytes) -> tuple[dict, float]:
+        """
+        parse_detail for a parse worker process: takes the raw response body and
+        also returns the CPU seconds spent, since the parent can't measure them.
+        """
+        start = time.process_time()
+        page = self.parse_detail(body.decode("utf-8", errors="replace"))
+        return page, time.process_time() - start
+
+    def image_urls(self, page: dict) -> list[str]:
+        return page.get("imageUrls", [])
+
+    def build(self, row: ListingRow, page: dict, image_urls: list[str]) -> Optional[dict]:
+        """The ingest payload for an ad, or None if it shouldn't be published."""
+        raise NotImplementedError
+
+    def report(self):
+        """Print anything worth knowing at the end of a run."""
@@ -0,0 +1,293 @@
+"""
+Local SQLite state for the scraper, kept between runs in SCRAPER_DATA_DIR.
+"""
+import os
+import sqlite3
+import time
+from typing import Iterable, Iterator, Optional
+
+DATA_DIR = os.environ.get("SCRAPER_DATA_DIR", ".")
+
+
+def data_path(name: str) -> str:
+    os.makedirs(DATA_DIR, exist_ok=True)
+    return os.path.join(DATA_DIR, name)
+
+
+def connect(path: Optional[str] = None) -> sqlite3.Connection:
+    conn = sqlite3.connect(path or data_path("state.db"))
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class SeenStore:
+    """
+    Every ad we've finished with, keyed by the md5 `externalId`.
+
+    `summary_hash` is a digest of the ad's listing-page snippet, so an ad whose
+    row changed (new price, bumped date) is treated as unknown again.
+    """
+
+    def __init__(self, conn: Optional[sqlite3.Connection] = None):
+        self.conn = conn or connect()
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS seen_ads (
+                external_id TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                summary_hash TEXT NOT NULL,
+                first_seen REAL NOT NULL,
+                last_seen REAL NOT NULL
+            )
+            """
+        )
+        self.conn.commit()
+
+    def is_known(self, external_id: str, summary_hash: str) -> bool:
+        row = self.conn.execute(
+            "SELECT summary_hash FROM seen_ads WHERE external_id = ?", (external_id,)
+        ).fetchone()
+        return row is not None and row[0] == summary_hash
+
+    def mark(self, external_id: str, url: str, summary_hash: str):
+        now = time.time()
+        self.conn.execute(
+            """
+            INSERT INTO seen_ads (external_id, url, summary_hash, first_seen, last_seen)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(external_id) DO UPDATE SET
+                url = excluded.url,
+                summary_hash = excluded.summary_hash,
+                last_seen = excluded.last_seen
+            """,
+            (external_id, url, summary_hash, now, now),
+        )
+        self.conn.commit()
+
+    def touch(self, external_ids: Iterable[str]):
+        now = time.time()
+        self.conn.executemany(
+            "UPDATE seen_ads SET last_seen = ? WHERE external_id = ?",
+            ((now, external_id) for external_id in external_ids),
+        )
+        self.conn.commit()
+
+    def forget(self, external_ids: Iterable[str]):
+        self.conn.executemany(
+            "DELETE FROM seen_ads WHERE external_id = ?", ((external_id,) for external_id in external_ids)
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+class PublishedStore:
+    """
+    Digest of the last payload gunex accepted for each `externalId`.
+    An ad whose normalized content hasn't changed since is not sent again.
+    It is also the list of ads gunex shows as active, which the sweep checks
+    against the platform.
+    """
+
+    def __init__(self, conn: Optional[sqlite3.Connection] = None):
+        self.conn = conn or connect()
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS published_ads (
+                external_id TEXT PRIMARY KEY,
+                digest TEXT NOT NULL,
+                published_at REAL NOT NULL,
+                platform TEXT NOT NULL DEFAULT 'gunpost'
+            )
+            """
+        )
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(published_ads)")}
+        if "platform" not in columns:
+            # Tables from before there was more than one platform only hold gunpost ads
+            self.conn.execute("ALTER TABLE published_ads ADD COLUMN platform TEXT NOT NULL DEFAULT 'gunpost'")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS published_ads_platform ON published_ads (platform)")
+        self.conn.commit()
+
+    def digest(self, external_id: str) -> Optional[str]:
+        row = self.conn.execute(
+            "SELECT digest FROM published_ads WHERE external_id = ?", (external_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def mark(self, external_id: str, digest: str, platform: str = "gunpost"):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO published_ads (external_id, digest, published_at, platform) VALUES (?, ?, ?, ?)",
+            (external_id, digest, time.time(), platform),
+        )
+        self.conn.commit()
+
+    def ids(self, platform: str) -> Iterator[str]:
+        """Every ad published for `platform`, streamed rather than loaded at once."""
+        for (external_id,) in self.conn.execute("SELECT external_id FROM published_ads WHERE platform = ?", (platform,)):
+            yield external_id
+
+    def count(self, platform: str) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM published_ads WHERE platform = ?", (platform,)).fetchone()[0]
+
+    def forget(self, external_ids: Iterable[str]):
+        self.conn.executemany(
+            "DELETE FROM published_ads WHERE external_id = ?", ((external_id,) for external_id in external_ids)
+        )
+        self.conn.commit()
+
+
+class MissingAds:
+    """
+    Published ads the last sweeps didn't find on their platform. An ad is only
+    taken down once it has been missing from `confirm` sweeps in a row, so one
+    listing page that shifted mid-sweep doesn't remove anything.
+    """
+
+    def __init__(self, conn: Optional[sqlite3.Connection] = None, platform: str = "gunpost", confirm: int = 2):
+        self.conn = conn or connect()
+        self.platform = platform
+        self.confirm = confirm
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS missing_ads (
+                external_id TEXT PRIMARY KEY,
+                platform TEXT NOT NULL,
+                sweeps INTEGER NOT NULL,
+                first_missing REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sweep_listings (
+                platform TEXT PRIMARY KEY,
+                listed INTEGER NOT NULL,
+                swept_at REAL NOT NULL
+            )
+            """
+        )
+        self.conn.commit()
+
+    def last_listed(self) -> Optional[int]:
+        """How many ads the platform listed at the last sweep that went through."""
+        row = self.conn.execute("SELECT listed FROM sweep_listings WHERE platform = ?", (self.platform,)).fetchone()
+        return row[0] if row else None
+
+    def set_listed(self, listed: int):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO sweep_listings (platform, listed, swept_at) VALUES (?, ?, ?)",
+            (self.platform, listed, time.time()),
+        )
+        self.conn.commit()
+
+    def record(self, missing: set[str]) -> list[str]:
+        """Count this sweep's missing ads and return those missing for long enough."""
+        previous = dict(
+            self.conn.execute("SELECT external_id, sweeps FROM missing_ads WHERE platform = ?", (self.platform,))
+        )
+        now = time.time()
+        # Back on the platform since the last sweep
+        self.conn.executemany(
+            "DELETE FROM missing_ads WHERE external_id = ?",
+            ((external_id,) for external_id in previous if external_id not in missing),
+        )
+        self.conn.executemany(
+            """
+            INSERT INTO missing_ads (external_id, platform, sweeps, first_missing) VALUES (?, ?, 1, ?)
+            ON CONFLICT(external_id) DO UPDATE SET sweeps = sweeps + 1
+            """,
+            ((external_id, self.platform, now) for external_id in missing),
+        )
+        self.conn.commit()
+        return [external_id for external_id in missing if previous.get(external_id, 0) + 1 >= self.confirm]
+
+    def forget(self, external_ids: Iterable[str]):
+        self.conn.executemany(
+            "DELETE FROM missing_ads WHERE external_id = ?", ((external_id,) for external_id in external_ids)
+        )
+        self.conn.commit()
+
+
+class BackfillCheckpoint:
+    """
+    Listing pages a backfill has finished, i.e. read and with every ad on them
+    done. Finished ads themselves are checkpointed by SeenStore.
+    """
+
+    def __init__(self, conn: Optional[sqlite3.Connection] = None, name: str = "gunpost"):
+        self.conn = conn or connect()
+        self.name = name
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS backfill_pages (
+                name TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                ads INTEGER NOT NULL,
+                done_at REAL NOT NULL,
+                PRIMARY KEY (name, page)
+            )
+            """
+        )
+        self.conn.commit()
+
+    def done_pages(self) -> set[int]:
+        rows = self.conn.execute("SELECT page FROM backfill_pages WHERE name = ?", (self.name,))
+        return {page for (page,) in rows}
+
+    def mark_page(self, page: int, ads: int):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO backfill_pages (name, page, ads, done_at) VALUES (?, ?, ?, ?)",
+            (self.name, page, ads, time.time()),
+        )
+        self.conn.commit()
+
+    def reset(self):
+        self.conn.execute("DELETE FROM backfill_pages WHERE name = ?", (self.name,))
+        self.conn.commit()
+
+
+class ProbeCache:
+    """
+    Results of image HEAD probes, keyed by the final (`dad_large`) URL.
+    Failures expire much sooner than successes so a briefly missing image gets another chance.
+    """
+
+    def __init__(self, conn: Optional[sqlite3.Connection] = None, ttl: float = 7 * 86400, failure_ttl: float = 3600):
+        self.conn = conn or connect()
+        self.ttl = ttl
+        self.failure_ttl = failure_ttl
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS image_probes (
+                url TEXT PRIMARY KEY,
+                ok INTEGER NOT NULL,
+                checked_at REAL NOT NULL
+            )
+            """
+        )
+        self.conn.commit()
+
+    def get_many(self, urls: list[str]) -> dict[str, bool]:
+        """Fresh cached results for whichever of `urls` we have."""
+        if not urls:
+            return {}
+        now = time.time()
+        placeholders = ",".join("?" * len(urls))
+        rows = self.conn.execute(
+            f"SELECT url, ok, checked_at FROM image_probes WHERE url IN ({placeholders})", urls
+        ).fetchall()
+        return {
+            url: bool(ok)
+            for url, ok, checked_at in rows
+            if now - checked_at < (self.ttl if ok else self.failure_ttl)
+        }
+
+    def put_many(self, results: dict[str, bool]):
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO image_probes (url, ok, checked_at) VALUES (?, ?, ?)",
+            ((url, int(ok), now) for url, ok in results.items()),
+        )
+        self.conn.commit()
@@ -0,0 +1,260 @@
+"""
+Take down ads that are no longer listed on their platform.
+
+    python sweep.py                          # sweep every platform once
+    python sweep.py --platforms gunpost --dry-run
+
+A sweep reads only listing pages, never ad pages: every `externalId` the
+platform currently lists goes into a Bloom filter, and every ad we have
+published is checked against it. An ad the filter has never seen is definitely
+gone from the listings; a false positive only keeps a sold ad up for one more
+sweep, never removes a live one. Ads missing from `--confirm` sweeps in a row
+are marked "removed" in gunex in batched PATCH requests, and forgotten
+locally, so one that comes back is published again as new.
+
+A listing that comes back much shorter than at the last sweep is more likely
+broken than sold out, so the sweep is refused. A sweep that finds an unusual
+share of published ads missing is logged and counted in
+scraper_sweep_mass_removals_total, but it goes ahead. After a long outage, many
+ads really have been sold. The first sweep has nothing to compare against, so
+past `--max-removed` it only records how long the listing was and removes
+nothing. The next sweep then has a size to check against.
+
+The crawler runs this on its own every SCRAPER_SWEEP_HOURS, if set (it's off
+by default).
+"""
+import argparse
+import asyncio
+import hashlib
+import math
+from typing import Iterable
+
+from config import GUNEX_API_KEY, GUNEX_URL
+from ingest import INGEST_PATH
+from metrics import METRICS
+from platforms import PLATFORMS, load_scrapers
+from pool import HostPool
+from scraper import ListingRow, Scraper
+from state import MissingAds, PublishedStore, SeenStore, connect
+
+METRICS.describe("scraper_sweep_listed", "gauge", "Ads listed on the platform at the last sweep")
+METRICS.describe("scraper_sweep_removed_total", "counter", "Ads marked removed in gunex by sweeps")
+METRICS.describe(
+    "scraper_sweep_mass_removals_total", "counter", "Sweeps that found more than --max-removed of published ads missing"
+)
+
+
+class SweepError(Exception):
+    pass
+
+
+class BloomFilter:
+    """A fixed-size set of strings with no false negatives, about 1.8 bytes per item at 0.1% error."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self.capacity = capacity = max(capacity, 1)
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str) -> Iterable[int]:
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+async def read_listing_ids(pool: HostPool, scraper: Scraper, capacity: int, concurrency: int = 8) -> BloomFilter:
+    """
+    Every `externalId` the platform lists. Raises SweepError if any page
+    couldn't be read. The filter is sized for at least `capacity` IDs, or for
+    as many as page 1 and the page count say the listing holds, if more.
+    """
+    response = await pool.request("GET", scraper.listing_url(1))
+    if response.status != 200:
+        raise SweepError(f"page 1: status {response.status}")
+    rows = scraper.parse_listing(response.text)
+    pages = scraper.last_page(response.text)
+    # Headroom for ads listed while the sweep runs, and a last page fuller than expected
+    listed = BloomFilter(int(max(capacity, (pages or 1) * len(rows)) * 1.5))
+
+    def add(rows: list[ListingRow]) -> int:
+        for row in rows:
+            listed.add(scraper.external_id(row.url))
+        return len(rows)
+
+    async def read(page: int) -> int:
+        response = await pool.request("GET", scraper.listing_url(page))
+        if response.status != 200:
+            raise SweepError(f"page {page}: status {response.status}")
+        return add(scraper.parse_listing(response.text))
+
+    add(rows)
+    if pages:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def bounded(page: int) -> int:
+            async with semaphore:
+                return await read(page)
+
+        await asyncio.gather(*(bounded(page) for page in range(2, pages + 1)))
+    else:
+        # No pager: read until the listing runs out
+        page = 2
+        while await read(page):
+            page += 1
+    return listed
+
+
+async def sweep(
+    scraper: Scraper,
+    pool: HostPool,
+    conn,
+    gunex_url: str = GUNEX_URL,
+    concurrency: int = 8,
+    confirm: int = 2,
+    max_removed: float = 0.2,
+    max_drop: float = 0.2,
+    batch: int = 1000,
+    dry_run: bool = False,
+) -> list[str]:
+    """One sweep of `scraper`'s platform; returns the ads marked removed (with `dry_run`, those missing)."""
+    platform = scraper.platform
+    published = PublishedStore(conn)
+    total = published.count(platform)
+    if not total:
+        return []
+    tracker = MissingAds(conn, platform=platform, confirm=confirm)
+    last_listed = tracker.last_listed()
+    # The listing also holds ads never published (wanted, trade, older than our
+    # state), so it's usually far longer than `total`
+    listed = await read_listing_ids(pool, scraper, capacity=max(total, last_listed or 0), concurrency=concurrency)
+    METRICS.set("scraper_sweep_listed", listed.count, platform=platform)
+    if not listed.count:
+        raise SweepError("no ads listed")
+    if listed.count > listed.capacity:
+        # Past its capacity the filter takes more and more missing ads for listed ones. Possible
+        # without a pager to size it from; the next sweep is sized from this one's count
+        if not dry_run:
+            tracker.set_listed(listed.count)
+        raise SweepError(f"{listed.count} ads listed, more than the {listed.capacity} expected, removing none until the next")
+
+    if last_listed and listed.count < last_listed * (1 - max_drop):
+        raise SweepError(f"{listed.count} ads listed, down from {last_listed} at the last sweep, refusing to remove any")
+
+    missing = {external_id for external_id in published.ids(platform) if external_id not in listed}
+    if len(missing) > total * max_removed:
+        if not last_listed:
+            if not dry_run:
+                tracker.set_listed(listed.count)
+            raise SweepError(
+                f"{len(missing)} of {total} published ads missing on a first sweep, removing none until the next"
+            )
+        METRICS.inc("scraper_sweep_mass_removals_total", platform=platform)
+        print(
+            f"\033[93m{platform} sweep: {len(missing)} of {total} published ads missing, "
+            f"more than {max_removed:.0%}; the listing looks whole, so they'll be removed once confirmed\033[0m"
+        )
+
+    if dry_run:
+        print(f"\033[92m{platform} sweep: {listed.count} listed, {len(missing)} of {total} published missing\033[0m")
+        return sorted(missing)
+    tracker.set_listed(listed.count)
+    gone = tracker.record(missing)
+    print(
+        f"\033[92m{platform} sweep: {listed.count} listed, {len(missing)} of {total} published missing, "
+        f"{len(gone)} confirmed gone\033[0m"
+    )
+    if not gone:
+        return gone
+
+    removed = []
+    for start in range(0, len(gone), batch):
+        chunk = gone[start:start + batch]
+        response = await pool.request(
+            "PATCH",
+            gunex_url + INGEST_PATH,
+            json={"platform": platform, "externalIds": chunk, "status": "removed"},
+            headers={"x-api-key": GUNEX_API_KEY},
+            timeout=120,
+            retries=3,
+        )
+        if response.status != 200:
+            # The rest stay missing and are retried next sweep
+            print(f"\033[91m{platform} sweep: status update failed with status {response.status}\033[0m")
+            break
+        removed += chunk
+    published.forget(removed)
+    SeenStore(conn).forget(removed)
+    tracker.forget(removed)
+    METRICS.inc("scraper_sweep_removed_total", len(removed), platform=platform)
+    return removed
+
+
+async def sweep_forever(scraper: Scraper, pool: HostPool, conn, hours: float, gunex_url: str = GUNEX_URL):
+    while True:
+        await asyncio.sleep(hours * 3600)
+        try:
+            await sweep(scraper, pool, conn, gunex_url=gunex_url)
+        except Exception as e:
+            print(f"\033[91m{scraper.platform} sweep failed: {e}\033[0m")
+
+
+async def sweep_once(args):
+    pool = HostPool(concurrency=args.concurrency)
+    conn = connect()
+    try:
+        for scraper in load_scrapers(args.platforms.split(",")):
+            try:
+                removed = await sweep(
+                    scraper,
+                    pool,
+                    conn,
+                    gunex_url=args.gunex_url,
+                    concurrency=args.concurrency,
+                    confirm=args.confirm,
+                    max_removed=args.max_removed,
+                    max_drop=args.max_drop,
+                    dry_run=args.dry_run,
+                )
+            except SweepError as e:
+                print(f"\033[91m{scraper.platform} sweep failed: {e}\033[0m")
+                continue
+            print(f"\033[92m{scraper.platform}: {len(removed)} ads {'missing' if args.dry_run else 'marked removed'}\033[0m")
+    finally:
+        await pool.close()
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--platforms", default=",".join(PLATFORMS))
+    parser.add_argument("--concurrency", type=int, default=8, help="listing pages read at once")
+    parser.add_argument("--confirm", type=int, default=2, help="sweeps an ad must be missing from before it's removed")
+    parser.add_argument(
+        "--max-removed",
+        type=float,
+        default=0.2,
+        help="warn if more than this share of published ads is missing (abort on a first sweep)",
+    )
+    parser.add_argument(
+        "--max-drop",
+        type=float,
+        default=0.2,
+        help="abort if the listing shrank by more than this share since the last sweep",
+    )
+    parser.add_argument("--gunex-url", default=GUNEX_URL)
+    parser.add_argument("--dry-run", action="store_true", help="count missing ads without removing any")
+    asyncio.run(sweep_once(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import asyncio
+import sqlite3
+
+from crawler import Crawler
+from pool import Fetched
+from scraper import ListingRow, Scraper
+from state import SeenStore
+
+
+class FakePlatform(Scraper):
+    platform = "fake"
+
+    def listing_url(self, page: int) -> str:
+        return f"https://fake/ads?page={page}"
+
+    def parse_listing(self, html: str) -> list[ListingRow]:
+        return [ListingRow(*line.split(",")) for line in html.splitlines()]
+
+    def skip(self, row: ListingRow):
+        return "wanted" if row.price == "Wanted" else None
+
+
+class FakePool:
+    def __init__(self, listing: str):
+        self.listing = listing
+
+    async def request(self, method, url, **kwargs):
+        return Fetched(url, 200, {}, self.listing.encode())
+
+
+LISTING = "\n".join(
+    ["https://fake/ad/wanted,2025-01-01,w,Wanted"] + [f"https://fake/ad/{i},2025-01-01,d{i},$100" for i in range(3)]
+)
+
+
+def read_listing(store: SeenStore) -> Crawler:
+    async def run():
+        crawler = Crawler(FakePlatform(), FakePool(LISTING), store=store)
+        await crawler.read_listings(1)
+        return crawler
+
+    return asyncio.run(run())
+
+
+def test_skipped_rows_are_never_new_ads():
+    store = SeenStore(sqlite3.connect(":memory:"))
+    crawler = read_listing(store)
+    assert crawler.run_report().new_ads == 3
+    assert crawler.detail_q.qsize() == 3
+    assert dict(crawler.stats.skipped) == {"wanted": 1}
+
+    # Once the real ads are seen, a run over the same listing has found nothing new
+    for i in range(3):
+        url = f"https://fake/ad/{i}"
+        store.mark(FakePlatform().external_id(url), url, f"d{i}")
+    crawler = read_listing(store)
+    assert crawler.run_report().new_ads == 0
+    assert crawler.detail_q.empty()
+    assert crawler.stats.first_known == 1
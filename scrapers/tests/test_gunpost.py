@@ -0,0 +1,24 @@
+from gunpost import GunpostScraper, unpublished_price
+from scraper import ListingRow
+
+
+def test_unpublished_price_reasons():
+    assert unpublished_price("Wanted") == "wanted"
+    assert unpublished_price("Call for Price") == "call_for_price"
+    assert unpublished_price("Swap / Trade") == "trade"
+    assert unpublished_price("Best offer") == "bad_price"
+    assert unpublished_price("") == "bad_price"
+
+
+def test_publishable_prices_and_rows_without_one_are_not_judged():
+    assert unpublished_price("$1,234.00") is None
+    assert unpublished_price("800") is None
+    assert unpublished_price("FREE") is None
+    assert unpublished_price(None) is None
+
+
+def test_skip_checks_the_price_then_the_date():
+    scraper = GunpostScraper()
+    assert scraper.skip(ListingRow("/ads/a", "2025-01-01", "d", "Wanted")) == "wanted"
+    assert scraper.skip(ListingRow("/ads/a", "", "d", "$100.00")) == "bad_date"
+    assert scraper.skip(ListingRow("/ads/a", "2025-01-01", "d", "$100.00")) is None
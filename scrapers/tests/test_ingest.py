@@ -0,0 +1,67 @@
+import asyncio
+import gzip
+import json
+
+from ingest import IngestBatcher, payload_digest
+from pool import Fetched
+
+
+class FakeGunex:
+    """Answers ingest POSTs like the route: 400 for the whole array if any ad is invalid."""
+
+    def __init__(self):
+        self.batches: list[list[dict]] = []
+        self.keys: list[str] = []
+
+    async def request(self, method, url, data=None, headers=None, timeout=None):
+        ads = json.loads(gzip.decompress(data))
+        self.batches.append(ads)
+        self.keys.append(headers["x-api-key"])
+        if any(ad.get("invalid") for ad in ads):
+            return Fetched(url, 400, {}, b'{"error": "invalid"}')
+        results = [{"action": "created"} for _ in ads]
+        return Fetched(url, 200, {}, json.dumps({"results": results}).encode())
+
+
+def send(ads: list[dict], max_items: int = 25) -> tuple[FakeGunex, dict]:
+    gunex = FakeGunex()
+    results = {}
+
+    def on_result(context, action, error):
+        results[context] = (action, error)
+
+    async def run():
+        batcher = IngestBatcher(gunex, "http://gunex", on_result=on_result, max_items=max_items)
+        for ad in ads:
+            await batcher.add(ad, ad["title"])
+        await batcher.close()
+
+    asyncio.run(run())
+    return gunex, results
+
+
+def test_batches_by_size():
+    gunex, results = send([{"title": f"ad {i}"} for i in range(7)], max_items=3)
+    assert [len(batch) for batch in gunex.batches] == [3, 3, 1]
+    assert set(gunex.keys) == {"secret"}
+    assert all(result == ("created", None) for result in results.values())
+    assert len(results) == 7
+
+
+def test_400_is_split_until_the_bad_ad_is_isolated():
+    ads = [{"title": f"ad {i}"} for i in range(8)]
+    ads[5]["invalid"] = True
+    gunex, results = send(ads, max_items=8)
+    assert results.pop("ad 5") == ("failed", "status 400")
+    assert all(result == ("created", None) for result in results.values())
+    assert len(results) == 7
+    # The good ads are each sent successfully exactly once
+    accepted = [ad["title"] for batch in gunex.batches if not any(a.get("invalid") for a in batch) for ad in batch]
+    assert sorted(accepted) == sorted(f"ad {i}" for i in range(8) if i != 5)
+
+
+def test_payload_digest_ignores_key_order_and_created_at():
+    ad = {"title": "Rifle", "price": 100, "createdAt": "2025-01-01", "external": {"imageUrls": ["a"]}}
+    same = {"external": {"imageUrls": ["a"]}, "createdAt": "2025-02-02", "price": 100, "title": "Rifle"}
+    assert payload_digest(ad) == payload_digest(same)
+    assert payload_digest(ad) != payload_digest({**ad, "price": 90})
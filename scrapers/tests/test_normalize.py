@@ -0,0 +1,33 @@
+from gunpost import caliber, categories_map
+from normalize import CanonicalIndex, canonical_key
+
+
+def test_canonical_key_ignores_case_spacing_and_punctuation():
+    assert canonical_key("9mm Luger") == canonical_key("9 MM luger.") == "9mmluger"
+    assert canonical_key(".30-06 Springfield") == "3006springfield"
+
+
+def test_exact_key_wins_over_a_canonical_collision():
+    index = CanonicalIndex("caliber", {"9 mm": "9mm Luger", "9mm": "9mm Makarov"})
+    assert index.get("9mm") == "9mm Makarov"
+    assert index.get("9 mm") == "9mm Luger"
+    # Not an exact key: resolves to the first key with its canonical form
+    assert index.get("9 MM") == "9mm Luger"
+
+
+def test_misses_are_counted_and_reset_by_report(capsys):
+    index = CanonicalIndex("caliber", {".22 LR": "22 LR"})
+    assert index.get(".22lr") == "22 LR"
+    assert index.get("Unobtainium") is None
+    assert index.get("Unobtainium") is None
+    assert index.misses == {"Unobtainium": 2}
+    index.report()
+    assert "Unobtainium" in capsys.readouterr().out
+    assert not index.misses
+
+
+def test_every_table_key_still_resolves_to_its_own_value():
+    for name, mapping in (("caliber", caliber), ("category", categories_map)):
+        index = CanonicalIndex(name, mapping)
+        for key, value in mapping.items():
+            assert index.get(key) == value
@@ -0,0 +1,125 @@
+import asyncio
+
+import pool
+from pool import CircuitBreaker, RateLimiter
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+        self.slept: list[float] = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float):
+        self.slept.append(seconds)
+
+
+def fake_clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(pool.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(pool.asyncio, "sleep", clock.sleep)
+    return clock
+
+
+def test_rate_limiter_allows_a_burst_then_spaces_requests(monkeypatch):
+    clock = fake_clock(monkeypatch)
+    limiter = RateLimiter(rate=2, burst=3)
+
+    async def run():
+        for _ in range(5):
+            await limiter.acquire("example.com")
+
+    asyncio.run(run())
+    # Three from the bucket, then each waits its turn at 2/s: 0.5s, then 1s
+    assert clock.slept == [0.5, 1.0]
+
+
+def test_rate_limiter_refills_over_time_and_is_per_host(monkeypatch):
+    clock = fake_clock(monkeypatch)
+    limiter = RateLimiter(rate=1, burst=1)
+
+    async def run():
+        await limiter.acquire("a.com")
+        await limiter.acquire("b.com")
+        clock.now += 1
+        await limiter.acquire("a.com")
+
+    asyncio.run(run())
+    assert clock.slept == []
+
+
+def test_rate_limiter_overrides_and_unlimited_hosts(monkeypatch):
+    clock = fake_clock(monkeypatch)
+    limiter = RateLimiter()
+    limiter.set_rate("slow.com", 1)
+
+    async def run():
+        for _ in range(3):
+            await limiter.acquire("fast.com")
+        await limiter.acquire("slow.com")
+        await limiter.acquire("slow.com")
+
+    asyncio.run(run())
+    assert clock.slept == [1.0]
+
+
+def test_circuit_opens_after_threshold_and_probes_after_cooldown(monkeypatch):
+    clock = fake_clock(monkeypatch)
+    breaker = CircuitBreaker(threshold=3, cooldown=5, max_cooldown=15)
+
+    async def run():
+        for _ in range(2):
+            breaker.record("a.com", False)
+        assert breaker._circuit("a.com").state == "closed"
+        breaker.record("a.com", False)
+        assert breaker._circuit("a.com").state == "open"
+
+        # Past the cooldown the next request is let through as the probe
+        clock.now += 5
+        await breaker.before("a.com")
+        assert breaker._circuit("a.com").state == "half-open"
+
+        # A failed probe reopens it for twice as long, capped at max_cooldown
+        breaker.record("a.com", False)
+        assert breaker._circuit("a.com").cooldown == 10
+        clock.now += 10
+        await breaker.before("a.com")
+        breaker.record("a.com", False)
+        assert breaker._circuit("a.com").cooldown == 15
+
+        clock.now += 15
+        await breaker.before("a.com")
+        breaker.record("a.com", True)
+        circuit = breaker._circuit("a.com")
+        assert (circuit.state, circuit.cooldown, circuit.failures) == ("closed", 5, 0)
+        # Other hosts were never affected
+        assert breaker._circuit("b.com").state == "closed"
+
+    asyncio.run(run())
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker(threshold=3)
+    breaker.record("a.com", False)
+    breaker.record("a.com", False)
+    breaker.record("a.com", True)
+    breaker.record("a.com", False)
+    breaker.record("a.com", False)
+    assert breaker._circuit("a.com").state == "closed"
+
+
+def test_waiters_are_released_when_the_probe_succeeds():
+    breaker = CircuitBreaker(threshold=1, cooldown=0.05)
+
+    async def run():
+        breaker.record("a.com", False)
+        await breaker.before("a.com")  # waits out the cooldown, then probes
+        waiter = asyncio.create_task(breaker.before("a.com"))
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        breaker.record("a.com", True)
+        await asyncio.wait_for(waiter, timeout=1)
+
+    asyncio.run(run())
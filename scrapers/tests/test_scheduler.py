@@ -0,0 +1,59 @@
+from scheduler import AdaptiveSchedule, RunReport
+
+
+def report(new_ads=0, pages=1, first_known=0, throttled=0, listing_latency=0.2) -> RunReport:
+    return RunReport(
+        duration=1.0,
+        new_ads=new_ads,
+        pages=pages,
+        first_known=first_known,
+        throttled=throttled,
+        listing_latency=listing_latency,
+    )
+
+
+def test_quiet_runs_back_off_to_the_max_interval():
+    schedule = AdaptiveSchedule(min_interval=10, max_interval=300)
+    intervals = []
+    for _ in range(20):
+        schedule.observe(report())
+        intervals.append(schedule.interval)
+    assert intervals == sorted(intervals)
+    assert intervals[-1] == 300
+
+
+def test_new_ads_bring_the_interval_back_to_the_minimum():
+    schedule = AdaptiveSchedule(min_interval=10)
+    for _ in range(5):
+        schedule.observe(report())
+    assert schedule.interval > 10
+    schedule.observe(report(new_ads=3))
+    assert schedule.interval == 10
+
+
+def test_depth_reaches_the_first_known_ad_with_a_page_to_spare():
+    schedule = AdaptiveSchedule(ads_per_page=20, max_pages=50)
+    schedule.observe(report(first_known=45, pages=3))
+    assert schedule.pages == 4
+    schedule.observe(report(first_known=None, pages=4))
+    assert schedule.pages == 8
+    schedule.observe(report(first_known=None, pages=40))
+    assert schedule.pages == 50
+
+
+def test_throttling_multiplies_the_interval_until_it_stops():
+    schedule = AdaptiveSchedule(min_interval=10)
+    schedule.observe(report(new_ads=1))
+    assert schedule.interval == 10
+    schedule.observe(report(new_ads=1, throttled=2))
+    schedule.observe(report(new_ads=1, throttled=2))
+    assert schedule.interval == 40
+    schedule.observe(report(new_ads=1))
+    assert schedule.interval == 20
+
+
+def test_a_listing_latency_spike_counts_as_throttling():
+    schedule = AdaptiveSchedule(min_interval=10)
+    schedule.observe(report(new_ads=1, listing_latency=0.2))
+    schedule.observe(report(new_ads=1, listing_latency=2.0))
+    assert schedule.penalty == 2
@@ -0,0 +1,137 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from pool import Fetched
+from scraper import ListingRow, Scraper
+from state import MissingAds, PublishedStore
+from sweep import BloomFilter, SweepError, read_listing_ids, sweep
+
+PER_PAGE = 20
+
+
+class FakePlatform(Scraper):
+    """Listing pages are one ad URL per line; with `pager`, page 1 says how many pages there are."""
+
+    platform = "fake"
+
+    def __init__(self, ads: list[str], pager: bool = True):
+        self.ads = ads
+        self.pager = pager
+
+    def listing_url(self, page: int) -> str:
+        return f"https://fake/ads?page={page}"
+
+    def page(self, page: int) -> str:
+        pages = -(-len(self.ads) // PER_PAGE)
+        lines = self.ads[(page - 1) * PER_PAGE:page * PER_PAGE]
+        return "\n".join(([f"pages={pages}"] if self.pager else []) + lines)
+
+    def parse_listing(self, html: str) -> list[ListingRow]:
+        return [ListingRow(line, "2025-01-01", line) for line in html.splitlines() if not line.startswith("pages=")]
+
+    def last_page(self, html: str):
+        first = html.split("\n", 1)[0]
+        return int(first.removeprefix("pages=")) if first.startswith("pages=") else None
+
+    def external_id(self, url: str) -> str:
+        return url
+
+
+class FakePool:
+    def __init__(self, platform: FakePlatform):
+        self.platform = platform
+        self.patches: list[tuple[str, dict]] = []
+
+    async def request(self, method, url, json=None, headers=None, **kwargs):
+        if method == "PATCH":
+            self.patches.append((headers["x-api-key"], json))
+            return Fetched(url, 200, {}, b"{}")
+        page = int(url.rsplit("=", 1)[1])
+        return Fetched(url, 200, {}, self.platform.page(page).encode())
+
+
+def test_bloom_filter_has_no_false_negatives_and_few_false_positives():
+    listed = BloomFilter(10_000)
+    for i in range(10_000):
+        listed.add(f"ad-{i}")
+    assert all(f"ad-{i}" in listed for i in range(10_000))
+    false_positives = sum(f"other-{i}" in listed for i in range(10_000))
+    assert false_positives < 30  # 0.1% target
+    assert listed.count == 10_000
+
+
+def test_missing_ads_are_confirmed_over_sweeps_in_a_row():
+    tracker = MissingAds(sqlite3.connect(":memory:"), platform="fake", confirm=2)
+    assert tracker.record({"a", "b"}) == []
+    # "b" came back, so its count starts over
+    assert sorted(tracker.record({"a"})) == ["a"]
+    # Now "a" is back and "b" missing again
+    assert tracker.record({"b"}) == []
+    assert tracker.record({"a", "b"}) == ["b"]
+    tracker.forget(["a"])
+    assert tracker.record({"a"}) == []
+
+
+def test_missing_ads_are_per_platform():
+    conn = sqlite3.connect(":memory:")
+    first, second = MissingAds(conn, platform="one", confirm=2), MissingAds(conn, platform="two", confirm=2)
+    first.record({"x"})
+    second.record({"y"})
+    assert first.record({"x"}) == ["x"]
+    assert second.last_listed() is None
+    second.set_listed(5)
+    assert (first.last_listed(), second.last_listed()) == (None, 5)
+
+
+def test_filter_is_sized_for_the_whole_listing_not_the_capacity_hint():
+    platform = FakePlatform([f"https://fake/ad/{i}" for i in range(800)])
+    listed = asyncio.run(read_listing_ids(FakePool(platform), platform, capacity=20))
+    assert listed.count == 800
+    assert listed.capacity >= 800
+    assert sum(f"https://fake/gone/{i}" in listed for i in range(1000)) < 10
+
+
+def sweep_twice(platform: FakePlatform, published: list[str]) -> tuple[FakePool, list[list[str]]]:
+    conn = sqlite3.connect(":memory:")
+    store = PublishedStore(conn)
+    for external_id in published:
+        store.mark(external_id, "digest", platform="fake")
+    pool = FakePool(platform)
+    results = []
+    for _ in range(2):
+        try:
+            results.append(asyncio.run(sweep(platform, pool, conn)))
+        except SweepError:
+            results.append(None)
+    return pool, results
+
+
+def test_sweep_removes_published_ads_gone_from_a_long_listing():
+    # Mostly ads we never published: the listing is 40 times what we have
+    ads = [f"https://fake/ad/{i}" for i in range(800)]
+    published = ads[:20] + ["https://fake/sold/1", "https://fake/sold/2"]
+    pool, results = sweep_twice(FakePlatform(ads), published)
+    assert results == [[], ["https://fake/sold/1", "https://fake/sold/2"]]
+    assert pool.patches == [
+        ("secret", {"platform": "fake", "externalIds": results[1], "status": "removed"}),
+    ]
+
+
+def test_sweep_without_a_pager_refuses_an_overfull_filter_once():
+    ads = [f"https://fake/ad/{i}" for i in range(800)]
+    published = ads[:20] + ["https://fake/sold/1"]
+    pool, results = sweep_twice(FakePlatform(ads, pager=False), published)
+    # The first sweep only learns how long the listing is; the second is sized from it
+    assert results == [None, []]
+    assert not pool.patches
+
+
+def test_sweep_refuses_a_listing_that_shrank():
+    conn = sqlite3.connect(":memory:")
+    PublishedStore(conn).mark("https://fake/ad/1", "digest", platform="fake")
+    MissingAds(conn, platform="fake").set_listed(1000)
+    platform = FakePlatform([f"https://fake/ad/{i}" for i in range(100)])
+    with pytest.raises(SweepError, match="down from 1000"):
+        asyncio.run(sweep(platform, FakePool(platform), conn))
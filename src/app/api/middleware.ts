@@ -14,7 +14,13 @@ export const internalAuth: () => Middleware = () => async (ctx, _, next) => {
 
 export const parseBody: <T extends z.ZodTypeAny>(schema: T) => Middleware =
   (schema) => async (ctx, _, next) => {
-    const response = await ctx.req.json();
+    // Scrapers send large batches gzipped
+    const response =
+      ctx.req.headers.get("content-encoding") === "gzip" && ctx.req.body
+        ? await new Response(
+            ctx.req.body.pipeThrough(new DecompressionStream("gzip")),
+          ).json()
+        : await ctx.req.json();
     const body = schema.safeParse(response);
 
     if (!body.success) {
@@ -1,5 +1,6 @@
+import { createHash } from "node:crypto";
 import { PutObjectCommand } from "@aws-sdk/client-s3";
-import { and, eq, inArray } from "drizzle-orm";
+import { and, eq, inArray, like } from "drizzle-orm";
 import { NextResponse } from "next/server";
 import { isPresent } from "ts-is-present";
 import { v4 as uuidv4 } from "uuid";
@@ -15,7 +16,13 @@ import {
 import { takeFirst, takeFirstOrNull } from "~/server/db/utils";
 import { s3 } from "~/server/s3";
 import { syncListings } from "~/server/typesense/listings";
-import { parseBody, request } from "../../middleware";
+import { internalAuth, parseBody, request } from "../../middleware";
+
+// Slug of the scraper that found the listing, e.g. "gunpost"
+const externalPlatformSchema = z
+  .string()
+  .max(64)
+  .regex(/^[a-z0-9-]+$/);
 
 const externalListingUpsertSchema = z.object({
   subCategoryId: z.string().refine((id) => CATEGORY[id] != null, {
@@ -30,21 +37,52 @@ const externalListingUpsertSchema = z.object({
     .default("active"),
   createdAt: z.string().optional(),
 
-  external: z.object({
-    platform: z.literal("gunpost"),
-    externalId: z.string(),
-    url: z.string().max(2048).optional(),
-    meta: z.record(z.string(), z.any()).optional(),
-    imageUrls: z.array(z.url()).min(1).optional(),
-    postalCode: z.string().optional(),
-    sellerUsername: z.string().optional(),
-    sellerRating: z.number().optional(),
-    sellerReviews: z.number().optional(),
-  }),
+  external: z
+    .object({
+      platform: externalPlatformSchema,
+      externalId: z.string(),
+      url: z.string().max(2048).optional(),
+      meta: z.record(z.string(), z.any()).optional(),
+      imageUrls: z.array(z.url()).min(1).optional(),
+      // SHA-256 of each image in imageUrls, so known images aren't downloaded again
+      imageHashes: z
+        .array(z.string().regex(/^[0-9a-f]{64}$/))
+        .optional(),
+      postalCode: z.string().optional(),
+      // Coordinates the scraper resolved from the postal code or city
+      location: z
+        .object({
+          latitude: z.number().min(-90).max(90),
+          longitude: z.number().min(-180).max(180),
+          city: z.string().max(255),
+          province: z.string().max(64),
+          provinceCode: z.string().length(2),
+        })
+        .optional(),
+      sellerUsername: z.string().optional(),
+      sellerRating: z.number().optional(),
+      sellerReviews: z.number().optional(),
+    })
+    .refine(
+      (external) =>
+        !external.imageHashes ||
+        external.imageHashes.length === external.imageUrls?.length,
+      {
+        message: "imageHashes must have one hash per image URL",
+        path: ["imageHashes"],
+      },
+    ),
 });
 
 const externalListingUpsertPayload = z.array(externalListingUpsertSchema);
 
+// Batched status change for listings that vanished from (or came back to) their platform
+const externalListingStatusPayload = z.object({
+  platform: externalPlatformSchema,
+  externalIds: z.array(z.string()).min(1).max(5000),
+  status: z.enum(["active", "sold", "archived", "removed"]),
+});
+
 // Helper function to download image from URL
 async function downloadImage(
   url: string,
@@ -101,10 +139,28 @@ async function uploadImageToS3(
   }
 }
 
+// Helper function to find an already uploaded image with the same bytes.
+// Only images this route downloaded and hashed itself are candidates, and only
+// authenticated scrapers can claim a hash, so a claim can't pull in an object
+// that was never checked.
+async function findImageByHash(
+  sha256: string,
+  db: typeof import("~/server/db").db,
+) {
+  return await db.query.listingImage.findFirst({
+    where: and(
+      eq(listingImage.sha256, sha256),
+      eq(listingImage.status, "uploaded"),
+      like(listingImage.name, "url:%"),
+    ),
+  });
+}
+
 // Helper function to process images from URLs
 async function processImages(
   externalUrl: string | undefined,
   imageUrls: string[],
+  imageHashes: string[] | undefined,
   listingId: string,
   db: typeof import("~/server/db").db,
 ): Promise<Array<typeof listingImage.$inferSelect>> {
@@ -122,6 +178,9 @@ async function processImages(
       .filter((name) => name?.startsWith("url:"))
       .map((name) => (name as string).substring(4)), // Remove "url:" prefix
   );
+  const existingHashes = new Set(
+    existingImages.map((img) => img.sha256).filter(isPresent),
+  );
 
   let currentSortOrder = existingImages.length; // Start from the next available sort order
 
@@ -131,17 +190,45 @@ async function processImages(
       console.log(`Skipping duplicate image URL: ${imageUrl}`);
       continue;
     }
+    // Same photo under a new URL, e.g. a reposted ad
+    const claimedHash = imageHashes?.[index];
+    if (claimedHash && existingHashes.has(claimedHash)) {
+      console.log(`Skipping duplicate image: ${imageUrl}`);
+      continue;
+    }
 
     try {
-      // Download the image
-      const { buffer, contentType } = await downloadImage(imageUrl);
-
-      // Generate unique ID and object key
       const imageId = uuidv4();
-      const objectKey = `${env.NODE_ENV}/raw/${imageId}`;
-
-      // Upload to S3
-      await uploadImageToS3(buffer, contentType, objectKey);
+      let objectKey: string;
+      let sha256: string;
+
+      // Reuse the object of an identical image another listing already has
+      const known = claimedHash
+        ? await findImageByHash(claimedHash, db)
+        : undefined;
+      if (known?.sha256) {
+        objectKey = known.objectKey;
+        sha256 = known.sha256;
+      } else {
+        // Download the image
+        const { buffer, contentType } = await downloadImage(imageUrl);
+        sha256 = createHash("sha256").update(buffer).digest("hex");
+
+        const uploaded =
+          sha256 !== claimedHash
+            ? await findImageByHash(sha256, db)
+            : undefined;
+        if (uploaded) {
+          objectKey = uploaded.objectKey;
+        } else {
+          objectKey = `${env.NODE_ENV}/raw/${imageId}`;
+          await uploadImageToS3(buffer, contentType, objectKey);
+        }
+      }
+      if (existingHashes.has(sha256)) {
+        console.log(`Skipping duplicate image: ${imageUrl}`);
+        continue;
+      }
 
       // Create database record with URL in alt field for duplicate detection
       const imageRecord = await db
@@ -150,6 +237,7 @@ async function processImages(
           id: imageId,
           listingId: listingId,
           objectKey: objectKey,
+          sha256: sha256,
           name: `url:${imageUrl}`, // Store URL for duplicate detection
           sortOrder: currentSortOrder,
           status: "uploaded",
@@ -160,6 +248,7 @@ async function processImages(
       if (imageRecord) {
         imageRecords.push(imageRecord);
         existingUrls.add(imageUrl); // Add to set to avoid processing again in this batch
+        existingHashes.add(sha256);
         currentSortOrder++; // Increment for next image
       }
     } catch (error) {
@@ -185,6 +274,12 @@ type UpsertResult = {
 };
 type DatabaseContext = typeof import("~/server/db").db;
 
+// Resolved locations are kept in meta, where syncListings looks for them
+function externalMeta(item: ListingUpsertItem) {
+  const { meta, location } = item.external;
+  return location ? { ...meta, location } : meta;
+}
+
 // Helper function to find existing external listing
 async function findExistingExternal(
   item: ListingUpsertItem,
@@ -236,7 +331,8 @@ async function updateExistingListing(
     .update(listingExternal)
     .set({
       url: item.external.url,
-      meta: item.external.meta,
+      meta: externalMeta(item),
+      postalCode: item.external.postalCode,
       lastSyncedAt: new Date(),
     })
     .where(eq(listingExternal.id, existingExternal.id))
@@ -253,6 +349,7 @@ async function updateExistingListing(
       ? await processImages(
           item.external.url,
           item.external.imageUrls,
+          item.external.imageHashes,
           updatedListing.id,
           db,
         )
@@ -303,6 +400,7 @@ async function createNewListing(
     .values({
       listingId: newListing.id,
       ...item.external,
+      meta: externalMeta(item),
       sellerRating: item.external.sellerRating?.toString(),
       lastSyncedAt: new Date(),
     })
@@ -315,6 +413,7 @@ async function createNewListing(
       ? await processImages(
           item.external.url,
           item.external.imageUrls,
+          item.external.imageHashes,
           newListing.id,
           db,
         )
@@ -370,6 +469,7 @@ async function processListingItem(
 }
 
 export const POST = request()
+  .use(internalAuth())
   .use(parseBody(externalListingUpsertPayload))
   .handle<{
     body: z.infer<typeof externalListingUpsertPayload>;
@@ -393,3 +493,41 @@ export const POST = request()
       processed: upsertResults.length,
     });
   });
+
+export const PATCH = request()
+  .use(internalAuth())
+  .use(parseBody(externalListingStatusPayload))
+  .handle<{
+    body: z.infer<typeof externalListingStatusPayload>;
+  }>(async (ctx) => {
+    const { platform, externalIds, status } = ctx.body;
+
+    const externals = await ctx.db
+      .select({
+        listingId: listingExternal.listingId,
+        externalId: listingExternal.externalId,
+      })
+      .from(listingExternal)
+      .where(
+        and(
+          eq(listingExternal.platform, platform),
+          inArray(listingExternal.externalId, externalIds),
+        ),
+      );
+
+    const ids = externals.map((external) => external.listingId);
+    if (ids.length > 0) {
+      await ctx.db
+        .update(listing)
+        .set({ status, updatedAt: new Date() })
+        .where(inArray(listing.id, ids));
+      await syncListings(inArray(schema.listing.id, ids));
+    }
+
+    const found = new Set(externals.map((external) => external.externalId));
+    return NextResponse.json({
+      success: true,
+      updated: ids.length,
+      missing: externalIds.filter((id) => !found.has(id)),
+    });
+  });
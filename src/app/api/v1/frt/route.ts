@@ -3,7 +3,7 @@ import { NextResponse } from "next/server";
 import { z } from "zod/v4";
 import { typesense } from "~/server/typesense/client";
 import type { FRTV1 } from "~/server/typesense/schemas";
-import { parseBody, request } from "../../middleware";
+import { internalAuth, parseBody, request } from "../../middleware";
 
 const frtV1 = z
   .object({
@@ -20,7 +20,10 @@ const frtV1 = z
   })
   .array();
 
+type FrtImportResult = { frn: string; success: boolean; error?: string };
+
 export const POST = request()
+  .use(internalAuth())
   .use(parseBody(frtV1))
   .handle<{
     body: z.infer<typeof frtV1>;
@@ -28,11 +31,17 @@ export const POST = request()
     const collection = typesense.collections("frt_v1");
 
     const docs: FRTV1[] = [];
+    const results: FrtImportResult[] = [];
     for (const item of ctx.body) {
       const country = findOne("countryCode", item.country_code);
 
       if (country == null && item.country_code !== "Unknown") {
         console.error(`Country not found for ${item.country_code}`);
+        results.push({
+          frn: item.frn,
+          success: false,
+          error: `Country not found for ${item.country_code}`,
+        });
         continue;
       }
 
@@ -46,11 +55,52 @@ export const POST = request()
       });
     }
 
-    const inserted = await collection.documents().import(docs, {
-      action: "emplace",
-    });
+    let imported: { success: boolean; error?: string }[];
+    try {
+      imported = await collection.documents().import(docs, {
+        action: "emplace",
+      });
+    } catch (error) {
+      // Typesense throws if any document failed, with every document's result attached
+      if (!(error instanceof Error && "importResults" in error)) throw error;
+      imported = error.importResults as typeof imported;
+    }
+    for (const [index, doc] of docs.entries()) {
+      const result = imported[index];
+      results.push({
+        frn: doc.frn,
+        success: result?.success ?? false,
+        error: result?.success ? undefined : (result?.error ?? "Not imported"),
+      });
+    }
+
+    // One result per FRN sent, so the caller knows exactly which ones gunex has
+    return NextResponse.json({ results });
+  });
+
+const frtV1Removal = z.object({
+  frns: z.array(z.string().regex(/^\d+$/)).min(1).max(50000),
+});
+
+export const DELETE = request()
+  .use(internalAuth())
+  .use(parseBody(frtV1Removal))
+  .handle<{
+    body: z.infer<typeof frtV1Removal>;
+  }>(async (ctx) => {
+    const collection = typesense.collections("frt_v1");
+
+    // FRNs that left the FRT between editions, deleted by ID in batches of 500
+    let deleted = 0;
+    for (let i = 0; i < ctx.body.frns.length; i += 500) {
+      const frns = ctx.body.frns.slice(i, i + 500);
+      const result = await collection.documents().delete({
+        filter_by: `id:[${frns.join(",")}]`,
+      });
+      deleted += result.num_deleted;
+    }
 
-    return NextResponse.json(inserted);
+    return NextResponse.json({ deleted });
   });
 
 export const GET = request().handle(async (ctx) => {
@@ -136,6 +136,8 @@ export const listingImage = pgTable(
       .notNull()
       .references(() => listing.id, { onDelete: "cascade" }),
     objectKey: varchar("object_key", { length: 255 }).notNull(),
+    // SHA-256 of the image bytes; listings sharing a photo share its object
+    sha256: varchar("sha256", { length: 64 }),
     name: text("name"),
     alt: varchar("alt", { length: 255 }),
     sortOrder: integer("sort_order").default(0).notNull(),
@@ -144,7 +146,10 @@ export const listingImage = pgTable(
       .notNull(),
     status: listingImageStatusEnum("status").notNull(),
   },
-  (table) => [index("listing_images_listing_id_idx").on(table.listingId)],
+  (table) => [
+    index("listing_images_listing_id_idx").on(table.listingId),
+    index("listing_images_sha256_idx").on(table.sha256),
+  ],
 );
 
 // Cross-post/external references
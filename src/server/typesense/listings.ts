@@ -2,12 +2,25 @@ import { snakeCase } from "change-case";
 import type { SQL } from "drizzle-orm";
 import { convert } from "html-to-text";
 import { CATEGORY } from "~/lib/categories";
-import { findPostalCode } from "~/lib/location/postal-codes";
+import {
+  findPostalCode,
+  type PostalCodeEntry,
+} from "~/lib/location/postal-codes";
 import { db } from "../db";
 import { listing } from "../db/schema";
 import { typesense } from "./client";
 import type { ListingV1 } from "./schemas";
 
+type ResolvedLocation = Pick<
+  PostalCodeEntry,
+  "latitude" | "longitude" | "city" | "province"
+>;
+
+// Location a scraper already resolved for an external listing, if any
+function externalLocation(meta: unknown): ResolvedLocation | undefined {
+  return (meta as { location?: ResolvedLocation } | null)?.location;
+}
+
 export async function syncListings(where?: SQL<unknown>) {
   const listings = await db.query.listing.findMany({
     where,
@@ -26,7 +39,8 @@ export async function syncListings(where?: SQL<unknown>) {
   for (const listing of listings) {
     const pc = listing.seller?.postalCode ?? listing.external?.postalCode;
     if (!pc) continue;
-    const location = findPostalCode(pc);
+    const location =
+      externalLocation(listing.external?.meta) ?? findPostalCode(pc);
     if (!location || location.latitude === null || location.longitude === null)
       continue;
 